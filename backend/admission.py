@@ -0,0 +1,161 @@
+"""
+Admission control for style transfer requests
+
+Each request asks the controller for a decision before it runs:
+
+- ``accept``: run at full quality
+- ``degrade``: run below full quality (``quality.py`` picks the level); the
+  queue is building up or the recent p95 latency is above the SLO
+- ``shed``: reject with 503 and ``Retry-After``; the queue is full or
+  latency is far beyond the SLO
+
+Queue depth is the number of admitted requests still in flight. Latency
+is the handler time of requests that finished within the last
+``ADMISSION_WINDOW_SECONDS``. One request is always admitted when nothing
+is in flight, so a latency spike expires from the window and the worker
+recovers. Readiness is reported as not ready while new requests would be
+shed.
+
+Settings (environment):
+
+- ``ADMISSION_LATENCY_SLO_MS``: p95 latency target (default 5000)
+- ``ADMISSION_SHED_FACTOR``: shed above this multiple of the SLO (default 2)
+- ``ADMISSION_DEGRADE_QUEUE``: degrade at this many requests in flight (default 4)
+- ``ADMISSION_MAX_QUEUE``: shed at this many requests in flight (default 8)
+- ``ADMISSION_WINDOW_SECONDS``: latency window (default 30)
+- ``ADMISSION_MIN_SAMPLES``: latencies needed before they count (default 5)
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from metrics import registry
+
+
+ACCEPT = 'accept'
+DEGRADE = 'degrade'
+SHED = 'shed'
+
+ADMISSION_DECISIONS = registry.counter(
+    'style_transfer_admission_total', 'Admission decisions for style transfer requests',
+    ('decision',))
+QUEUE_DEPTH = registry.gauge(
+    'style_transfer_admitted_in_flight', 'Admitted style transfer requests in flight')
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AdmissionController:
+    """Accept, degrade or shed requests from queue depth and recent latency"""
+
+    def __init__(self, latency_slo: float, shed_factor: float = 2.0, degrade_queue: int = 4,
+                 max_queue: int = 8, window: float = 30.0, min_samples: int = 5):
+        self.latency_slo = latency_slo
+        self.shed_factor = shed_factor
+        self.degrade_queue = degrade_queue
+        self.max_queue = max_queue
+        self.window = window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._latencies: Deque[Tuple[float, float]] = deque()
+        self._decisions = {ACCEPT: 0, DEGRADE: 0, SHED: 0}
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _expire(self, now: float):
+        while self._latencies and self._latencies[0][0] < now - self.window:
+            self._latencies.popleft()
+
+    def _p95(self, now: float) -> Optional[float]:
+        self._expire(now)
+        if len(self._latencies) < self.min_samples:
+            return None
+        return _percentile([latency for _, latency in self._latencies], 0.95)
+
+    def _decide(self, now: float) -> Tuple[str, List[str]]:
+        reasons = []
+        p95 = self._p95(now)
+        if self._in_flight >= self.max_queue:
+            reasons.append(f"queue depth {self._in_flight} >= {self.max_queue}")
+        if p95 is not None and p95 > self.latency_slo * self.shed_factor and self._in_flight:
+            reasons.append(f"p95 latency {p95:.2f}s > {self.shed_factor:g}x SLO")
+        if reasons:
+            return SHED, reasons
+        if self._in_flight >= self.degrade_queue:
+            reasons.append(f"queue depth {self._in_flight} >= {self.degrade_queue}")
+        if p95 is not None and p95 > self.latency_slo:
+            reasons.append(f"p95 latency {p95:.2f}s > SLO {self.latency_slo:.2f}s")
+        return (DEGRADE if reasons else ACCEPT), reasons
+
+    def admit(self) -> str:
+        """Decide for a new request; unless it is shed it counts as in flight until ``release``"""
+        with self._lock:
+            decision, _ = self._decide(time.monotonic())
+            self._decisions[decision] += 1
+            if decision != SHED:
+                self._in_flight += 1
+                QUEUE_DEPTH.set(self._in_flight)
+        ADMISSION_DECISIONS.inc(decision=decision)
+        return decision
+
+    def release(self, seconds: Optional[float] = None):
+        """An admitted request finished; ``seconds`` is its latency (None if it failed early)"""
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            QUEUE_DEPTH.set(self._in_flight)
+            if seconds is not None:
+                self._latencies.append((now, seconds))
+                self._expire(now)
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait: roughly the time to drain the queue"""
+        with self._lock:
+            p95 = self._p95(time.monotonic()) or self.latency_slo
+            return max(1, int(p95 * max(self._in_flight, 1) / max(self.max_queue, 1)) + 1)
+
+    def readiness(self) -> Tuple[bool, List[str]]:
+        """Not ready while new requests would be shed"""
+        with self._lock:
+            decision, reasons = self._decide(time.monotonic())
+        return decision != SHED, reasons
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            decision, reasons = self._decide(now)
+            p95 = self._p95(now)
+            return {
+                'in_flight': self._in_flight,
+                'latency_p95_seconds': None if p95 is None else round(p95, 3),
+                'latency_samples': len(self._latencies),
+                'latency_slo_seconds': self.latency_slo,
+                'degrade_queue': self.degrade_queue,
+                'max_queue': self.max_queue,
+                'next_decision': decision,
+                'reasons': reasons,
+                'decisions': dict(self._decisions),
+            }
+
+
+def create_admission_controller() -> AdmissionController:
+    return AdmissionController(
+        latency_slo=float(os.getenv("ADMISSION_LATENCY_SLO_MS", "5000")) / 1000.0,
+        shed_factor=float(os.getenv("ADMISSION_SHED_FACTOR", "2")),
+        degrade_queue=int(os.getenv("ADMISSION_DEGRADE_QUEUE", "4")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "8")),
+        window=float(os.getenv("ADMISSION_WINDOW_SECONDS", "30")),
+        min_samples=int(os.getenv("ADMISSION_MIN_SAMPLES", "5")),
+    )
+
+
+admission = create_admission_controller()
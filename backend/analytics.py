@@ -0,0 +1,158 @@
+"""
+Buffered analytics writer for the AI Style Transfer Studio
+"""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database import db
+
+
+# (user_id, action, details, ip_address, user_agent, created_at)
+AnalyticsEvent = Tuple[Optional[int], str, Optional[Dict[str, Any]], Optional[str], Optional[str], str]
+
+
+class AnalyticsBuffer:
+    """Accumulates analytics events in memory and writes them in batches.
+
+    Events are queued by request handlers without touching the database.
+    A background thread drains the queue and hands each batch to
+    ``write_batch`` once ``batch_size`` events are pending or
+    ``flush_interval`` seconds have passed. When the queue is full new
+    events are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, write_batch: Callable[[List[tuple]], None],
+                 max_queue_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 2.0):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[AnalyticsEvent]" = queue.Queue(maxsize=max_queue_size)
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._atexit_registered = False
+        self._stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'last_flush_seconds': 0.0,
+        }
+
+    def record(self, user_id: Optional[int], action: str, details: Dict[str, Any] = None,
+               ip_address: str = None, user_agent: str = None) -> bool:
+        """Queue an event for the next flush. Returns False if it was dropped."""
+        self.start()
+        created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            self._queue.put_nowait((user_id, action, details, ip_address, user_agent, created_at))
+        except queue.Full:
+            self._stats['dropped'] += 1
+            return False
+        self._stats['enqueued'] += 1
+        return True
+
+    def start(self):
+        """Start the background flusher if it is not already running"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="analytics-flusher", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def close(self, timeout: float = 5.0):
+        """Stop the flusher and write out everything still queued"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        """Drain the queue synchronously; returns the number of events written"""
+        written = 0
+        while True:
+            batch = self._drain(self.batch_size)
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['pending'] = self.pending()
+        stats['running'] = self._thread is not None
+        return stats
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            timeout = deadline - time.monotonic()
+            if self.pending() < self.batch_size and timeout > 0:
+                self._stop.wait(min(timeout, 0.1))
+                continue
+            batch = self._drain(self.batch_size)
+            if batch:
+                self._write(batch)
+            deadline = time.monotonic() + self.flush_interval
+
+    def _drain(self, limit: int) -> List[AnalyticsEvent]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[AnalyticsEvent]) -> int:
+        rows = [
+            (user_id, action, json.dumps(details or {}), ip_address, user_agent, created_at)
+            for user_id, action, details, ip_address, user_agent, created_at in batch
+        ]
+        started = time.perf_counter()
+        with self._flush_lock:
+            try:
+                self.write_batch(rows)
+            except Exception as e:
+                self._stats['failed'] += len(rows)
+                print(f"Failed to write {len(rows)} analytics events: {e}")
+                return 0
+        self._stats['last_flush_seconds'] = time.perf_counter() - started
+        self._stats['batches'] += 1
+        self._stats['written'] += len(rows)
+        return len(rows)
+
+
+def create_analytics_buffer(write_batch: Callable[[List[tuple]], None]) -> AnalyticsBuffer:
+    """Build a buffer configured from the ANALYTICS_* environment variables"""
+    return AnalyticsBuffer(
+        write_batch,
+        max_queue_size=int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000")),
+        batch_size=int(os.getenv("ANALYTICS_BATCH_SIZE", "500")),
+        flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2.0")),
+    )
+
+
+# Global analytics buffer
+analytics = create_analytics_buffer(db.log_user_actions)
@@ -1,32 +1,79 @@
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, Request
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import torch
-from model import StyleTransferModel
+from fastapi.concurrency import run_in_threadpool
+from startup import startup, warmup_enabled
 from utils import load_image, tensor_to_image, validate_image, resize_for_processing
 from PIL import Image
 import io
 import os
+import threading
 import time
 import uuid
 from datetime import datetime
-from auth import auth_router, oauth2_scheme, get_current_active_user, User
-from database import db
-from image_processor import AdvancedImageProcessor, create_style_preview_grid
+from auth import auth_router, init_db, oauth2_scheme, get_current_active_user, get_current_admin_user, is_premium_user, User
+from database import db, HISTORY_COLUMNS, GALLERY_COLUMNS, GALLERY_ITEM_COLUMNS
+from analytics import analytics
+from hashing import password_hasher
+from image_processor import AdvancedImageProcessor, create_style_preview_grid, palette_to_hex
+from http_cache import cached_json_response, cached_response, etag_matches
+from blobstore import blob_store, BlobNotFound, content_key, derived_key, parse_range
+from derivatives import create_derivative_generator
+from encoding import result_encoder, negotiate_format, EXTENSIONS, MEDIA_TYPES, PRESETS
+from presets import preset_catalog
+from janitor import temp_storage
+from profiling import request_profiler, profile_thread
+from runtime import configure_runtime, runtime_settings
+from admission import admission, DEGRADE, SHED
+from quality import quality_controller
+from ratelimit import rate_limiter
+from scheduler import inference_scheduler, INTERACTIVE, BATCH
+from jobqueue import create_job_queue, JobWorker, PermanentJobError
+from serving import memory_report
+from metrics import registry, resolution_bucket, StageTimer, STAGE_SECONDS, REQUEST_SECONDS, REQUESTS_TOTAL, IN_FLIGHT
+from pagination import decode_cursor, select_columns
 from typing import List, Optional
+from contextlib import asynccontextmanager, nullcontext
 
 
-app = FastAPI(title="AI Style Transfer Studio", description="Real-time neural style transfer API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with startup.phase('database'):
+        db.init_database()
+    with startup.phase('default_user'):
+        init_db()
+    analytics.start()
+    temp_storage.start()
+    startup.mark('serving')
+    # torch and the models load in the background; /api/v1/ready reports when they are done
+    startup.start_warmup(warmup_steps() if warmup_enabled() else [])
+    with startup.phase('job_queue'):
+        job_queue.init()
+    # Jobs are also consumed by separate `python worker.py` processes; JOB_WORKERS=0 leaves them to those
+    job_worker = None
+    if JOB_WORKERS > 0:
+        job_worker = JobWorker(job_queue, JOB_HANDLERS, run_job=run_on_inference_thread,
+                               retention=JOB_RETENTION, cleanup=delete_job_inputs)
+        job_worker.start(JOB_WORKERS)
+    app.state.job_worker = job_worker
+    yield
+    if job_worker is not None:
+        job_worker.stop(timeout=30)
+    job_queue.close()
+    # Flush buffered analytics and preset usage before the process exits
+    analytics.close()
+    preset_catalog.close()
+    temp_storage.close()
 
-# Ensure upload directories exist
-os.makedirs("/tmp/uploads", exist_ok=True)
-os.makedirs("/tmp/results", exist_ok=True)
-os.makedirs("/tmp/styles", exist_ok=True)
+app = FastAPI(title="AI Style Transfer Studio", description="Real-time neural style transfer API", lifespan=lifespan)
 
 # Initialize image processor
 image_processor = AdvancedImageProcessor()
 
+# Background generator for gallery/history-sized copies of results
+derivatives = create_derivative_generator(blob_store, image_processor)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -41,15 +88,239 @@ app.include_router(auth_router)
 
 
 models = {}
+_models_lock = threading.Lock()
+
+# STYLE_MODEL_STUB=1 swaps in a weightless stand-in model (offline load tests);
+# STYLE_MODEL_STUB_DELAY_MS simulates its per-image inference time
+STYLE_MODEL_STUB = os.getenv("STYLE_MODEL_STUB", "").lower() in ("1", "true", "yes")
+STYLE_MODEL_STUB_DELAY = float(os.getenv("STYLE_MODEL_STUB_DELAY_MS", "0")) / 1000.0
+
+# Model types requests may ask for; anything else is rejected before it reaches metrics labels
+MODEL_TYPES = ('adain', 'cartoon')
+
+# Models loaded by the startup warm-up (the pre-fork server loads the same list)
+PRELOAD_MODELS = [m for m in os.getenv("PRELOAD_MODELS", "adain,cartoon").split(",") if m]
+# Input sizes each preloaded model runs once during warm-up, so the first real
+# requests at those sizes do not pay for lazy allocations and kernel selection
+WARMUP_SIZES = [int(s) for s in os.getenv("WARMUP_SIZES", "").split(",") if s] or \
+    [level.size for level in quality_controller.levels]
+# Most images one batch request may carry (MAX_BATCH_FILES). A batch costs one rate limit
+# token per image, so the cap never exceeds RATE_LIMIT_BURST: a larger batch could never be paid for
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "20"))
+if rate_limiter.enabled:
+    MAX_BATCH_FILES = min(MAX_BATCH_FILES, int(rate_limiter.burst))
 
 def get_model(model_type: str = 'adain'):
     if model_type not in models:
-        m = StyleTransferModel(model_type)
-        m.eval()
-        models[model_type] = m
+        # Held while loading so a request never builds a model the warm-up is already loading
+        with _models_lock:
+            if model_type not in models:
+                from model import StyleTransferModel, StubStyleTransferModel
+                if STYLE_MODEL_STUB:
+                    m = StubStyleTransferModel(STYLE_MODEL_STUB_DELAY)
+                else:
+                    m = StyleTransferModel(model_type)
+                m.eval()
+                models[model_type] = m
     return models[model_type]
 
+def configure_worker_runtime():
+    # Size this worker's PyTorch thread pools (and optional CPU pinning) before any model runs;
+    # the pre-fork server has already configured its workers with their slot numbers
+    if not runtime_settings.configured:
+        print(f"Runtime settings: {configure_runtime()}")
+
+def warm_model(model_type: str):
+    import torch
+    model = get_model(model_type)
+    for size in WARMUP_SIZES:
+        dummy = torch.zeros(1, 3, size, size)
+        level = next((l for l in quality_controller.levels if l.size == size), quality_controller.full)
+        stylize(model, dummy, dummy, precision=level.precision)
+
+def warmup_steps():
+    steps = [('runtime', configure_worker_runtime)]
+    steps += [(f"model_{model_type}", lambda model_type=model_type: warm_model(model_type))
+              for model_type in PRELOAD_MODELS]
+    steps.append(('preset_palettes', lambda: preset_catalog.fill_palettes(preset_image_palette)))
+    return steps
+
+def check_model_type(model_type: str):
+    if model_type not in MODEL_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported model type: {model_type}")
+
+def check_batch_size(count: int):
+    if count > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413,
+                            detail=f"Batch of {count} images exceeds the limit of {MAX_BATCH_FILES}")
+
+def enforce_rate_limit(tenant: str, cost: float = 1.0):
+    limit = rate_limiter.check(tenant, cost)
+    if not limit.allowed:
+        detail = "Rate limit exceeded" if limit.retry_after is not None else \
+            f"Request needs {cost:g} tokens, more than the limit of {limit.limit:g}"
+        raise HTTPException(status_code=429, detail=detail, headers=limit.headers())
+    return limit
+
+def stylize(model, content_tensor, style_tensor, timer=None, precision='fp32'):
+    import torch
+    with torch.no_grad(), torch.autocast('cpu', dtype=torch.bfloat16, enabled=precision == 'bf16'):
+        output = model(content_tensor, style_tensor, timer=timer)
+    return output.float()
+
+def transfer_images(model_type, content_image, style_image, level, timer=None):
+    """Run the model on two prepared images; returns the result and the model time
+
+    ``timer`` is an optional ``StageTimer.stage``. Call from an inference thread.
+    """
+    stage = timer or (lambda name: nullcontext())
+    with stage('to_tensor'):
+        content_tensor = load_image(content_image, level.size)
+        style_tensor = load_image(style_image, level.size)
+    # The first call may still be waiting for the warm-up
+    model = get_model(model_type)
+    
+    inference_start = time.perf_counter()
+    output_tensor = stylize(model, content_tensor, style_tensor, timer=timer, precision=level.precision)
+    inference_time = time.perf_counter() - inference_start
+    
+    with stage('to_image'):
+        return tensor_to_image(output_tensor), inference_time
+
+def postprocess_result(content_image, result_image, preserve_content, artistic_filter):
+    # Apply content preservation if requested
+    if preserve_content > 0:
+        result_image = image_processor.enhance_content_preservation(
+            content_image, result_image, preserve_content
+        )
+    
+    # Apply artistic filter if requested
+    if artistic_filter != 'none':
+        result_image = image_processor.apply_artistic_filters(result_image, artistic_filter)
+    return result_image
+
+def store_job_input(data: bytes) -> str:
+    """Put a validated upload in the blob store, keyed by the format PIL detects; returns the key
+
+    The client's Content-Type is not trusted; formats the store does not
+    keep (GIF, BMP, TIFF, ...) are converted to PNG. Inputs get an ``_input``
+    key suffix, so purging them never touches a result with the same bytes.
+    """
+    image = Image.open(io.BytesIO(data))
+    media_type = Image.MIME.get(image.format)
+    if media_type not in MEDIA_TYPES.values():
+        buffer = io.BytesIO()
+        image.convert('RGB').save(buffer, 'PNG')
+        data, media_type = buffer.getvalue(), MEDIA_TYPES['png']
+    key = derived_key(content_key(data, media_type), 'input')
+    if not blob_store.exists(key):
+        blob_store.put_key(key, data, media_type)
+    return key
+
+def delete_job_inputs(keys):
+    for key in keys:
+        try:
+            blob_store.delete(key)
+        except BlobNotFound:
+            pass
+
+def result_palette(result_image, result_key):
+    """Dominant colors of a stored result, for its history row"""
+    return palette_to_hex(image_processor.cached_dominant_colors(result_image, result_key))
+
+def preset_image_palette(path: str):
+    """Palette of a preset's own style image (set by admins or seed data), None if it is missing"""
+    try:
+        if path.startswith("/api/v1/results/"):
+            image = Image.open(io.BytesIO(blob_store.get(path.rsplit('/', 1)[1])))
+        else:
+            image = Image.open(path)
+    except (OSError, BlobNotFound):
+        return None
+    return palette_to_hex(image_processor.extract_dominant_colors(image))
+
+def load_job_image(key: str, name: str) -> Image.Image:
+    try:
+        data = blob_store.get(key)
+    except BlobNotFound:
+        raise PermanentJobError(f"{name} image {key} is missing from the blob store")
+    valid, msg = validate_image(io.BytesIO(data))
+    if not valid:
+        raise PermanentJobError(f"{name} image: {msg}")
+    return Image.open(io.BytesIO(data)).convert('RGB')
+
+def run_transfer_job(payload: dict) -> dict:
+    """Handler for queued ``style_transfer`` jobs (in the API process or in worker.py)
+
+    Inputs are read from and the result written to the blob store, so any node can run it.
+    Jobs run at full quality; nobody is waiting on them interactively.
+    """
+    start_time = time.time()
+    level = quality_controller.full
+    content_image = resize_for_processing(load_job_image(payload['content_key'], 'Content'), level.max_size)
+    style_image = resize_for_processing(load_job_image(payload['style_key'], 'Style'), level.max_size)
+    
+    result_image, _ = transfer_images(payload['model_type'], content_image, style_image, level)
+    result_image = postprocess_result(content_image, result_image,
+                                      payload['preserve_content'], payload['artistic_filter'])
+    
+    output_format = payload['output_format']
+    result_bytes = result_encoder.encode(result_image, output_format, payload['encode_preset'], payload['progressive'])
+    media_type = MEDIA_TYPES[output_format]
+    result_blob = blob_store.put(result_bytes, media_type)
+    result_path = f"/api/v1/results/{result_blob.key}"
+    derivatives.schedule(result_blob.key)
+    color_palette = result_palette(result_image, result_blob.key)
+    
+    processing_time = time.time() - start_time
+    # No input paths: the inputs are purged after JOB_RETENTION, the history row outlives them
+    transfer_id = db.save_transfer_history(
+        user_id=payload['user_id'],
+        session_id=payload['session_id'],
+        content_path=None,
+        style_path=None,
+        result_path=result_path,
+        model_type=payload['model_type'],
+        style_strength=payload['style_strength'],
+        processing_time=processing_time,
+        result_key=result_blob.key,
+        color_palette=color_palette
+    )
+    if payload.get('preset_id') is not None:
+        preset_catalog.record_usage(payload['preset_id'])
+    analytics.record(
+        user_id=payload['user_id'],
+        action='style_transfer',
+        details={
+            'model_type': payload['model_type'],
+            'style_strength': payload['style_strength'],
+            'preserve_content': payload['preserve_content'],
+            'artistic_filter': payload['artistic_filter'],
+            'output_format': output_format,
+            'processing_time': processing_time,
+            'queued': True
+        }
+    )
+    return {
+        'result_key': result_blob.key,
+        'result_url': result_path,
+        'media_type': media_type,
+        'transfer_id': transfer_id,
+        'processing_time': processing_time,
+        'color_palette': color_palette,
+    }
+
+JOB_HANDLERS = {'style_transfer': run_transfer_job}
 
+# Shared with worker processes through JOB_QUEUE_URL; in-process consumer threads (0 disables)
+job_queue = create_job_queue()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+# Finished jobs (and inputs no other job uses) are purged after this long, like temp uploads
+JOB_RETENTION = float(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+
+def run_on_inference_thread(job, call):
+    # Queued jobs share the inference threads with requests, at batch priority
+    return inference_scheduler.submit(job.tenant or 'jobs', BATCH, call).result()
 
 
 from fastapi import Query
@@ -63,81 +334,130 @@ async def style_transfer(
     style_strength: float = Query(1.0, ge=0.0, le=2.0, description="Style strength"),
     preserve_content: float = Query(0.0, ge=0.0, le=1.0, description="Content preservation"),
     artistic_filter: str = Query('none', description="Additional artistic filter"),
+    preset_id: Optional[int] = Query(None, description="Style preset the style image came from"),
+    output_format: Optional[str] = Query(None, description="Output format: jpeg, webp, avif or png (default: preference/Accept)"),
+    encode_preset: str = Query('fast', description="Encoding preset: 'fast' or 'small'"),
+    progressive: bool = Query(False, description="Progressive JPEG"),
+    server_timing: bool = Query(False, description="Return per-stage timings in a Server-Timing header"),
+    adaptive_quality: bool = Query(True, description="Allow lower resolution under load (premium users may opt out)"),
     current_user: User = Depends(get_current_active_user)
 ):
+    check_model_type(model_type)
+    if encode_preset not in PRESETS:
+        raise HTTPException(status_code=400, detail="Unsupported encoding preset")
+    try:
+        limit = enforce_rate_limit(f"user:{current_user.id}")
+    except HTTPException:
+        REQUESTS_TOTAL.inc(model_type=model_type, status='rate_limited')
+        raise
+    timer = StageTimer()
+    if output_format is None:
+        with timer.stage('preferences'):
+            preferred = db.get_user_preferences(current_user.id).get('preferred_output_format')
+    else:
+        preferred = None
+    try:
+        output_format = negotiate_format(output_format, preferred, request.headers.get('accept'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    decision = admission.admit()
+    if decision == SHED:
+        REQUESTS_TOTAL.inc(model_type=model_type, status='shed')
+        raise HTTPException(status_code=503, detail="Server overloaded, retry later",
+                            headers={'Retry-After': str(admission.retry_after())})
+    # Resolution/precision for this request; lower under load unless a premium user opts out
+    level = quality_controller.choose(admission.in_flight, degrade=decision == DEGRADE,
+                                      opt_out=not adaptive_quality and is_premium_user(current_user))
+    
+    resolution = 'unknown'
+    status = 'error'
+    profile = request_profiler.begin(f"style_transfer-{model_type}")
+    IN_FLIGHT.inc()
     try:
         start_time = time.time()
         
-        # Validate images
-        content_data = await content.read()
-        style_data = await style.read()
+        with timer.stage('read'):
+            content_data = await content.read()
+            style_data = await style.read()
         
-        valid, msg = validate_image(io.BytesIO(content_data))
-        if not valid:
-            raise HTTPException(status_code=400, detail=f"Content image: {msg}")
-            
-        valid, msg = validate_image(io.BytesIO(style_data))
-        if not valid:
-            raise HTTPException(status_code=400, detail=f"Style image: {msg}")
+        # Validate images
+        with timer.stage('validate'):
+            valid, msg = validate_image(io.BytesIO(content_data))
+            if not valid:
+                raise HTTPException(status_code=400, detail=f"Content image: {msg}")
+                
+            valid, msg = validate_image(io.BytesIO(style_data))
+            if not valid:
+                raise HTTPException(status_code=400, detail=f"Style image: {msg}")
         
         # Process images
-        content_image = Image.open(io.BytesIO(content_data)).convert('RGB')
-        style_image = Image.open(io.BytesIO(style_data)).convert('RGB')
+        with timer.stage('decode'):
+            content_image = Image.open(io.BytesIO(content_data)).convert('RGB')
+            style_image = Image.open(io.BytesIO(style_data)).convert('RGB')
         
         # Resize for processing
-        content_image = resize_for_processing(content_image)
-        style_image = resize_for_processing(style_image)
+        with timer.stage('resize'):
+            content_image = resize_for_processing(content_image, level.max_size)
+            style_image = resize_for_processing(style_image, level.max_size)
+        resolution = resolution_bucket(content_image.size)
         
         # Generate unique session ID
         session_id = str(uuid.uuid4())
         
-        # Save input images
-        content_path = f"/tmp/uploads/content_{session_id}.jpg"
-        style_path = f"/tmp/uploads/style_{session_id}.jpg"
-        content_image.save(content_path)
-        style_image.save(style_path)
-        
-        # Perform style transfer
-        content_tensor = load_image(content_image)
-        style_tensor = load_image(style_image)
-        model = get_model(model_type)
+        # Save input images (expired by the temp storage janitor)
+        with timer.stage('save_inputs'):
+            content_path = temp_storage.write('uploads', content_image.save, f"content_{session_id}.jpg")
+            style_path = temp_storage.write('uploads', style_image.save, f"style_{session_id}.jpg")
         
-        with torch.no_grad():
-            output_tensor = model(content_tensor, style_tensor)
+        # Perform style transfer on an inference thread, in turn with other tenants' work
+        def infer():
+            timer.add('queue', time.perf_counter() - queued)
+            with profile_thread(profile):
+                return transfer_images(model_type, content_image, style_image, level, timer.stage)
         
-        result_image = tensor_to_image(output_tensor)
+        queued = time.perf_counter()
+        result_image, inference_time = await inference_scheduler.run(f"user:{current_user.id}", INTERACTIVE, infer)
         
-        # Apply content preservation if requested
-        if preserve_content > 0:
-            result_image = image_processor.enhance_content_preservation(
-                content_image, result_image, preserve_content
-            )
+        with timer.stage('postprocess'):
+            result_image = postprocess_result(content_image, result_image, preserve_content, artistic_filter)
         
-        # Apply artistic filter if requested
-        if artistic_filter != 'none':
-            result_image = image_processor.apply_artistic_filters(result_image, artistic_filter)
+        # Encode and save the result to the blob store (content-addressed, shared across workers)
+        with timer.stage('encode'):
+            result_bytes = result_encoder.encode(result_image, output_format, encode_preset, progressive)
+        media_type = MEDIA_TYPES[output_format]
+        with timer.stage('store'):
+            result_blob = blob_store.put(result_bytes, media_type)
+        result_path = f"/api/v1/results/{result_blob.key}"
+        derivatives.schedule(result_blob.key)
         
-        # Save result
-        result_path = f"/tmp/results/result_{session_id}.jpg"
-        result_image.save(result_path, quality=95)
+        # Palettes are cached by content hash, so repeated images cost nothing
+        with timer.stage('palette'):
+            color_palette = result_palette(result_image, result_blob.key)
         
         processing_time = time.time() - start_time
         
         # Save to database
-        user_id = getattr(current_user, 'id', 1)  # Default for demo
-        transfer_id = db.save_transfer_history(
-            user_id=user_id,
-            session_id=session_id,
-            content_path=content_path,
-            style_path=style_path,
-            result_path=result_path,
-            model_type=model_type,
-            style_strength=style_strength,
-            processing_time=processing_time
-        )
+        user_id = current_user.id
+        with timer.stage('db'):
+            transfer_id = db.save_transfer_history(
+                user_id=user_id,
+                session_id=session_id,
+                content_path=content_path,
+                style_path=style_path,
+                result_path=result_path,
+                model_type=model_type,
+                style_strength=style_strength,
+                processing_time=processing_time,
+                result_key=result_blob.key,
+                color_palette=color_palette
+            )
+        
+        if preset_id is not None:
+            preset_catalog.record_usage(preset_id)
         
-        # Log analytics
-        db.log_user_action(
+        # Log analytics (buffered, written in batches off the request path)
+        analytics.record(
             user_id=user_id,
             action='style_transfer',
             details={
@@ -145,30 +465,209 @@ async def style_transfer(
                 'style_strength': style_strength,
                 'preserve_content': preserve_content,
                 'artistic_filter': artistic_filter,
+                'output_format': output_format,
                 'processing_time': processing_time
             },
             ip_address=request.client.host if request.client else None
         )
         
-        return FileResponse(
-            result_path, 
-            media_type='image/jpeg', 
-            filename='styled_image.jpg',
-            headers={
-                'X-Transfer-ID': str(transfer_id),
-                'X-Processing-Time': str(processing_time)
-            }
-        )
+        headers = {
+            'Content-Disposition': f'attachment; filename="styled_image.{EXTENSIONS[output_format]}"',
+            'ETag': result_blob.etag,
+            'Vary': 'Accept',
+            'X-Transfer-ID': str(transfer_id),
+            'X-Processing-Time': str(processing_time),
+            'X-Encode-Time': f"{timer.stages['encode']:.4f}",
+            'X-Result-Key': result_blob.key,
+            'X-Admission': decision,
+            'X-Quality-Level': level.name,
+            'X-Processing-Resolution': str(level.size),
+            'X-Processing-Precision': level.precision,
+            **limit.headers()
+        }
+        if server_timing:
+            headers['Server-Timing'] = timer.server_timing()
+        status = 'ok'
+        return Response(content=result_bytes, media_type=media_type, headers=headers)
         
+    except HTTPException as e:
+        status = 'rejected' if e.status_code < 500 else 'error'
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if profile is not None:
+            profile.finish()
+        IN_FLIGHT.dec()
+        admission.release(timer.elapsed if status == 'ok' else None)
+        if status == 'ok':
+            quality_controller.record(level, inference_time)
+        REQUESTS_TOTAL.inc(model_type=model_type, status=status)
+        if status == 'ok':
+            timer.observe(STAGE_SECONDS, model_type=model_type, resolution=resolution)
+            REQUEST_SECONDS.observe(timer.elapsed, model_type=model_type, resolution=resolution)
+
+
+@app.post("/api/v1/jobs/style-transfer", status_code=202)
+async def enqueue_style_transfer(
+    request: Request,
+    content: UploadFile = File(...),
+    style: UploadFile = File(...),
+    model_type: str = Query('adain', description="Model type: 'adain' or 'cartoon'"),
+    style_strength: float = Query(1.0, ge=0.0, le=2.0, description="Style strength"),
+    preserve_content: float = Query(0.0, ge=0.0, le=1.0, description="Content preservation"),
+    artistic_filter: str = Query('none', description="Additional artistic filter"),
+    preset_id: Optional[int] = Query(None, description="Style preset the style image came from"),
+    output_format: Optional[str] = Query(None, description="Output format: jpeg, webp, avif or png (default: preference/Accept)"),
+    encode_preset: str = Query('fast', description="Encoding preset: 'fast' or 'small'"),
+    progressive: bool = Query(False, description="Progressive JPEG"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Queue a style transfer for a worker; poll the returned status URL for the result"""
+    check_model_type(model_type)
+    if encode_preset not in PRESETS:
+        raise HTTPException(status_code=400, detail="Unsupported encoding preset")
+    limit = enforce_rate_limit(f"user:{current_user.id}")
+    if output_format is None:
+        preferred = db.get_user_preferences(current_user.id).get('preferred_output_format')
+    else:
+        preferred = None
+    try:
+        output_format = negotiate_format(output_format, preferred, request.headers.get('accept'))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    content_data = await content.read()
+    style_data = await style.read()
+    valid, msg = validate_image(io.BytesIO(content_data))
+    if not valid:
+        raise HTTPException(status_code=400, detail=f"Content image: {msg}")
+    valid, msg = validate_image(io.BytesIO(style_data))
+    if not valid:
+        raise HTTPException(status_code=400, detail=f"Style image: {msg}")
+    
+    # Workers on other nodes read the inputs from the blob store
+    content_input = store_job_input(content_data)
+    style_input = store_job_input(style_data)
+    job = job_queue.enqueue('style_transfer', {
+        'user_id': current_user.id,
+        'session_id': str(uuid.uuid4()),
+        'content_key': content_input,
+        'style_key': style_input,
+        'input_keys': [content_input, style_input],
+        'model_type': model_type,
+        'style_strength': style_strength,
+        'preserve_content': preserve_content,
+        'artistic_filter': artistic_filter,
+        'preset_id': preset_id,
+        'output_format': output_format,
+        'encode_preset': encode_preset,
+        'progressive': progressive,
+    }, tenant=f"user:{current_user.id}")
+    status_url = f"/api/v1/jobs/{job.id}"
+    return JSONResponse(status_code=202, content={**job.to_dict(), 'status_url': status_url},
+                        headers={'Location': status_url, **limit.headers()})
+
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """Status of a queued job; ``result.result_url`` points at the result once it succeeded"""
+    job = job_queue.get(job_id)
+    if job is None or job.payload.get('user_id') != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+def blob_response(request: Request, key: str) -> Response:
+    """Serve a blob with ETag revalidation and single-range support"""
+    try:
+        info = blob_store.stat(key)
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Result not found")
+    
+    headers = {
+        'ETag': info.etag,
+        'Accept-Ranges': 'bytes',
+        # Keys are content hashes, so a URL's bytes never change
+        'Cache-Control': 'public, max-age=31536000, immutable',
+    }
+    if etag_matches(request.headers.get('if-none-match'), info.etag):
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = None
+    if_range = request.headers.get('if-range')
+    if if_range is None or if_range == info.etag:
+        try:
+            byte_range = parse_range(request.headers.get('range'), info.size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, 'Content-Range': f'bytes */{info.size}'})
+    
+    if byte_range is not None:
+        start, end = byte_range
+        headers['Content-Range'] = f'bytes {start}-{end}/{info.size}'
+        return Response(content=blob_store.get_range(key, start, end), status_code=206,
+                        media_type=info.content_type, headers=headers)
+    
+    path = blob_store.local_path(key)
+    if path is not None:
+        # FileResponse streams from disk (zero-copy where the server supports it)
+        return FileResponse(path, media_type=info.content_type, headers=headers)
+    return Response(content=blob_store.get(key), media_type=info.content_type, headers=headers)
+
+@app.get("/api/v1/results/{key}")
+async def get_result(key: str, request: Request):
+    """Download a stored result (supports Range and If-None-Match)"""
+    return blob_response(request, key)
+
+@app.get("/api/v1/results/{key}/thumbnail")
+async def get_result_thumbnail(
+    key: str,
+    request: Request,
+    width: int = Query(320, ge=1, le=2048, description="Width of the tile the image is shown in")
+):
+    """Best-fit derivative of a stored result for the requested width and Accept header"""
+    try:
+        blob_store.stat(key)
+        # A derivative not generated yet is decoded, resized and encoded here; keep that off the event loop
+        derivative, _ = await run_in_threadpool(derivatives.best_fit, key, width, request.headers.get('accept'))
+    except BlobNotFound:
+        raise HTTPException(status_code=404, detail="Result not found")
+    response = blob_response(request, derivative.key)
+    # The format depends on what the client accepts
+    response.headers['Vary'] = 'Accept'
+    return response
 
 
 @app.get("/api/v1/presets")
-async def get_style_presets():
-    """Get available style presets from database"""
-    presets = db.get_style_presets()
-    return {"presets": presets}
+async def get_style_presets(request: Request):
+    """Get available style presets (served from the in-memory snapshot)"""
+    body, etag = preset_catalog.snapshot()
+    return cached_response(
+        request, body, etag=etag,
+        cache_control="public, max-age=60, stale-while-revalidate=300"
+    )
+
+def parse_listing_args(cursor: Optional[str], fields: Optional[str], allowed):
+    """Decode the cursor and field projection of a listing request"""
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        columns = select_columns(fields.split(',') if fields else None, list(allowed))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return after, columns
+
+@app.get("/api/v1/history")
+async def list_user_history(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get a page of the user's style transfer history (keyset paginated)"""
+    user_id = current_user.id
+    after, columns = parse_listing_args(cursor, fields, HISTORY_COLUMNS)
+    page = db.get_user_history_page(user_id, limit, after, columns)
+    return cached_json_response(request, {"history": page['items'], "next_cursor": page['next_cursor']})
 
 @app.post("/api/v1/history")
 async def get_user_history(
@@ -176,7 +675,7 @@ async def get_user_history(
     current_user: User = Depends(get_current_active_user)
 ):
     """Get user's style transfer history"""
-    user_id = getattr(current_user, 'id', 1)
+    user_id = current_user.id
     history = db.get_user_history(user_id, limit)
     return {"history": history}
 
@@ -186,7 +685,7 @@ async def save_preferences(
     current_user: User = Depends(get_current_active_user)
 ):
     """Save user preferences"""
-    user_id = getattr(current_user, 'id', 1)
+    user_id = current_user.id
     db.save_user_preferences(user_id, preferences)
     return {"message": "Preferences saved successfully"}
 
@@ -195,7 +694,7 @@ async def get_preferences(
     current_user: User = Depends(get_current_active_user)
 ):
     """Get user preferences"""
-    user_id = getattr(current_user, 'id', 1)
+    user_id = current_user.id
     preferences = db.get_user_preferences(user_id)
     return preferences
 
@@ -207,18 +706,41 @@ async def create_gallery(
     current_user: User = Depends(get_current_active_user)
 ):
     """Create a new gallery"""
-    user_id = getattr(current_user, 'id', 1)
+    user_id = current_user.id
     gallery_id = db.create_gallery(user_id, name, description, is_public)
     return {"gallery_id": gallery_id, "message": "Gallery created successfully"}
 
 @app.get("/api/v1/galleries")
 async def get_user_galleries(
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get user's galleries"""
-    user_id = getattr(current_user, 'id', 1)
-    galleries = db.get_user_galleries(user_id)
-    return {"galleries": galleries}
+    """Get a page of the user's galleries"""
+    user_id = current_user.id
+    after, columns = parse_listing_args(cursor, fields, GALLERY_COLUMNS)
+    page = db.get_user_galleries_page(user_id, limit, after, columns)
+    return cached_json_response(request, {"galleries": page['items'], "next_cursor": page['next_cursor']})
+
+@app.get("/api/v1/galleries/{gallery_id}/items")
+async def get_gallery_items(
+    gallery_id: int,
+    request: Request,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Get a page of items in a gallery owned by the user or marked public"""
+    user_id = current_user.id
+    gallery = db.get_gallery(gallery_id)
+    if gallery is None or (gallery['user_id'] != user_id and not gallery['is_public']):
+        raise HTTPException(status_code=404, detail="Gallery not found")
+    after, columns = parse_listing_args(cursor, fields, GALLERY_ITEM_COLUMNS)
+    page = db.get_gallery_items_page(gallery_id, limit, after, columns)
+    return cached_json_response(request, {"items": page['items'], "next_cursor": page['next_cursor']})
 
 @app.post("/api/v1/style-preview")
 async def create_style_preview(
@@ -232,8 +754,7 @@ async def create_style_preview(
         
         preview_grid = create_style_preview_grid(content_image, styles)
         
-        result_path = f"/tmp/preview_{uuid.uuid4().hex}.jpg"
-        preview_grid.save(result_path)
+        result_path = temp_storage.write('previews', preview_grid.save)
         
         return FileResponse(result_path, media_type='image/jpeg', filename='style_preview.jpg')
         
@@ -251,37 +772,58 @@ async def get_analytics_summary():
     """Get analytics summary (admin endpoint)"""
     # In production, add admin authentication
     summary = db.get_analytics_summary()
+    summary['analytics_buffer'] = analytics.stats()
     return summary
 
 @app.post("/api/v1/style-transfer-batch")
 async def style_transfer_batch(
+    request: Request,
     files: list[UploadFile] = File(...),
     style: UploadFile = File(...),
     model_type: str = Query('adain', description="Model type: 'adain' or 'cartoon'")
 ):
     """Process multiple images with the same style"""
+    check_model_type(model_type)
+    check_batch_size(len(files))
+    # No authentication here, so the client address is the tenant
+    tenant = f"ip:{request.client.host if request.client else 'unknown'}"
+    enforce_rate_limit(tenant, len(files))
+    decision = admission.admit()
+    if decision == SHED:
+        raise HTTPException(status_code=503, detail="Server overloaded, retry later",
+                            headers={'Retry-After': str(admission.retry_after())})
+    level = quality_controller.choose(admission.in_flight, degrade=decision == DEGRADE)
+    start_time = time.time()
+    completed = False
+    inference_times = []
     try:
         style_image = Image.open(io.BytesIO(await style.read())).convert('RGB')
-        style_tensor = load_image(style_image)
-        model = get_model(model_type)
+        style_image = resize_for_processing(style_image, level.max_size)
         
         results = []
         for i, content_file in enumerate(files):
             content_image = Image.open(io.BytesIO(await content_file.read())).convert('RGB')
-            content_tensor = load_image(content_image)
-            
-            with torch.no_grad():
-                output_tensor = model(content_tensor, style_tensor)
-            
-            result_image = tensor_to_image(output_tensor)
-            result_path = f"/tmp/batch_result_{i}.jpg"
-            result_image.save(result_path)
+            content_image = resize_for_processing(content_image, level.max_size)
+            # One job per image at batch priority, so interactive requests get in between
+            result_image, inference_time = await inference_scheduler.run(
+                tenant, BATCH, lambda: transfer_images(model_type, content_image, style_image, level))
+            inference_times.append(inference_time)
+            result_path = temp_storage.write('batch', result_image.save)
             results.append(result_path)
         
+        completed = True
         # In a real implementation, return a zip file or individual file links
-        return {"message": f"Processed {len(files)} images", "results": results}
+        return {"message": f"Processed {len(files)} images", "results": results,
+                "admission": decision, "quality_level": level.name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Per-image latency, comparable with single style transfer requests
+        per_image = (time.time() - start_time) / max(len(files), 1) if completed else None
+        admission.release(per_image)
+        # Model time only, like the interactive path; uploads and queue wait would inflate the estimate
+        for inference_time in inference_times:
+            quality_controller.record(level, inference_time)
 
 @app.post("/api/v1/text-to-image")
 async def text_to_image(request: dict):
@@ -325,17 +867,115 @@ async def text_to_image(request: dict):
                 x, y = i*30, i*20
                 draw.ellipse([x, y, x+20, y+20], outline=(255, 255, 0), width=3)
         
-        result_path = "/tmp/text_to_image_result.jpg"
-        img.save(result_path)
+        result_path = temp_storage.write('generated', img.save)
         return FileResponse(result_path, media_type='image/jpeg', filename='generated_image.jpg')
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/v1/admin/profiling")
+async def start_profiling(
+    requests: int = Query(1, ge=1, le=100, description="Number of style transfer requests to profile"),
+    torch_profiler: bool = Query(True, description="Record torch.profiler operator traces"),
+    sampling_interval_ms: float = Query(5.0, ge=0.0, le=1000.0, description="Python stack sampling interval (0 disables)"),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Profile the next N style transfer requests"""
+    try:
+        return request_profiler.arm(requests, torch_profiler, sampling_interval_ms / 1000.0 or None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/api/v1/admin/profiling")
+async def stop_profiling(current_user: User = Depends(get_current_admin_user)):
+    """Cancel profiling of requests that have not started yet"""
+    return request_profiler.disarm()
+
+@app.get("/api/v1/admin/profiling")
+async def get_profiling_status(current_user: User = Depends(get_current_admin_user)):
+    """Profiler status and the artifacts written so far"""
+    return {**request_profiler.status(), 'artifacts': request_profiler.artifacts()}
+
+@app.get("/api/v1/admin/profiling/artifacts/{name}")
+async def get_profiling_artifact(name: str, current_user: User = Depends(get_current_admin_user)):
+    """Download a Chrome trace, operator table or folded-stack file"""
+    path = request_profiler.artifact_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    media_type = 'application/json' if name.endswith('.json') else 'text/plain'
+    return FileResponse(path, media_type=media_type, filename=name)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(content=registry.render(), media_type=registry.content_type)
+
+@app.get("/api/v1/live")
+async def liveness_check():
+    """Liveness: the process is up and its event loop responds"""
+    return {"status": "alive"}
+
+def readiness() -> dict:
+    report = startup.report()
+    accepting, reasons = admission.readiness()
+    if report['state'] == 'failed':
+        reasons = [f"warm-up failed: {report['error']}"] + reasons
+    elif not report['ready']:
+        reasons = ["warming up"] + reasons
+    return {
+        "ready": report['ready'] and accepting,
+        "reasons": reasons,
+        "startup": report,
+        "admission": admission.stats(),
+        "quality": quality_controller.stats(),
+        "scheduler": inference_scheduler.stats(),
+    }
+
+def job_stats() -> dict:
+    worker = getattr(app.state, 'job_worker', None)
+    try:
+        queue = job_queue.stats()
+    except Exception as e:
+        queue = {'error': str(e)}
+    return {'queue': queue, 'worker': worker.stats() if worker is not None else None}
+
 @app.get("/api/v1/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    """Health check endpoint (detailed status; use /live and /ready for probes)"""
+    state = readiness()
+    if state['startup']['state'] == 'failed':
+        status = "unhealthy"
+    elif not state['startup']['ready']:
+        status = "starting"
+    else:
+        status = "healthy" if state['ready'] else "overloaded"
+    return {
+        "status": status,
+        "timestamp": datetime.now().isoformat(),
+        "readiness": state,
+        "password_hashing": password_hasher.stats(),
+        "derivatives": derivatives.stats(),
+        "encoding": result_encoder.stats(),
+        "temp_storage": temp_storage.stats(),
+        "jobs": job_stats(),
+        "rate_limit": rate_limiter.stats(),
+        "runtime": runtime_settings.report(),
+        "model_memory": memory_report(models)
+    }
+
+@app.get("/api/v1/ready")
+async def readiness_check():
+    """Readiness: 503 while models warm up or while new requests would be shed"""
+    state = readiness()
+    return JSONResponse(status_code=200 if state['ready'] else 503, content=state)
+
+@app.get("/api/v1/storage/usage")
+async def get_storage_usage():
+    """Temporary file usage and garbage collection counters"""
+    # In production, add admin authentication
+    return temp_storage.stats()
+
+startup.mark('app_imported')
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,66 +1,49 @@
 from fastapi import APIRouter, HTTPException, Depends, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from pydantic import BaseModel, EmailStr
 from datetime import datetime, timedelta
 import secrets
-import sqlite3
 import os
+import time
+
+from cache import TTLCache
+from database import db
+from hashing import pwd_context, password_hasher, HashingOverloaded
 
 # Secret key for JWT (in production, use environment variable)
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Verified token -> user cache. Entries are short-lived and dropped explicitly
+# when a user is deactivated or changes password; other workers drop theirs
+# when the entry expires, so AUTH_CACHE_TTL bounds how long a revoked token
+# keeps working anywhere.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+# Build the user straight from signed token claims when they are present.
+# Every cache miss still checks the user's revocation time in the shared
+# database, so deactivations and password changes reach all workers.
+AUTH_TRUST_TOKEN_CLAIMS = os.getenv("AUTH_TRUST_TOKEN_CLAIMS", "true").lower() in ("1", "true", "yes")
+
+# Usernames or emails allowed to use admin endpoints (comma separated)
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
+# Usernames or emails on the premium plan (comma separated); admins count as premium
+PREMIUM_USERS = {name.strip() for name in os.getenv("PREMIUM_USERS", "").split(",") if name.strip()}
+
+_token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/token")
 
-# Database initialization
+# Database initialization (called from the app's lifespan hook, not on import:
+# hashing the default password takes a noticeable part of a second)
 def init_db():
-    os.makedirs("data", exist_ok=True)
-    conn = sqlite3.connect("data/users.db")
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            username TEXT UNIQUE NOT NULL,
-            full_name TEXT,
-            hashed_password TEXT NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP
-        )
-    """)
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS user_sessions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            session_token TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            expires_at TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    """)
-    
-    # Create default test user if not exists
-    cursor.execute("SELECT * FROM users WHERE email = ?", ("test@example.com",))
-    if not cursor.fetchone():
+    """Create the default test user in the shared user store if it is missing"""
+    if db.get_user_by_login("test@example.com") is None:
         hashed_password = pwd_context.hash("testpassword")
-        cursor.execute("""
-            INSERT INTO users (email, username, full_name, hashed_password)
-            VALUES (?, ?, ?, ?)
-        """, ("test@example.com", "test@example.com", "Test User", hashed_password))
-    
-    conn.commit()
-    conn.close()
-
-# Initialize database on import
-init_db()
+        db.create_user("test@example.com", "test@example.com", "Test User", hashed_password)
 
 class Token(BaseModel):
     access_token: str
@@ -70,6 +53,7 @@ class TokenData(BaseModel):
     username: str | None = None
 
 class User(BaseModel):
+    id: int | None = None
     username: str
     email: str | None = None
     full_name: str | None = None
@@ -100,23 +84,9 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 def get_user(username: str) -> UserInDB | None:
-    conn = sqlite3.connect("data/users.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT email, username, full_name, hashed_password, is_active FROM users WHERE username = ? OR email = ?",
-        (username, username)
-    )
-    user_data = cursor.fetchone()
-    conn.close()
-    
+    user_data = db.get_user_by_login(username)
     if user_data:
-        return UserInDB(
-            email=user_data[0],
-            username=user_data[1],
-            full_name=user_data[2],
-            hashed_password=user_data[3],
-            is_active=bool(user_data[4])
-        )
+        return UserInDB(**user_data)
     return None
 
 def authenticate_user(username: str, password: str) -> UserInDB | bool:
@@ -125,49 +95,85 @@ def authenticate_user(username: str, password: str) -> UserInDB | bool:
         return False
     return user
 
+async def authenticate_user_async(username: str, password: str) -> UserInDB | bool:
+    """Like authenticate_user, but verifies on the hashing pool and upgrades stale hashes"""
+    user = get_user(username)
+    if not user:
+        return False
+    valid, new_hash = await password_hasher.verify(password, user.hashed_password)
+    if not valid:
+        return False
+    if new_hash is not None:
+        # Stored hash used a different cost factor; replace it transparently
+        set_password_hash(user.username, new_hash, invalidate=False)
+    return user
+
+def hashing_unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Authentication is busy, please retry",
+        headers={"Retry-After": "1"},
+    )
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "iat": time.time()})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def create_user(user_data: UserCreate) -> UserResponse:
-    conn = sqlite3.connect("data/users.db")
-    cursor = conn.cursor()
-    
-    # Check if user already exists
-    cursor.execute("SELECT id FROM users WHERE email = ? OR username = ?", 
-                   (user_data.email, user_data.username))
-    if cursor.fetchone():
-        conn.close()
-        raise HTTPException(
-            status_code=400,
-            detail="Email or username already registered"
-        )
-    
-    hashed_password = get_password_hash(user_data.password)
-    cursor.execute("""
-        INSERT INTO users (email, username, full_name, hashed_password)
-        VALUES (?, ?, ?, ?)
-    """, (user_data.email, user_data.username, user_data.full_name, hashed_password))
-    
-    user_id = cursor.lastrowid
-    cursor.execute("""
-        SELECT id, email, username, full_name, is_active, created_at
-        FROM users WHERE id = ?
-    """, (user_id,))
-    
-    user_row = cursor.fetchone()
-    conn.commit()
-    conn.close()
+def user_claims(user: User) -> dict:
+    """Token claims that let get_current_user skip the database lookup"""
+    return {
+        "sub": user.username,
+        "uid": user.id,
+        "email": user.email,
+        "name": user.full_name,
+        "active": bool(user.is_active),
+    }
+
+def invalidate_user(username: str):
+    """Revoke a user's earlier tokens and forget this worker's cached identities"""
+    db.revoke_tokens(username, time.time())
+    _token_cache.remove_where(lambda token, user: user.username == username)
+
+def _user_from_claims(payload: dict) -> User | None:
+    if not AUTH_TRUST_TOKEN_CLAIMS or "active" not in payload or "uid" not in payload:
+        return None
+    return User(
+        id=payload["uid"],
+        username=payload["sub"],
+        email=payload.get("email"),
+        full_name=payload.get("name"),
+        is_active=payload["active"],
+    )
+
+def deactivate_user(username: str):
+    """Mark a user inactive and drop any cached identity"""
+    db.set_user_active(username, False)
+    invalidate_user(username)
+
+def set_password_hash(username: str, hashed_password: str, invalidate: bool = True):
+    """Replace a user's password hash and (by default) drop any cached identity"""
+    db.set_password_hash(username, hashed_password)
+    if invalidate:
+        invalidate_user(username)
+
+def create_user(user_data: UserCreate, hashed_password: str | None = None) -> UserResponse:
+    if hashed_password is None:
+        hashed_password = get_password_hash(user_data.password)
+    try:
+        user_row = db.create_user(user_data.email, user_data.username,
+                                  user_data.full_name, hashed_password)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     return UserResponse(
-        id=user_row[0],
-        email=user_row[1], 
-        username=user_row[2],
-        full_name=user_row[3],
-        is_active=bool(user_row[4]),
-        created_at=datetime.fromisoformat(user_row[5])
+        id=user_row['id'],
+        email=user_row['email'],
+        username=user_row['username'],
+        full_name=user_row['full_name'],
+        is_active=user_row['is_active'],
+        created_at=datetime.fromisoformat(user_row['created_at'])
     )
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
@@ -176,6 +182,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cached = _token_cache.get(token)
+    if cached is not None:
+        return cached
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -185,9 +195,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     except JWTError:
         raise credentials_exception
     
-    user = get_user(username=token_data.username)
-    if user is None:
+    # Issued before the user's last deactivation or password change. Tokens
+    # without "iat" predate revocation support and stay valid until one happens.
+    valid_after = db.get_tokens_valid_after(token_data.username)
+    if valid_after and payload.get("iat", 0) <= valid_after:
         raise credentials_exception
+    
+    user = _user_from_claims(payload)
+    if user is None:
+        user_in_db = get_user(username=token_data.username)
+        if user_in_db is None:
+            raise credentials_exception
+        user = User(**user_in_db.model_dump(exclude={"hashed_password"}))
+    
+    # Never cache past the token's own expiry
+    ttl = min(AUTH_CACHE_TTL, payload.get("exp", 0) - time.time())
+    if ttl > 0:
+        _token_cache.set(token, user, ttl=ttl)
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -195,16 +219,32 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
+    if current_user.username not in ADMIN_USERS and current_user.email not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+def is_premium_user(user: User) -> bool:
+    members = PREMIUM_USERS | ADMIN_USERS
+    return user.username in members or user.email in members
+
 auth_router = APIRouter()
 
 @auth_router.post("/api/v1/register", response_model=UserResponse)
 async def register(user: UserCreate):
     """Register a new user"""
-    return create_user(user)
+    try:
+        hashed_password = await password_hasher.hash(user.password)
+    except HashingOverloaded:
+        raise hashing_unavailable()
+    return create_user(user, hashed_password=hashed_password)
 
 @auth_router.post("/api/v1/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user_async(form_data.username, form_data.password)
+    except HashingOverloaded:
+        raise hashing_unavailable()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -213,18 +253,11 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=user_claims(user), expires_delta=access_token_expires
     )
     
     # Update last login
-    conn = sqlite3.connect("data/users.db")
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE username = ?",
-        (user.username,)
-    )
-    conn.commit()
-    conn.close()
+    db.update_last_login(user.id)
     
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -232,6 +265,25 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
+class PasswordChange(BaseModel):
+    current_password: str
+    new_password: str
+
+@auth_router.post("/api/v1/users/me/password")
+async def change_password(
+    change: PasswordChange,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Change the current user's password; existing tokens stop using cached identity"""
+    try:
+        if not await authenticate_user_async(current_user.username, change.current_password):
+            raise HTTPException(status_code=400, detail="Incorrect password")
+        hashed_password = await password_hasher.hash(change.new_password)
+    except HashingOverloaded:
+        raise hashing_unavailable()
+    set_password_hash(current_user.username, hashed_password)
+    return {"message": "Password updated successfully"}
+
 @auth_router.post("/api/v1/logout")
 async def logout(current_user: User = Depends(get_current_active_user)):
     # In a real implementation, you might blacklist the token
@@ -0,0 +1,330 @@
+"""
+Benchmarks for the style transfer inference pipeline
+
+Measures ``StyleTransferModel`` forward latency and throughput across
+resolutions, batch sizes, thread counts, model types and precisions, plus
+the pre/post-processing helpers in ``utils.py``. Models use random weights
+(no VGG download), so the suite runs offline on CPU.
+
+Usage:
+    python benchmark.py --output report.json
+    python benchmark.py --quick
+    python benchmark.py --workers 1,2,4 --resolutions 512 --models adain
+    python benchmark.py --compare baseline.json report.json --threshold 0.10
+
+``--workers`` runs N model processes side by side and reports aggregate
+throughput twice: with each worker limited to its share of the cores and
+pinned to them (``runtime.configure_runtime``), and with every worker using
+all cores, which is PyTorch's default and oversubscribes the machine.
+
+The JSON report is keyed so two runs can be diffed; ``--compare`` exits
+non-zero when any case's median latency regressed by more than the threshold.
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+from PIL import Image
+
+from model import StyleTransferModel
+from runtime import available_cpus, configure_runtime
+from utils import load_image, tensor_to_image, validate_image, resize_for_processing
+
+
+PRECISIONS = ('fp32', 'bf16')
+
+
+def _parse_list(text: str, cast: Callable = str) -> List[Any]:
+    return [cast(item) for item in text.split(',') if item.strip()]
+
+
+def summarize(samples: List[float], items: int = 1) -> Dict[str, float]:
+    """Latency statistics in milliseconds plus throughput in items per second"""
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+
+    mean = statistics.fmean(ordered)
+    return {
+        'mean_ms': round(mean * 1000, 3),
+        'p50_ms': round(percentile(0.5) * 1000, 3),
+        'p90_ms': round(percentile(0.9) * 1000, 3),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'stdev_ms': round(statistics.pstdev(ordered) * 1000, 3),
+        'throughput_per_s': round(items / mean, 3) if mean else 0.0,
+    }
+
+
+def measure(fn: Callable[[], Any], warmup: int, repeat: int) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def autocast_for(precision: str):
+    if precision == 'bf16':
+        return torch.autocast('cpu', dtype=torch.bfloat16)
+    return nullcontext()
+
+
+def bench_model(model: torch.nn.Module, model_type: str, resolution: int, batch_size: int,
+                threads: int, precision: str, warmup: int, repeat: int) -> Dict[str, Any]:
+    content = torch.randn(batch_size, 3, resolution, resolution)
+    style = torch.randn(batch_size, 3, resolution, resolution)
+
+    def run():
+        with torch.no_grad(), autocast_for(precision):
+            model(content, style)
+
+    samples = measure(run, warmup, repeat)
+    return {
+        'kind': 'model', 'model_type': model_type, 'resolution': resolution,
+        'batch_size': batch_size, 'threads': threads, 'precision': precision,
+        **summarize(samples, batch_size),
+    }
+
+
+def bench_processing(resolution: int, threads: int, warmup: int, repeat: int) -> List[Dict[str, Any]]:
+    """Pre/post-processing steps from utils.py at one resolution"""
+    image = Image.effect_noise((resolution, resolution), 64).convert('RGB')
+    encoded = io.BytesIO()
+    image.save(encoded, format='JPEG', quality=95)
+    data = encoded.getvalue()
+    tensor = load_image(image, size=resolution)
+
+    cases = {
+        'validate_image': lambda: validate_image(io.BytesIO(data)),
+        'decode': lambda: Image.open(io.BytesIO(data)).convert('RGB'),
+        'resize_for_processing': lambda: resize_for_processing(image, max_size=resolution // 2),
+        'load_image': lambda: load_image(image, size=resolution),
+        'tensor_to_image': lambda: tensor_to_image(tensor),
+    }
+    results = []
+    for name, fn in cases.items():
+        results.append({
+            'kind': 'processing', 'step': name, 'resolution': resolution, 'threads': threads,
+            **summarize(measure(fn, warmup, repeat)),
+        })
+    return results
+
+
+def _worker_process(slot: int, workers: int, partitioned: bool, model_type: str, resolution: int,
+                    warmup: int, duration: float, barrier, results):
+    if partitioned:
+        configure_runtime(workers=workers, affinity='auto', slot=slot)
+    else:
+        configure_runtime(workers=1, threads=len(available_cpus()), affinity='', slot=slot)
+    model = StyleTransferModel(model_type, pretrained=False).eval()
+    content = torch.randn(1, 3, resolution, resolution)
+    style = torch.randn(1, 3, resolution, resolution)
+    with torch.no_grad():
+        for _ in range(warmup):
+            model(content, style)
+        barrier.wait()
+        samples = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            model(content, style)
+            samples.append(time.perf_counter() - start)
+    results.put(samples)
+
+
+def bench_workers(workers: int, partitioned: bool, model_type: str, resolution: int,
+                  warmup: int, duration: float) -> Dict[str, Any]:
+    """Aggregate throughput of ``workers`` processes running the model concurrently"""
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers + 1)
+    results = context.Queue()
+    processes = [context.Process(target=_worker_process,
+                                 args=(slot, workers, partitioned, model_type, resolution,
+                                       warmup, duration, barrier, results))
+                 for slot in range(workers)]
+    for process in processes:
+        process.start()
+    barrier.wait()
+    started = time.perf_counter()
+    samples = [sample for _ in processes for sample in results.get()]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+    summary = summarize(samples, len(samples))
+    summary['throughput_per_s'] = round(len(samples) / elapsed, 3)
+    return {
+        'kind': 'workers', 'mode': 'partitioned' if partitioned else 'oversubscribed',
+        'workers': workers, 'model_type': model_type, 'resolution': resolution,
+        'threads_per_worker': max(1, len(available_cpus()) // workers) if partitioned else len(available_cpus()),
+        **summary,
+    }
+
+
+def case_key(result: Dict[str, Any]) -> str:
+    """Stable identifier of a benchmark case, used to match reports"""
+    if result['kind'] == 'workers':
+        return f"workers/{result['mode']}/{result['model_type']}/r{result['resolution']}/n{result['workers']}"
+    if result['kind'] == 'model':
+        return (f"model/{result['model_type']}/r{result['resolution']}/b{result['batch_size']}"
+                f"/t{result['threads']}/{result['precision']}")
+    return f"processing/{result['step']}/r{result['resolution']}/t{result['threads']}"
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': commit or None,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'default_threads': torch.get_num_threads(),
+    }
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    default_threads = torch.get_num_threads()
+    results = []
+    models = {}
+    if args.workers:
+        for resolution in args.resolutions:
+            for model_type in args.models:
+                for workers in args.workers:
+                    for partitioned in (True, False):
+                        result = bench_workers(workers, partitioned, model_type, resolution,
+                                               args.warmup, args.worker_duration)
+                        results.append(result)
+                        _report(result)
+        for result in results:
+            result['key'] = case_key(result)
+        return {'environment': environment(), 'config': _config(args), 'results': results}
+    try:
+        for threads in args.threads:
+            torch.set_num_threads(threads)
+            for resolution in args.resolutions:
+                if not args.skip_processing:
+                    for result in bench_processing(resolution, threads, args.warmup, args.repeat):
+                        results.append(result)
+                        _report(result)
+                for model_type in args.models:
+                    if model_type not in models:
+                        models[model_type] = StyleTransferModel(model_type, pretrained=False).eval()
+                    for batch_size in args.batch_sizes:
+                        for precision in args.precisions:
+                            result = bench_model(models[model_type], model_type, resolution, batch_size,
+                                                 threads, precision, args.warmup, args.repeat)
+                            results.append(result)
+                            _report(result)
+    finally:
+        torch.set_num_threads(default_threads)
+    for result in results:
+        result['key'] = case_key(result)
+    return {'environment': environment(), 'config': _config(args), 'results': results}
+
+
+def _config(args: argparse.Namespace) -> Dict[str, Any]:
+    return {name: getattr(args, name) for name in
+            ('resolutions', 'batch_sizes', 'threads', 'models', 'precisions', 'warmup', 'repeat', 'workers')}
+
+
+def _report(result: Dict[str, Any]):
+    print(f"{case_key(result):50s} p50 {result['p50_ms']:10.2f} ms  "
+          f"{result['throughput_per_s']:10.2f}/s", flush=True)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> int:
+    """Print median latency changes between two reports; returns the regression count"""
+    before = {r['key']: r for r in baseline['results']}
+    regressions = 0
+    print(f"{'case':50s} {'before':>10s} {'after':>10s} {'change':>8s}")
+    for result in current['results']:
+        old = before.get(result['key'])
+        if old is None:
+            print(f"{result['key']:50s} {'-':>10s} {result['p50_ms']:10.2f}      new")
+            continue
+        change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] if old['p50_ms'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{result['key']:50s} {old['p50_ms']:10.2f} {result['p50_ms']:10.2f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark the style transfer pipeline on CPU")
+    parser.add_argument('--resolutions', type=lambda s: _parse_list(s, int), default=[256, 512, 1024, 2048])
+    parser.add_argument('--batch-sizes', type=lambda s: _parse_list(s, int), default=[1])
+    parser.add_argument('--threads', type=lambda s: _parse_list(s, int), default=[torch.get_num_threads()])
+    parser.add_argument('--models', type=_parse_list, default=['adain', 'cartoon'])
+    parser.add_argument('--precisions', type=_parse_list, default=['fp32'],
+                        help=f"Comma separated: {', '.join(PRECISIONS)}")
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--workers', type=lambda s: _parse_list(s, int),
+                        help="Throughput curve for these worker process counts (partitioned vs oversubscribed)")
+    parser.add_argument('--worker-duration', type=float, default=10.0,
+                        help="Seconds each worker configuration runs (default 10)")
+    parser.add_argument('--skip-processing', action='store_true', help="Only benchmark model forward passes")
+    parser.add_argument('--quick', action='store_true', help="Small smoke run: 256px, adain, 2 repeats")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="Compare two reports instead of running")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Relative p50 slowdown counted as a regression (default 0.10)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+        return 1 if regressions else 0
+
+    unknown = set(args.precisions) - set(PRECISIONS)
+    if unknown:
+        print(f"Unknown precision(s): {', '.join(sorted(unknown))}")
+        return 2
+    if args.quick:
+        args.resolutions, args.models, args.repeat, args.warmup = [256], ['adain'], 2, 1
+    torch.manual_seed(args.seed)
+
+    report = run_suite(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {len(report['results'])} results to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
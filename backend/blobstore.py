@@ -0,0 +1,283 @@
+"""
+Content-addressed blob storage for style transfer results
+
+Blobs are keyed by the SHA-256 of their content plus a file extension
+(``<sha256>.jpg``); derived files (thumbnails) append a suffix to the same
+hash (``<sha256>_w320.webp``). Because keys never change meaning, they double
+as strong ETags and can be cached by clients forever.
+
+Two backends are provided: ``LocalBlobStore`` (sharded directories on disk)
+and ``S3BlobStore`` for any S3-compatible service, including local stand-ins
+such as MinIO via ``S3_ENDPOINT_URL``.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None  # Only needed for the S3 backend
+
+
+KEY_PATTERN = re.compile(r'^[0-9a-f]{64}(_[a-z0-9]+)?\.(jpg|jpeg|png|webp|avif)$')
+
+EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/avif': 'avif',
+}
+
+
+class BlobNotFound(KeyError):
+    """Raised when a key does not exist in the store"""
+
+
+class BlobInfo:
+    """Metadata about a stored blob"""
+
+    def __init__(self, key: str, size: int, content_type: str):
+        self.key = key
+        self.size = size
+        self.content_type = content_type
+
+    @property
+    def etag(self) -> str:
+        # Includes the extension: derivatives of one hash differ only by format
+        return f'"{self.key}"'
+
+
+def validate_key(key: str) -> str:
+    if not KEY_PATTERN.match(key):
+        raise BlobNotFound(key)
+    return key
+
+
+def content_key(data: bytes, content_type: str) -> str:
+    """Key for ``data``; raises ValueError for content types the store does not keep"""
+    if content_type not in EXTENSIONS:
+        raise ValueError(f"Unsupported blob content type: {content_type}")
+    return f"{hashlib.sha256(data).hexdigest()}.{EXTENSIONS[content_type]}"
+
+
+def derived_key(key: str, suffix: str, ext: Optional[str] = None) -> str:
+    """Key for a file derived from ``key`` (e.g. a thumbnail)"""
+    stem, original_ext = key.rsplit('.', 1)
+    stem = stem.split('_', 1)[0]
+    return f"{stem}_{suffix}.{ext or original_ext}"
+
+
+def content_type_for(key: str) -> str:
+    ext = key.rsplit('.', 1)[-1]
+    for content_type, known_ext in EXTENSIONS.items():
+        if ext == known_ext:
+            return content_type
+    return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+
+class BlobStore(ABC):
+    """Interface implemented by every blob backend"""
+
+    def put(self, data: bytes, content_type: str) -> BlobInfo:
+        """Store content under its hash; storing the same bytes twice is a no-op
+
+        Raises ValueError if ``content_type`` has no key extension.
+        """
+        key = content_key(data, content_type)
+        if not self.exists(key):
+            self.put_key(key, data, content_type)
+        return BlobInfo(key, len(data), content_type)
+
+    def get_or_create(self, key: str, build: Callable[[], bytes]) -> BlobInfo:
+        """Return a blob, building and storing it once if it does not exist yet"""
+        validate_key(key)
+        try:
+            return self.stat(key)
+        except BlobNotFound:
+            data = build()
+            self.put_key(key, data, content_type_for(key))
+            return BlobInfo(key, len(data), content_type_for(key))
+
+    @abstractmethod
+    def put_key(self, key: str, data: bytes, content_type: str):
+        """Store data under an explicit key"""
+
+    @abstractmethod
+    def stat(self, key: str) -> BlobInfo:
+        """Metadata for a key; raises BlobNotFound"""
+
+    @abstractmethod
+    def get_range(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Read bytes ``start..end`` inclusive (the whole blob by default)"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove a blob if present"""
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.stat(key)
+            return True
+        except BlobNotFound:
+            return False
+
+    def get(self, key: str) -> bytes:
+        return self.get_range(key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path for zero-copy serving, if the backend has one"""
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs on the local filesystem under ``root/ab/cd/<key>``"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        validate_key(key)
+        return os.path.join(self.root, key[0:2], key[2:4], key)
+
+    def put_key(self, key: str, data: bytes, content_type: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def stat(self, key: str) -> BlobInfo:
+        try:
+            size = os.stat(self._path(key)).st_size
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+        return BlobInfo(key, size, content_type_for(key))
+
+    def get_range(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        try:
+            with open(self._path(key), 'rb') as f:
+                f.seek(start)
+                return f.read() if end is None else f.read(end - start + 1)
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.exists(path) else None
+
+
+class S3BlobStore(BlobStore):
+    """Blobs in an S3-compatible bucket"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, client=None):
+        if client is None:
+            if boto3 is None:
+                raise RuntimeError("boto3 is required for the S3 blob store")
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _object_key(self, key: str) -> str:
+        validate_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _is_missing(self, error: Exception) -> bool:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code')
+        return code in ('404', 'NoSuchKey', 'NotFound')
+
+    def put_key(self, key: str, data: bytes, content_type: str):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data,
+                               ContentType=content_type)
+
+    def stat(self, key: str) -> BlobInfo:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except Exception as e:
+            if self._is_missing(e):
+                raise BlobNotFound(key)
+            raise
+        return BlobInfo(key, head['ContentLength'], head.get('ContentType') or content_type_for(key))
+
+    def get_range(self, key: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        kwargs = {}
+        if start or end is not None:
+            kwargs['Range'] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key), **kwargs)
+        except Exception as e:
+            if self._is_missing(e):
+                raise BlobNotFound(key)
+            raise
+        return obj['Body'].read()
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+
+def create_blob_store() -> BlobStore:
+    """Build the blob store selected by BLOB_STORE (local or s3)"""
+    kind = os.getenv("BLOB_STORE", "local")
+    if kind == "s3":
+        return S3BlobStore(
+            bucket=os.environ["S3_BUCKET"],
+            prefix=os.getenv("S3_PREFIX", "results"),
+            endpoint_url=os.getenv("S3_ENDPOINT_URL"),
+        )
+    return LocalBlobStore(os.getenv("BLOB_STORE_ROOT", "data/blobs"))
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple]:
+    """Parse a single ``bytes=`` range into inclusive (start, end)
+
+    Returns None when there is no usable Range header; raises ValueError for
+    ranges that cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+    spec = header[len('bytes='):].strip()
+    if ',' in spec:
+        # Multipart ranges are not supported; serve the whole blob instead
+        return None
+    start_text, dash, end_text = spec.partition('-')
+    try:
+        if not dash:
+            raise ValueError
+        if start_text == '':
+            length = int(end_text)
+            if length <= 0:
+                raise ValueError
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+    except ValueError:
+        raise ValueError("Invalid range")
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+# Global blob store
+blob_store = create_blob_store()
@@ -0,0 +1,265 @@
+"""
+Memory-mapped model checkpoints
+
+Weights are stored in the safetensors layout: an 8-byte little-endian header
+length, a JSON header mapping tensor names to dtype/shape/byte offsets, then
+the raw tensor data. Loading reads only the header and maps the data with
+``MAP_PRIVATE``, so tensors are paged in on first use and the page cache is
+shared by every worker process that maps the same file. Files written here
+carry a SHA-256 of the data section in ``__metadata__``, checked on load
+unless ``CHECKPOINT_VERIFY=0``.
+
+Checkpoints live in ``STYLE_MODEL_DIR`` (default ``/models``) and are found
+by component and variant, so per-model decoders sit side by side:
+
+    /models/encoder.safetensors
+    /models/decoder-adain.safetensors
+    /models/decoder-cartoon.safetensors
+    /models/decoder.safetensors     (fallback for any variant)
+    /models/decoder.pth             (legacy torch.save file)
+
+Convert or inspect files with ``python checkpoints.py --help``.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+
+
+EXTENSION = '.safetensors'
+
+DTYPES = {
+    'F64': torch.float64,
+    'F32': torch.float32,
+    'F16': torch.float16,
+    'BF16': torch.bfloat16,
+    'I64': torch.int64,
+    'I32': torch.int32,
+    'I16': torch.int16,
+    'I8': torch.int8,
+    'U8': torch.uint8,
+    'BOOL': torch.bool,
+}
+DTYPE_NAMES = {dtype: name for name, dtype in DTYPES.items()}
+
+
+class CheckpointError(Exception):
+    """Raised for malformed or corrupted checkpoint files"""
+
+
+def model_dir() -> str:
+    return os.getenv("STYLE_MODEL_DIR", "/models")
+
+
+def verify_enabled() -> bool:
+    return os.getenv("CHECKPOINT_VERIFY", "1").lower() not in ("0", "false", "no")
+
+
+def find_checkpoint(component: str, variant: Optional[str] = None,
+                    directory: Optional[str] = None) -> Optional[str]:
+    """Path of the best checkpoint for a component/variant, or None"""
+    directory = directory or model_dir()
+    names = []
+    if variant:
+        names.append(f"{component}-{variant}{EXTENSION}")
+    names += [f"{component}{EXTENSION}", f"{component}.pth"]
+    for name in names:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def save_checkpoint(path: str, tensors: Dict[str, torch.Tensor], metadata: Dict[str, str] = None):
+    """Write tensors in the safetensors layout with a data checksum"""
+    tensors = {name: t.detach().cpu().contiguous() for name, t in tensors.items()}
+    header: Dict[str, Any] = {}
+    offset = 0
+    digest = hashlib.sha256()
+    for name in sorted(tensors):
+        tensor = tensors[name]
+        if tensor.dtype not in DTYPE_NAMES:
+            raise CheckpointError(f"Unsupported dtype for {name}: {tensor.dtype}")
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {'dtype': DTYPE_NAMES[tensor.dtype], 'shape': list(tensor.shape),
+                        'data_offsets': [offset, offset + size]}
+        digest.update(_tensor_bytes(tensor))
+        offset += size
+    header['__metadata__'] = dict(metadata or {}, sha256=digest.hexdigest())
+
+    encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    # Pad so the data section starts 8-byte aligned and tensors can be viewed in place
+    encoded += b' ' * (-len(encoded) % 8)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(encoded)))
+        f.write(encoded)
+        for name in sorted(tensors):
+            f.write(_tensor_bytes(tensors[name]))
+    os.replace(tmp_path, path)
+
+
+def _tensor_bytes(tensor: torch.Tensor) -> bytes:
+    return tensor.reshape(-1).view(torch.uint8).numpy().tobytes() if tensor.numel() else b''
+
+
+class CheckpointFile:
+    """A safetensors file; the header is parsed eagerly, tensor data is mapped on demand"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            prefix = f.read(8)
+            if len(prefix) != 8:
+                raise CheckpointError(f"{path}: truncated header")
+            (header_size,) = struct.unpack('<Q', prefix)
+            if header_size > self.size - 8:
+                raise CheckpointError(f"{path}: header length {header_size} exceeds file size")
+            try:
+                header = json.loads(f.read(header_size))
+            except ValueError as e:
+                raise CheckpointError(f"{path}: invalid header: {e}")
+        self.metadata: Dict[str, str] = header.pop('__metadata__', {}) or {}
+        self.entries: Dict[str, Dict[str, Any]] = header
+        self.data_start = 8 + header_size
+        end = max((entry['data_offsets'][1] for entry in header.values()), default=0)
+        if self.data_start + end > self.size:
+            raise CheckpointError(f"{path}: tensor data extends past the end of the file")
+        self._bytes: Optional[torch.Tensor] = None
+        self._lock = threading.Lock()
+
+    def keys(self) -> List[str]:
+        return list(self.entries)
+
+    def _mapped(self) -> torch.Tensor:
+        if self._bytes is None:
+            with self._lock:
+                if self._bytes is None:
+                    # MAP_PRIVATE: pages come from the shared page cache and writes never reach the file
+                    storage = torch.UntypedStorage.from_file(self.path, shared=False, nbytes=self.size)
+                    self._bytes = torch.empty(0, dtype=torch.uint8).set_(storage)
+        return self._bytes
+
+    def tensor(self, name: str) -> torch.Tensor:
+        entry = self.entries[name]
+        dtype = DTYPES.get(entry['dtype'])
+        if dtype is None:
+            raise CheckpointError(f"{self.path}: unsupported dtype {entry['dtype']} for {name}")
+        start, end = entry['data_offsets']
+        raw = self._mapped()[self.data_start + start:self.data_start + end]
+        try:
+            return raw.view(dtype).view(entry['shape'])
+        except RuntimeError:
+            # Misaligned offset (files from other writers); fall back to a copy
+            return raw.clone().view(dtype).view(entry['shape'])
+
+    def tensors(self) -> Dict[str, torch.Tensor]:
+        return {name: self.tensor(name) for name in self.entries}
+
+    def verify(self) -> bool:
+        """Check the data section against the stored SHA-256 (True if none is stored)"""
+        expected = self.metadata.get('sha256')
+        if not expected:
+            return True
+        digest = hashlib.sha256()
+        for chunk in self._data_chunks():
+            digest.update(chunk)
+        return digest.hexdigest() == expected
+
+    def _data_chunks(self, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+        # Hash in the order the writer did (entries sorted by name)
+        with open(self.path, 'rb') as f:
+            for name in sorted(self.entries):
+                start, end = self.entries[name]['data_offsets']
+                f.seek(self.data_start + start)
+                remaining = end - start
+                while remaining:
+                    chunk = f.read(min(chunk_size, remaining))
+                    if not chunk:
+                        raise CheckpointError(f"{self.path}: unexpected end of file")
+                    remaining -= len(chunk)
+                    yield chunk
+
+
+_verified: Dict[tuple, bool] = {}
+
+
+def load_state(path: str) -> Dict[str, torch.Tensor]:
+    """Tensors of a checkpoint: memory-mapped for safetensors, torch.load(mmap=True) for .pth"""
+    if path.endswith('.pth'):
+        return torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    checkpoint = CheckpointFile(path)
+    if verify_enabled():
+        # Verify each file version once per process
+        key = (path, checkpoint.size, os.path.getmtime(path))
+        if key not in _verified:
+            _verified[key] = checkpoint.verify()
+        if not _verified[key]:
+            raise CheckpointError(f"{path}: checksum mismatch")
+    return checkpoint.tensors()
+
+
+def load_into(module: torch.nn.Module, path: str) -> torch.nn.Module:
+    """Point a module's parameters at the checkpoint's mapped tensors (no copy)"""
+    module.load_state_dict(load_state(path), assign=True)
+    module.checkpoint_path = path
+    return module
+
+
+def _convert(args: argparse.Namespace) -> int:
+    state = torch.load(args.source, map_location='cpu', weights_only=True)
+    if isinstance(state, torch.nn.Module):
+        state = state.state_dict()
+    metadata = {'source': os.path.basename(args.source)}
+    if args.variant:
+        metadata['variant'] = args.variant
+    save_checkpoint(args.target, state, metadata)
+    print(f"Wrote {len(state)} tensors to {args.target}")
+    return 0
+
+
+def _export_encoder(args: argparse.Namespace) -> int:
+    from model import Encoder
+    encoder = Encoder(pretrained=True)
+    save_checkpoint(args.target, encoder.layers.state_dict(), {'source': 'torchvision vgg19 relu4_1'})
+    print(f"Wrote encoder weights to {args.target}")
+    return 0
+
+
+def _info(args: argparse.Namespace) -> int:
+    status = 0
+    for path in args.paths:
+        checkpoint = CheckpointFile(path)
+        total = sum(e['data_offsets'][1] - e['data_offsets'][0] for e in checkpoint.entries.values())
+        ok = checkpoint.verify()
+        status |= 0 if ok else 1
+        print(f"{path}: {len(checkpoint.entries)} tensors, {total} bytes, "
+              f"checksum {'OK' if ok else 'MISMATCH'}, metadata {checkpoint.metadata}")
+    return status
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Convert and inspect model checkpoints")
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert = commands.add_parser('convert', help="Convert a torch.save state dict (.pth) to safetensors")
+    convert.add_argument('source')
+    convert.add_argument('target')
+    convert.add_argument('--variant', help="Model type the weights belong to (e.g. adain, cartoon)")
+    export = commands.add_parser('export-encoder', help="Save the pretrained VGG19 encoder layers")
+    export.add_argument('target')
+    info = commands.add_parser('info', help="Print tensors/metadata and verify checksums")
+    info.add_argument('paths', nargs='+')
+    args = parser.parse_args(argv)
+    return {'convert': _convert, 'export-encoder': _export_encoder, 'info': _info}[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
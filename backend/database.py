@@ -3,150 +3,72 @@ Database models and operations for the AI Style Transfer Studio
 """
 
 import sqlite3
-import os
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 import json
 import uuid
 
+import rollups
+from migrations import apply_migrations
+from pagination import build_page, keyset_query
+from storage import StorageBackend, create_backend
+
+
+# Public listing fields mapped to the SQL that produces them
+HISTORY_COLUMNS = {
+    'id': 'id',
+    'content_image_path': 'content_image_path',
+    'style_image_path': 'style_image_path',
+    'result_image_path': 'result_image_path',
+    'result_key': 'result_key',
+    'color_palette': 'color_palette',
+    'model_type': 'model_type',
+    'style_strength': 'style_strength',
+    'processing_time': 'processing_time',
+    'created_at': 'created_at',
+}
+
+GALLERY_COLUMNS = {
+    'id': 'g.id',
+    'name': 'g.gallery_name',
+    'description': 'g.description',
+    'is_public': 'g.is_public',
+    'created_at': 'g.created_at',
+    'item_count': '(SELECT COUNT(*) FROM gallery_items gi WHERE gi.gallery_id = g.id)',
+}
+
+GALLERY_ITEM_COLUMNS = {
+    'id': 'id',
+    'transfer_history_id': 'transfer_history_id',
+    'title': 'title',
+    'description': 'description',
+    'tags': 'tags',
+    'likes_count': 'likes_count',
+    'views_count': 'views_count',
+    'created_at': 'created_at',
+}
+
+# Paginated listings: (table, columns, filter); the filter takes the owner's id
+HISTORY_PAGE = ("transfer_history", HISTORY_COLUMNS, "user_id = ?")
+GALLERY_PAGE = ("user_galleries g", GALLERY_COLUMNS, "g.user_id = ?")
+GALLERY_ITEM_PAGE = ("gallery_items", GALLERY_ITEM_COLUMNS, "gallery_id = ?")
+
 
 class DatabaseManager:
     """Manages all database operations for the application"""
     
-    def __init__(self, db_path: str = "data/app.db"):
-        self.db_path = db_path
-        os.makedirs(os.path.dirname(db_path), exist_ok=True)
-        self.init_database()
+    def __init__(self, backend: StorageBackend = None, initialize: bool = True):
+        self.backend = backend or create_backend()
+        if initialize:
+            self.init_database()
     
     def init_database(self):
-        """Initialize all database tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Users table (already handled in auth.py, but ensuring consistency)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                username TEXT UNIQUE NOT NULL,
-                full_name TEXT,
-                hashed_password TEXT NOT NULL,
-                is_active BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP
-            )
-        """)
-        
-        # Style transfer history
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transfer_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                session_id TEXT,
-                content_image_path TEXT,
-                style_image_path TEXT,
-                result_image_path TEXT,
-                model_type TEXT DEFAULT 'adain',
-                style_strength REAL DEFAULT 1.0,
-                processing_time REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # User preferences
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_preferences (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER UNIQUE,
-                favorite_styles TEXT,  -- JSON array
-                default_style_strength REAL DEFAULT 0.7,
-                preferred_output_format TEXT DEFAULT 'jpeg',
-                theme TEXT DEFAULT 'dark',
-                notifications_enabled BOOLEAN DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # Style presets
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS style_presets (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL,
-                description TEXT,
-                style_image_path TEXT,
-                artist TEXT,
-                style_period TEXT,
-                color_palette TEXT,  -- JSON array
-                is_active BOOLEAN DEFAULT 1,
-                usage_count INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # User galleries
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_galleries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                gallery_name TEXT,
-                description TEXT,
-                is_public BOOLEAN DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        # Gallery items
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS gallery_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                gallery_id INTEGER,
-                transfer_history_id INTEGER,
-                title TEXT,
-                description TEXT,
-                tags TEXT,  -- JSON array
-                likes_count INTEGER DEFAULT 0,
-                views_count INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (gallery_id) REFERENCES user_galleries (id),
-                FOREIGN KEY (transfer_history_id) REFERENCES transfer_history (id)
-            )
-        """)
-        
-        # User feedback/ratings
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS user_feedback (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                transfer_id INTEGER,
-                rating INTEGER CHECK(rating >= 1 AND rating <= 5),
-                feedback_text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (transfer_id) REFERENCES transfer_history (id)
-            )
-        """)
-        
-        # Analytics/usage tracking
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS usage_analytics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                action TEXT,  -- 'style_transfer', 'login', 'register', etc.
-                details TEXT,  -- JSON with additional details
-                ip_address TEXT,
-                user_agent TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        self._insert_default_presets(cursor)
-        conn.commit()
-        conn.close()
+        """Bring the schema up to date and insert default data"""
+        with self.backend.connection() as conn:
+            apply_migrations(conn)
+            
+            cursor = conn.cursor()
+            self._insert_default_presets(cursor)
     
     def _insert_default_presets(self, cursor):
         """Insert default style presets"""
@@ -196,136 +118,251 @@ class DatabaseManager:
             """, (preset['name'], preset['description'], preset['artist'], 
                   preset['style_period'], preset['color_palette']))
     
+    def _user_from_row(self, row) -> Dict[str, Any]:
+        return {
+            'id': row[0],
+            'email': row[1],
+            'username': row[2],
+            'full_name': row[3],
+            'hashed_password': row[4],
+            'is_active': bool(row[5]),
+            'created_at': row[6]
+        }
+    
+    def get_user_by_login(self, login: str) -> Optional[Dict[str, Any]]:
+        """Get a user by username or email"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT id, email, username, full_name, hashed_password, is_active, created_at
+                FROM users WHERE username = ? OR email = ?
+            """, (login, login))
+            row = cursor.fetchone()
+        
+        return self._user_from_row(row) if row else None
+    
+    def create_user(self, email: str, username: str, full_name: Optional[str],
+                    hashed_password: str) -> Dict[str, Any]:
+        """Create a user; raises ValueError if the email or username is taken"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT id FROM users WHERE email = ? OR username = ?",
+                           (email, username))
+            if cursor.fetchone():
+                raise ValueError("Email or username already registered")
+            
+            cursor.execute("""
+                INSERT INTO users (email, username, full_name, hashed_password)
+                VALUES (?, ?, ?, ?)
+            """, (email, username, full_name, hashed_password))
+            
+            cursor.execute("""
+                SELECT id, email, username, full_name, hashed_password, is_active, created_at
+                FROM users WHERE id = ?
+            """, (cursor.lastrowid,))
+            row = cursor.fetchone()
+        
+        return self._user_from_row(row)
+    
+    def update_last_login(self, user_id: int):
+        """Record a successful login"""
+        with self.backend.connection() as conn:
+            conn.execute("UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?", (user_id,))
+    
+    def set_user_active(self, username: str, is_active: bool):
+        """Activate or deactivate a user"""
+        with self.backend.connection() as conn:
+            conn.execute("UPDATE users SET is_active = ? WHERE username = ?", (is_active, username))
+    
+    def set_password_hash(self, username: str, hashed_password: str):
+        """Replace a user's password hash"""
+        with self.backend.connection() as conn:
+            conn.execute("UPDATE users SET hashed_password = ? WHERE username = ?",
+                         (hashed_password, username))
+    
+    def revoke_tokens(self, username: str, revoked_at: float):
+        """Reject tokens issued to a user up to ``revoked_at`` (seen by every worker)"""
+        with self.backend.connection() as conn:
+            conn.execute("UPDATE users SET tokens_valid_after = ? WHERE username = ?",
+                         (revoked_at, username))
+    
+    def get_tokens_valid_after(self, username: str) -> float:
+        """Time of the user's last token revocation (0 if never revoked or unknown)"""
+        with self.backend.connection() as conn:
+            row = conn.execute(
+                "SELECT tokens_valid_after FROM users WHERE username = ?", (username,)
+            ).fetchone()
+        return row[0] if row else 0.0
+    
     def save_transfer_history(self, user_id: int, session_id: str, 
-                            content_path: str, style_path: str, result_path: str,
+                            content_path: Optional[str], style_path: Optional[str], result_path: str,
                             model_type: str = 'adain', style_strength: float = 1.0,
-                            processing_time: float = 0.0) -> int:
+                            processing_time: float = 0.0, result_key: str = None,
+                            color_palette: List[str] = None) -> int:
         """Save style transfer operation to history"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO transfer_history 
-            (user_id, session_id, content_image_path, style_image_path, 
-             result_image_path, model_type, style_strength, processing_time)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, session_id, content_path, style_path, result_path,
-              model_type, style_strength, processing_time))
-        
-        transfer_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO transfer_history 
+                (user_id, session_id, content_image_path, style_image_path, 
+                 result_image_path, model_type, style_strength, processing_time, result_key,
+                 color_palette)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, session_id, content_path, style_path, result_path,
+                  model_type, style_strength, processing_time, result_key,
+                  json.dumps(color_palette) if color_palette else None))
+            
+            transfer_id = cursor.lastrowid
+            rollups.record_transfer(cursor, model_type, processing_time)
         
         return transfer_id
     
     def get_user_history(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """Get user's style transfer history"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, content_image_path, style_image_path, result_image_path,
-                   model_type, style_strength, processing_time, created_at
-            FROM transfer_history 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT ?
-        """, (user_id, limit))
-        
-        history = []
-        for row in cursor.fetchall():
-            history.append({
-                'id': row[0],
-                'content_image_path': row[1],
-                'style_image_path': row[2],
-                'result_image_path': row[3],
-                'model_type': row[4],
-                'style_strength': row[5],
-                'processing_time': row[6],
-                'created_at': row[7]
-            })
-        
-        conn.close()
-        return history
+        return self.get_user_history_page(user_id, limit)['items']
+    
+    def get_user_history_page(self, user_id: int, limit: int = 20,
+                              cursor: Optional[tuple] = None,
+                              columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get one page of history, newest first, after an optional (created_at, id) cursor"""
+        return self._fetch_page(
+            *HISTORY_PAGE, [user_id], limit, cursor, columns
+        )
+    
+    def _fetch_page(self, table: str, column_map: Dict[str, str], where: str,
+                    params: List[Any], limit: int, cursor: Optional[tuple],
+                    columns: Optional[List[str]]) -> Dict[str, Any]:
+        """Keyset-paginated SELECT ordered by (created_at DESC, id DESC)"""
+        columns = columns or list(column_map)
+        params = list(params)
+        if cursor:
+            params.extend(cursor)
+        params.append(limit + 1)
+        
+        with self.backend.connection() as conn:
+            cursor_ = conn.cursor()
+            
+            cursor_.execute(keyset_query(table, column_map, columns, where, bool(cursor)), params)
+            rows = [dict(zip(columns, row)) for row in cursor_.fetchall()]
+        
+        for row in rows:
+            if 'is_public' in row:
+                row['is_public'] = bool(row['is_public'])
+            if 'tags' in row:
+                row['tags'] = json.loads(row['tags']) if row['tags'] else []
+            if 'color_palette' in row:
+                row['color_palette'] = json.loads(row['color_palette']) if row['color_palette'] else []
+        return build_page(rows, limit)
     
     def get_style_presets(self) -> List[Dict[str, Any]]:
         """Get all active style presets"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, name, description, artist, style_period, color_palette, usage_count
-            FROM style_presets 
-            WHERE is_active = 1
-            ORDER BY usage_count DESC, name
-        """)
-        
-        presets = []
-        for row in cursor.fetchall():
-            presets.append({
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'artist': row[3],
-                'style_period': row[4],
-                'color_palette': json.loads(row[5]) if row[5] else [],
-                'usage_count': row[6]
-            })
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT id, name, description, artist, style_period, color_palette, usage_count
+                FROM style_presets 
+                WHERE is_active = 1
+                ORDER BY usage_count DESC, name
+            """)
+            
+            presets = []
+            for row in cursor.fetchall():
+                presets.append({
+                    'id': row[0],
+                    'name': row[1],
+                    'description': row[2],
+                    'artist': row[3],
+                    'style_period': row[4],
+                    'color_palette': json.loads(row[5]) if row[5] else [],
+                    'usage_count': row[6]
+                })
         
-        conn.close()
         return presets
     
     def update_preset_usage(self, preset_id: int):
         """Increment usage count for a style preset"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE style_presets 
-            SET usage_count = usage_count + 1 
-            WHERE id = ?
-        """, (preset_id,))
-        
-        conn.commit()
-        conn.close()
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                UPDATE style_presets 
+                SET usage_count = usage_count + 1 
+                WHERE id = ?
+            """, (preset_id,))
+        
+    def add_preset_usage(self, counts: Dict[int, int]):
+        """Add aggregated usage counts to several presets in one transaction"""
+        with self.backend.connection() as conn:
+            conn.executemany("""
+                UPDATE style_presets 
+                SET usage_count = usage_count + ? 
+                WHERE id = ?
+            """, [(count, preset_id) for preset_id, count in counts.items()])
+    
+    def get_presets_missing_palette(self) -> List[tuple]:
+        """(id, style_image_path) of active presets that have an image but no palette"""
+        with self.backend.connection() as conn:
+            return conn.execute("""
+                SELECT id, style_image_path FROM style_presets 
+                WHERE is_active = 1 AND style_image_path IS NOT NULL AND style_image_path != ''
+                  AND (color_palette IS NULL OR color_palette IN ('', '[]'))
+            """).fetchall()
+    
+    def set_preset_palette(self, preset_id: int, color_palette: List[str]) -> bool:
+        """Fill in a preset's color palette unless it already has one"""
+        with self.backend.connection() as conn:
+            cursor = conn.execute("""
+                UPDATE style_presets 
+                SET color_palette = ? 
+                WHERE id = ? AND (color_palette IS NULL OR color_palette IN ('', '[]'))
+            """, (json.dumps(color_palette), preset_id))
+            return cursor.rowcount == 1
+    
+    def get_change_version(self, name: str) -> int:
+        """Current change counter for a cached table (bumped by triggers)"""
+        with self.backend.connection() as conn:
+            row = conn.execute(
+                "SELECT version FROM change_versions WHERE name = ?", (name,)
+            ).fetchone()
+        return row[0] if row else 0
     
     def save_user_preferences(self, user_id: int, preferences: Dict[str, Any]):
         """Save or update user preferences"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO user_preferences 
-            (user_id, favorite_styles, default_style_strength, 
-             preferred_output_format, theme, notifications_enabled, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            user_id,
-            json.dumps(preferences.get('favorite_styles', [])),
-            preferences.get('default_style_strength', 0.7),
-            preferences.get('preferred_output_format', 'jpeg'),
-            preferences.get('theme', 'dark'),
-            preferences.get('notifications_enabled', True),
-            datetime.now().isoformat()
-        ))
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT OR REPLACE INTO user_preferences 
+                (user_id, favorite_styles, default_style_strength, 
+                 preferred_output_format, theme, notifications_enabled, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                user_id,
+                json.dumps(preferences.get('favorite_styles', [])),
+                preferences.get('default_style_strength', 0.7),
+                preferences.get('preferred_output_format', 'auto'),
+                preferences.get('theme', 'dark'),
+                preferences.get('notifications_enabled', True),
+                datetime.now().isoformat()
+            ))
         
-        conn.commit()
-        conn.close()
-    
     def get_user_preferences(self, user_id: int) -> Dict[str, Any]:
         """Get user preferences"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT favorite_styles, default_style_strength, preferred_output_format,
-                   theme, notifications_enabled
-            FROM user_preferences 
-            WHERE user_id = ?
-        """, (user_id,))
-        
-        row = cursor.fetchone()
-        conn.close()
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT favorite_styles, default_style_strength, preferred_output_format,
+                       theme, notifications_enabled
+                FROM user_preferences 
+                WHERE user_id = ?
+            """, (user_id,))
+            
+            row = cursor.fetchone()
         
         if row:
             return {
@@ -340,7 +377,7 @@ class DatabaseManager:
             return {
                 'favorite_styles': [],
                 'default_style_strength': 0.7,
-                'preferred_output_format': 'jpeg',
+                'preferred_output_format': 'auto',
                 'theme': 'dark',
                 'notifications_enabled': True
             }
@@ -348,143 +385,151 @@ class DatabaseManager:
     def create_gallery(self, user_id: int, name: str, description: str = "", 
                       is_public: bool = False) -> int:
         """Create a new user gallery"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO user_galleries (user_id, gallery_name, description, is_public)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, name, description, is_public))
-        
-        gallery_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO user_galleries (user_id, gallery_name, description, is_public)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, name, description, is_public))
+            
+            gallery_id = cursor.lastrowid
         
         return gallery_id
     
     def add_to_gallery(self, gallery_id: int, transfer_id: int, title: str = "",
                       description: str = "", tags: List[str] = None):
         """Add a style transfer result to a gallery"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO gallery_items 
-            (gallery_id, transfer_history_id, title, description, tags)
-            VALUES (?, ?, ?, ?, ?)
-        """, (gallery_id, transfer_id, title, description, 
-              json.dumps(tags or [])))
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO gallery_items 
+                (gallery_id, transfer_history_id, title, description, tags)
+                VALUES (?, ?, ?, ?, ?)
+            """, (gallery_id, transfer_id, title, description, 
+                  json.dumps(tags or [])))
         
-        conn.commit()
-        conn.close()
-    
     def get_user_galleries(self, user_id: int) -> List[Dict[str, Any]]:
         """Get user's galleries"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT g.id, g.gallery_name, g.description, g.is_public, g.created_at,
-                   COUNT(gi.id) as item_count
-            FROM user_galleries g
-            LEFT JOIN gallery_items gi ON g.id = gi.gallery_id
-            WHERE g.user_id = ?
-            GROUP BY g.id, g.gallery_name, g.description, g.is_public, g.created_at
-            ORDER BY g.created_at DESC
-        """, (user_id,))
-        
-        galleries = []
-        for row in cursor.fetchall():
-            galleries.append({
-                'id': row[0],
-                'name': row[1],
-                'description': row[2],
-                'is_public': bool(row[3]),
-                'created_at': row[4],
-                'item_count': row[5]
-            })
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT g.id, g.gallery_name, g.description, g.is_public, g.created_at,
+                       COUNT(gi.id) as item_count
+                FROM user_galleries g
+                LEFT JOIN gallery_items gi ON g.id = gi.gallery_id
+                WHERE g.user_id = ?
+                GROUP BY g.id, g.gallery_name, g.description, g.is_public, g.created_at
+                ORDER BY g.created_at DESC
+            """, (user_id,))
+            
+            galleries = []
+            for row in cursor.fetchall():
+                galleries.append({
+                    'id': row[0],
+                    'name': row[1],
+                    'description': row[2],
+                    'is_public': bool(row[3]),
+                    'created_at': row[4],
+                    'item_count': row[5]
+                })
         
-        conn.close()
         return galleries
     
+    def get_user_galleries_page(self, user_id: int, limit: int = 20,
+                                cursor: Optional[tuple] = None,
+                                columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get one page of a user's galleries, newest first"""
+        return self._fetch_page(
+            *GALLERY_PAGE, [user_id], limit, cursor, columns
+        )
+    
+    def get_gallery(self, gallery_id: int) -> Optional[Dict[str, Any]]:
+        """Get a gallery's owner and visibility"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT id, user_id, gallery_name, is_public
+                FROM user_galleries WHERE id = ?
+            """, (gallery_id,))
+            row = cursor.fetchone()
+        
+        if row:
+            return {'id': row[0], 'user_id': row[1], 'name': row[2], 'is_public': bool(row[3])}
+        return None
+    
+    def get_gallery_items_page(self, gallery_id: int, limit: int = 20,
+                               cursor: Optional[tuple] = None,
+                               columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Get one page of a gallery's items, newest first"""
+        return self._fetch_page(
+            *GALLERY_ITEM_PAGE, [gallery_id], limit, cursor, columns
+        )
+    
     def log_user_action(self, user_id: int, action: str, details: Dict[str, Any] = None,
                        ip_address: str = None, user_agent: str = None):
         """Log user action for analytics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO usage_analytics 
-            (user_id, action, details, ip_address, user_agent)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, action, json.dumps(details or {}), ip_address, user_agent))
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO usage_analytics 
+                (user_id, action, details, ip_address, user_agent)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, action, json.dumps(details or {}), ip_address, user_agent))
+            rollups.record_events(cursor, [(user_id, action, None)])
+        
+    def log_user_actions(self, rows: List[tuple]):
+        """Write a batch of analytics rows in a single transaction
+        
+        Each row is (user_id, action, details_json, ip_address, user_agent, created_at).
+        """
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.executemany("""
+                INSERT INTO usage_analytics 
+                (user_id, action, details, ip_address, user_agent, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, rows)
+            rollups.record_events(cursor, [(row[0], row[1], row[5]) for row in rows])
         
-        conn.commit()
-        conn.close()
-    
     def get_popular_styles(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get most popular style presets"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT name, description, artist, usage_count
-            FROM style_presets 
-            WHERE is_active = 1
-            ORDER BY usage_count DESC, name
-            LIMIT ?
-        """, (limit,))
-        
-        popular_styles = []
-        for row in cursor.fetchall():
-            popular_styles.append({
-                'name': row[0],
-                'description': row[1],
-                'artist': row[2],
-                'usage_count': row[3]
-            })
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT name, description, artist, usage_count
+                FROM style_presets 
+                WHERE is_active = 1
+                ORDER BY usage_count DESC, name
+                LIMIT ?
+            """, (limit,))
+            
+            popular_styles = []
+            for row in cursor.fetchall():
+                popular_styles.append({
+                    'name': row[0],
+                    'description': row[1],
+                    'artist': row[2],
+                    'usage_count': row[3]
+                })
         
-        conn.close()
         return popular_styles
     
     def get_analytics_summary(self) -> Dict[str, Any]:
-        """Get analytics summary"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Total users
-        cursor.execute("SELECT COUNT(*) FROM users")
-        total_users = cursor.fetchone()[0]
-        
-        # Total style transfers
-        cursor.execute("SELECT COUNT(*) FROM transfer_history")
-        total_transfers = cursor.fetchone()[0]
+        """Get analytics summary from the incrementally maintained rollups"""
+        with self.backend.connection() as conn:
+            cursor = conn.cursor()
+            
+            summary = rollups.read_summary(cursor)
         
-        # Active users (last 30 days)
-        cursor.execute("""
-            SELECT COUNT(DISTINCT user_id) 
-            FROM usage_analytics 
-            WHERE created_at >= datetime('now', '-30 days')
-        """)
-        active_users = cursor.fetchone()[0]
-        
-        # Average processing time
-        cursor.execute("""
-            SELECT AVG(processing_time) 
-            FROM transfer_history 
-            WHERE processing_time > 0
-        """)
-        avg_processing_time = cursor.fetchone()[0] or 0
-        
-        conn.close()
-        
-        return {
-            'total_users': total_users,
-            'total_transfers': total_transfers,
-            'active_users_30d': active_users,
-            'avg_processing_time': round(avg_processing_time, 2)
-        }
+        return summary
 
 
-# Global database instance
-db = DatabaseManager()
\ No newline at end of file
+# Global database instance; the API initializes it in its lifespan hook
+db = DatabaseManager(initialize=False)
\ No newline at end of file
@@ -0,0 +1,134 @@
+"""
+Multi-resolution derivatives of stored results
+
+When a result is saved, a background worker decodes it once and writes
+downscaled copies at a few widths and formats next to it in the blob store
+(``<sha256>_w320.webp``). Gallery and history tiles then fetch the smallest
+derivative that covers the tile instead of the full-size result.
+"""
+
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from PIL import Image, features
+
+from blobstore import BlobInfo, BlobStore, derived_key
+from encoding import MEDIA_TYPES, accepted_format
+
+
+# Format name -> (PIL format, extension, quality)
+FORMATS = {
+    'avif': ('AVIF', 'avif', 55),
+    'webp': ('WEBP', 'webp', 75),
+    'jpeg': ('JPEG', 'jpg', 80),
+}
+
+# Formats generated by default, best first
+FORMAT_PREFERENCE = ('avif', 'webp', 'jpeg')
+
+
+def available_formats(requested: Sequence[str]) -> List[str]:
+    """Formats from ``requested`` that this Pillow build can encode"""
+    formats = []
+    for name in requested:
+        if name == 'jpeg' or (name in FORMATS and features.check(name)):
+            formats.append(name)
+    return formats
+
+
+class DerivativeGenerator:
+    """Generates and looks up result derivatives"""
+
+    def __init__(self, store: BlobStore, processor, widths: Sequence[int] = (160, 320, 640),
+                 formats: Sequence[str] = FORMAT_PREFERENCE, max_workers: int = 1):
+        self.store = store
+        self.processor = processor
+        self.widths = tuple(sorted(widths))
+        self.formats = available_formats(formats)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="derivatives")
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._stats = {'scheduled': 0, 'generated': 0, 'failed': 0, 'seconds_total': 0.0}
+
+    def key_for(self, key: str, width: int, fmt: str) -> str:
+        return derived_key(key, f"w{width}", FORMATS[fmt][1])
+
+    def schedule(self, key: str):
+        """Generate every derivative of ``key`` in the background"""
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            self._stats['scheduled'] += 1
+        self._executor.submit(self._generate_all, key)
+
+    def _generate_all(self, key: str):
+        started = time.perf_counter()
+        try:
+            image = Image.open(io.BytesIO(self.store.get(key)))
+            image.load()
+            # Largest first, each width downscaled from the previous one
+            for width in reversed(self.widths):
+                if max(image.size) > width:
+                    image = image.resize(_fit(image.size, width), Image.Resampling.LANCZOS)
+                for fmt in self.formats:
+                    target = self.key_for(key, width, fmt)
+                    if not self.store.exists(target):
+                        self.store.put_key(target, self._encode(image, width, fmt), MEDIA_TYPES[fmt])
+                        with self._lock:
+                            self._stats['generated'] += 1
+        except Exception as e:
+            with self._lock:
+                self._stats['failed'] += 1
+            print(f"Failed to generate derivatives for {key}: {e}")
+        finally:
+            with self._lock:
+                self._stats['seconds_total'] += time.perf_counter() - started
+                self._pending.discard(key)
+
+    def _encode(self, image: Image.Image, width: int, fmt: str) -> bytes:
+        pil_format, _, quality = FORMATS[fmt]
+        return self.processor.optimize_for_web(image, max_size=width, quality=quality, format=pil_format)
+
+    def best_fit(self, key: str, width: int, accept: Optional[str]) -> Tuple[BlobInfo, str]:
+        """Return the smallest derivative covering ``width`` in the best accepted format
+
+        Derivative sizes bound the longest side, like ``optimize_for_web``.
+
+        A derivative that the background worker has not written yet is built
+        synchronously so the caller never has to fall back to the original.
+        """
+        fmt = accepted_format(accept, self.formats)
+        target_width = next((w for w in self.widths if w >= width), self.widths[-1])
+        target = self.key_for(key, target_width, fmt)
+
+        def build() -> bytes:
+            # Raises BlobNotFound when the original itself is missing
+            image = Image.open(io.BytesIO(self.store.get(key)))
+            return self._encode(image, target_width, fmt)
+
+        return self.store.get_or_create(target, build), fmt
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, pending=len(self._pending), widths=list(self.widths),
+                        formats=self.formats)
+
+
+def _fit(size: Tuple[int, int], max_size: int) -> Tuple[int, int]:
+    width, height = size
+    if width > height:
+        return max_size, max(1, int(height * (max_size / width)))
+    return max(1, int(width * (max_size / height))), max_size
+
+
+def create_derivative_generator(store: BlobStore, processor) -> DerivativeGenerator:
+    """Build a generator configured from the DERIVATIVE_* environment variables"""
+    widths = [int(w) for w in os.getenv("DERIVATIVE_WIDTHS", "160,320,640").split(",")]
+    formats = os.getenv("DERIVATIVE_FORMATS", ",".join(FORMAT_PREFERENCE)).split(",")
+    return DerivativeGenerator(store, processor, widths=widths, formats=formats,
+                               max_workers=int(os.getenv("DERIVATIVE_WORKERS", "1")))
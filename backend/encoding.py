@@ -0,0 +1,159 @@
+"""
+Output encoding for style transfer results
+
+Chooses the output format for a result (explicit request, the user's
+``preferred_output_format`` or the client's Accept header), encodes it with
+a speed- or size-oriented preset, and keeps per-format timing and size
+statistics so the cost of each choice is visible in the health endpoint.
+"""
+
+import io
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from PIL import Image, features
+
+
+MEDIA_TYPES = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'png': 'image/png',
+}
+
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'avif': 'avif', 'png': 'png'}
+
+# Save options per preset: 'fast' keeps encode time low, 'small' minimises bytes
+PRESETS = {
+    'fast': {
+        'jpeg': {'format': 'JPEG', 'quality': 90},
+        'webp': {'format': 'WEBP', 'quality': 85, 'method': 0},
+        'avif': {'format': 'AVIF', 'quality': 70, 'speed': 8},
+        'png': {'format': 'PNG', 'compress_level': 1},
+    },
+    'small': {
+        'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True},
+        'webp': {'format': 'WEBP', 'quality': 78, 'method': 6},
+        'avif': {'format': 'AVIF', 'quality': 55, 'speed': 4},
+        'png': {'format': 'PNG', 'optimize': True},
+    },
+}
+
+# Order used when picking from the Accept header
+ACCEPT_PREFERENCE = ('avif', 'webp', 'jpeg')
+
+
+def supported_formats() -> Tuple[str, ...]:
+    """Output formats this Pillow build can encode"""
+    return tuple(name for name in MEDIA_TYPES if name in ('jpeg', 'png') or features.check(name))
+
+
+def normalize_format(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    name = name.lower()
+    return 'jpeg' if name == 'jpg' else name
+
+
+def negotiate_format(requested: Optional[str], preferred: Optional[str], accept: Optional[str]) -> str:
+    """Pick the output format for a result
+
+    An explicit ``requested`` format wins. Otherwise the user's preference is
+    used, unless it is ``auto``, in which case the best format named in the
+    Accept header is chosen. Anything unsupported falls back to JPEG.
+    """
+    available = supported_formats()
+    requested = normalize_format(requested)
+    if requested:
+        if requested not in available:
+            raise ValueError(f"Unsupported output format: {requested}")
+        return requested
+    preferred = normalize_format(preferred)
+    if preferred and preferred != 'auto':
+        return preferred if preferred in available else 'jpeg'
+    return accepted_format(accept, available)
+
+
+def parse_accept(accept: Optional[str]) -> Dict[str, float]:
+    """Media types named in an Accept header mapped to their q-values"""
+    ranges = {}
+    for part in (accept or '').lower().split(','):
+        media_type, *params = [p.strip() for p in part.split(';')]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0
+        ranges[media_type] = max(q, ranges.get(media_type, 0.0))
+    return ranges
+
+
+def accepted_format(accept: Optional[str], formats: Sequence[str]) -> str:
+    """Best of ``formats`` the client names explicitly with q > 0 (JPEG otherwise)
+
+    Higher q wins; ties go to ``ACCEPT_PREFERENCE`` order. Wildcards do not
+    select AVIF or WebP, since clients sending ``*/*`` may not decode them.
+    """
+    ranges = parse_accept(accept)
+    best, best_q = 'jpeg', 0.0
+    for name in ACCEPT_PREFERENCE:
+        q = ranges.get(MEDIA_TYPES[name], 0.0)
+        if name in formats and q > best_q:
+            best, best_q = name, q
+    return best
+
+
+class ResultEncoder:
+    """Encodes result images and records encode time and size per format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def encode(self, image: Image.Image, fmt: str = 'jpeg', preset: str = 'fast',
+               progressive: bool = False) -> bytes:
+        options = dict(PRESETS[preset][fmt])
+        if fmt == 'jpeg' and progressive:
+            options['progressive'] = True
+        if image.mode not in ('RGB', 'L') and fmt == 'jpeg':
+            image = image.convert('RGB')
+
+        started = time.perf_counter()
+        output = io.BytesIO()
+        image.save(output, **options)
+        data = output.getvalue()
+        self._record(f"{fmt}/{preset}", time.perf_counter() - started, len(data), image.size)
+        return data
+
+    def _record(self, name: str, seconds: float, size: int, dimensions: Tuple[int, int]):
+        pixels = dimensions[0] * dimensions[1]
+        with self._lock:
+            entry = self._stats.setdefault(name, {'count': 0, 'seconds_total': 0.0,
+                                                  'bytes_total': 0, 'pixels_total': 0})
+            entry['count'] += 1
+            entry['seconds_total'] += seconds
+            entry['bytes_total'] += size
+            entry['pixels_total'] += pixels
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for name, entry in self._stats.items():
+                count = entry['count']
+                result[name] = {
+                    'count': count,
+                    'avg_encode_ms': round(entry['seconds_total'] / count * 1000, 2),
+                    'avg_bytes': int(entry['bytes_total'] / count),
+                    'bits_per_pixel': round(entry['bytes_total'] * 8 / max(entry['pixels_total'], 1), 3),
+                }
+            return result
+
+
+# Global result encoder
+result_encoder = ResultEncoder()
@@ -0,0 +1,125 @@
+"""
+Password hashing off the event loop
+
+bcrypt is deliberately slow, so calling it inside an async handler stalls
+every other request on the server. ``PasswordHasher`` runs hash/verify calls
+on a small dedicated thread pool (bcrypt releases the GIL while hashing),
+caps how many calls may wait for a thread, and keeps queueing metrics.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+class HashingOverloaded(Exception):
+    """Raised when too many hashing calls are already waiting"""
+
+
+def create_crypt_context(rounds: int) -> CryptContext:
+    """bcrypt context pinned to one cost factor
+
+    Pinning min/max rounds makes passlib report hashes with any other cost as
+    needing an update, which drives rehash-on-login when the cost is tuned.
+    """
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds,
+    )
+
+
+class PasswordHasher:
+    """Bounded executor for bcrypt hash/verify calls"""
+
+    def __init__(self, context: CryptContext, max_workers: int = 2, max_waiting: int = 64):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_waiting = max_waiting
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._running = 0
+        self._stats = {
+            'completed': 0,
+            'rejected': 0,
+            'rehashed': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'run_seconds_total': 0.0,
+        }
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Verify a password; also returns a new hash if the stored one needs an upgrade"""
+        valid, new_hash = await self._submit(self.context.verify_and_update, password, hashed_password)
+        if new_hash is not None:
+            self._stats['rehashed'] += 1
+        return valid, new_hash
+
+    async def _submit(self, fn: Callable, *args) -> Any:
+        with self._lock:
+            if self._waiting >= self.max_waiting:
+                self._stats['rejected'] += 1
+                raise HashingOverloaded("Too many pending password operations")
+            self._waiting += 1
+        job = {'enqueued': time.perf_counter(), 'started': False}
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, self._run, fn, args, job)
+        except asyncio.CancelledError:
+            # A cancelled job that never reached a thread still counts as waiting
+            with self._lock:
+                if not job['started']:
+                    job['started'] = True
+                    self._waiting -= 1
+            raise
+
+    def _run(self, fn: Callable, args: tuple, job: dict) -> Any:
+        started = time.perf_counter()
+        waited = started - job['enqueued']
+        with self._lock:
+            if job['started']:
+                return None
+            job['started'] = True
+            self._waiting -= 1
+            self._running += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._stats['completed'] += 1
+                self._stats['run_seconds_total'] += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(waiting=self._waiting, running=self._running,
+                         max_workers=self.max_workers, max_waiting=self.max_waiting)
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+pwd_context = create_crypt_context(BCRYPT_ROUNDS)
+
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    max_waiting=int(os.getenv("PASSWORD_HASH_MAX_WAITING", "64")),
+)
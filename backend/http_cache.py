@@ -0,0 +1,47 @@
+"""
+HTTP caching helpers (ETag / If-None-Match) for JSON endpoints
+"""
+
+import hashlib
+import json
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def compute_etag(body: bytes) -> str:
+    """Strong ETag for a response body"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header value against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    # Weak comparison: W/"x" matches "x"
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def render_json(payload: Any) -> bytes:
+    return json.dumps(payload, separators=(',', ':'), default=str).encode()
+
+
+def cached_response(request: Request, body: bytes, etag: str = None,
+                    media_type: str = 'application/json',
+                    cache_control: str = 'private, no-cache') -> Response:
+    """Return the body with an ETag, or 304 if the client already has it"""
+    etag = etag or compute_etag(body)
+    headers = {'ETag': etag, 'Cache-Control': cache_control}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def cached_json_response(request: Request, payload: Any,
+                         cache_control: str = 'private, no-cache') -> Response:
+    """Serialize a JSON payload and answer with ETag / 304 semantics"""
+    return cached_response(request, render_json(payload), cache_control=cache_control)
@@ -3,23 +3,97 @@ Advanced image processing utilities for AI Style Transfer Studio
 """
 
 import numpy as np
-try:
-    import cv2
-except ImportError:
-    cv2 = None  # Graceful fallback if OpenCV is not available
 from PIL import Image, ImageFilter, ImageEnhance, ImageOps
-import torch
-import torch.nn.functional as F
 from typing import Tuple, List, Optional
 import io
 import base64
 
+from cache import TTLCache
+
+
+# Side of the thumbnail dominant colors are computed from
+PALETTE_SAMPLE_SIZE = 64
+
+
+_cv2 = None
+
+
+def load_cv2():
+    """OpenCV, imported on first use to keep API startup fast (None if not installed)"""
+    global _cv2
+    if _cv2 is None:
+        try:
+            import cv2
+            _cv2 = cv2
+        except ImportError:
+            _cv2 = False  # Graceful fallback if OpenCV is not available
+    return _cv2 or None
+
+
+def median_cut(colors: np.ndarray, weights: np.ndarray, num_colors: int) -> np.ndarray:
+    """Weighted median cut: split the color boxes until there are ``num_colors``
+
+    ``colors`` is an (N, 3) array of distinct colors and ``weights`` their pixel
+    counts. The box with the most pixels times color range is split at the
+    weighted median of its widest channel. Returns box mean colors, most
+    pixels first.
+    """
+    boxes = [np.arange(len(colors))]
+    while len(boxes) < num_colors:
+        best, best_score, best_channel = None, 0.0, 0
+        for i, box in enumerate(boxes):
+            if len(box) < 2:
+                continue
+            ranges = np.ptp(colors[box], axis=0)
+            score = weights[box].sum() * ranges.max()
+            if score > best_score:
+                best, best_score, best_channel = i, score, int(ranges.argmax())
+        if best is None:
+            break  # Fewer distinct colors than requested
+        box = boxes.pop(best)
+        box = box[np.argsort(colors[box, best_channel], kind='stable')]
+        cumulative = np.cumsum(weights[box])
+        cut = int(np.searchsorted(cumulative, cumulative[-1] / 2))
+        cut = min(max(cut, 1), len(box) - 1)
+        boxes += [box[:cut], box[cut:]]
+    
+    totals = np.array([weights[box].sum() for box in boxes])
+    means = np.array([weights[box] @ colors[box] for box in boxes]) / totals[:, None]
+    return means[np.argsort(-totals, kind='stable')]
+
+
+def refine_palette(colors: np.ndarray, weights: np.ndarray, centers: np.ndarray,
+                   iterations: int = 4) -> np.ndarray:
+    """A few weighted k-means steps from ``centers`` over the histogram colors
+
+    Median cut can leave two clusters sharing a box; moving each center to
+    the mean of its nearest colors fixes that. Returns centers, most pixels first.
+    """
+    totals = np.zeros(len(centers))
+    for _ in range(iterations):
+        distances = ((colors[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+        nearest = distances.argmin(axis=1)
+        totals = np.bincount(nearest, weights=weights, minlength=len(centers))
+        sums = np.stack([np.bincount(nearest, weights=weights * colors[:, c], minlength=len(centers))
+                         for c in range(3)], axis=1)
+        occupied = totals > 0
+        centers = centers.copy()
+        centers[occupied] = sums[occupied] / totals[occupied, None]
+    return centers[np.argsort(-totals, kind='stable')]
+
+
+def palette_to_hex(colors: List[Tuple[int, int, int]]) -> List[str]:
+    """CSS hex strings (``#rrggbb``), the format stored in ``color_palette`` columns"""
+    return ['#%02x%02x%02x' % tuple(color) for color in colors]
+
 
 class AdvancedImageProcessor:
     """Advanced image processing for style transfer enhancement"""
     
     def __init__(self):
         self.supported_formats = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
+        # Palettes by image content hash (blob key or upload hash)
+        self.palette_cache = TTLCache(maxsize=4096, ttl=3600.0)
     
     def enhance_content_preservation(self, original: Image.Image, styled: Image.Image, 
                                    preservation_strength: float = 0.3) -> Image.Image:
@@ -29,6 +103,7 @@ class AdvancedImageProcessor:
         styled_array = np.array(styled.convert('RGB'))
         
         # Extract edges from original
+        cv2 = load_cv2()
         gray = cv2.cvtColor(orig_array, cv2.COLOR_RGB2GRAY)
         edges = cv2.Canny(gray, 50, 150)
         edges_3channel = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
@@ -57,6 +132,7 @@ class AdvancedImageProcessor:
         # Convert to numpy array
         img_array = np.array(image)
         
+        cv2 = load_cv2()
         if cv2 is not None:
             # Apply bilateral filter for oil painting effect
             oil_effect = cv2.bilateralFilter(img_array, 15, 80, 80)
@@ -175,8 +251,8 @@ class AdvancedImageProcessor:
         return grid_image
     
     def optimize_for_web(self, image: Image.Image, max_size: int = 1024,
-                        quality: int = 85) -> bytes:
-        """Optimize image for web delivery"""
+                        quality: int = 85, format: str = 'JPEG') -> bytes:
+        """Optimize image for web delivery (JPEG, WEBP or AVIF)"""
         # Resize if too large
         width, height = image.size
         if max(width, height) > max_size:
@@ -198,56 +274,55 @@ class AdvancedImageProcessor:
                 rgb_image.paste(image)
             image = rgb_image
         
-        # Save as JPEG with compression
+        # Save with compression
         output = io.BytesIO()
-        image.save(output, format='JPEG', quality=quality, optimize=True)
+        if format == 'JPEG':
+            image.save(output, format='JPEG', quality=quality, optimize=True)
+        elif format == 'WEBP':
+            image.save(output, format='WEBP', quality=quality, method=4)
+        else:
+            image.save(output, format=format, quality=quality)
         return output.getvalue()
     
     def extract_dominant_colors(self, image: Image.Image, num_colors: int = 5) -> List[Tuple[int, int, int]]:
-        """Extract dominant colors from image"""
-        try:
-            from sklearn.cluster import KMeans
-        except ImportError:
-            # Fallback: simple color sampling
-            image = image.resize((50, 50))
-            colors = []
-            for i in range(0, 50, 10):
-                for j in range(0, 50, 10):
-                    color = image.getpixel((i, j))
-                    if isinstance(color, tuple) and len(color) >= 3:
-                        colors.append(color[:3])
-            return colors[:num_colors]
-        
-        # Resize image for faster processing
-        image = image.resize((150, 150))
-        data = np.array(image.convert('RGB'))
-        data = data.reshape((-1, 3))
-        
-        # Use K-means clustering to find dominant colors
-        kmeans = KMeans(n_clusters=num_colors, random_state=42)
-        kmeans.fit(data)
-        
-        # Get the colors
-        colors = kmeans.cluster_centers_.astype(int)
-        return [tuple(color) for color in colors]
+        """Extract dominant colors from image, most common first"""
+        # A small thumbnail keeps the palette of the whole image at a fraction of the pixels
+        thumb = image.convert('RGB') if image.mode != 'RGB' else image
+        thumb = thumb.resize((PALETTE_SAMPLE_SIZE, PALETTE_SAMPLE_SIZE), Image.Resampling.BOX)
+        pixels = np.asarray(thumb).reshape(-1, 3)
+        
+        # Histogram over 15-bit colors; each occupied bin keeps its mean color and pixel count
+        bins = ((pixels[:, 0] >> 3).astype(np.int32) << 10) | ((pixels[:, 1] >> 3).astype(np.int32) << 5) | (pixels[:, 2] >> 3)
+        counts = np.bincount(bins, minlength=1 << 15)
+        occupied = np.flatnonzero(counts)
+        weights = counts[occupied].astype(np.float64)
+        colors = np.stack([np.bincount(bins, weights=pixels[:, c], minlength=1 << 15)[occupied]
+                           for c in range(3)], axis=1) / weights[:, None]
+        
+        palette = refine_palette(colors, weights, median_cut(colors, weights, num_colors))
+        return [tuple(int(round(v)) for v in color) for color in palette]
+    
+    def cached_dominant_colors(self, image: Image.Image, key: str, num_colors: int = 5) -> List[Tuple[int, int, int]]:
+        """``extract_dominant_colors`` memoized by ``key``, a hash of the image content"""
+        cache_key = (key, num_colors)
+        colors = self.palette_cache.get(cache_key)
+        if colors is None:
+            colors = self.extract_dominant_colors(image, num_colors)
+            self.palette_cache.set(cache_key, colors)
+        return colors
     
     def create_color_palette(self, image: Image.Image, palette_size: Tuple[int, int] = (300, 50)) -> Image.Image:
         """Create a color palette from dominant colors"""
         colors = self.extract_dominant_colors(image)
         
-        palette_img = Image.new('RGB', palette_size, 'white')
-        color_width = palette_size[0] // len(colors)
+        palette = np.full((palette_size[1], palette_size[0], 3), 255, dtype=np.uint8)
+        color_width = palette_size[0] // max(len(colors), 1)
         
         for i, color in enumerate(colors):
-            x1 = i * color_width
-            x2 = x1 + color_width
-            
             # Fill the section with the color
-            for x in range(x1, min(x2, palette_size[0])):
-                for y in range(palette_size[1]):
-                    palette_img.putpixel((x, y), color)
+            palette[:, i * color_width:(i + 1) * color_width] = color
         
-        return palette_img
+        return Image.fromarray(palette)
     
     def apply_texture_overlay(self, image: Image.Image, texture_type: str = "canvas") -> Image.Image:
         """Apply texture overlay to simulate different mediums"""
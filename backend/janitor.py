@@ -0,0 +1,227 @@
+"""
+Lifecycle management for temporary files
+
+Uploads, preview grids, batch results and generated images are written under
+one scratch directory (``TEMP_STORAGE_DIR``), one subdirectory per category.
+Every file is tracked with a category TTL; a background thread deletes
+expired files in small batches (so garbage collection never floods the disk
+with I/O) and, when the total size exceeds the quota, evicts the oldest
+files first. Temp files are served once, right after they are written, and
+never read back, so creation order is also use order. Files left behind by
+a previous process are picked up by a scan on start.
+"""
+
+import atexit
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+DEFAULT_TTLS = {
+    'uploads': 24 * 3600,
+    'previews': 600,
+    'batch': 3600,
+    'generated': 600,
+}
+
+
+class TempArtifact:
+    """A tracked temporary file"""
+
+    __slots__ = ('path', 'category', 'size', 'expires_at')
+
+    def __init__(self, path: str, category: str, size: int, expires_at: float):
+        self.path = path
+        self.category = category
+        self.size = size
+        self.expires_at = expires_at
+
+
+class StorageJanitor:
+    """Tracks temporary files and garbage-collects them in the background"""
+
+    def __init__(self, root: str, ttls: Dict[str, float] = None, quota_bytes: int = 2 * 1024 ** 3,
+                 interval: float = 60.0, batch_size: int = 100, batch_pause: float = 0.05):
+        self.root = root
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        # Ordered oldest first (by creation), so eviction pops from the front
+        self._artifacts: "OrderedDict[str, TempArtifact]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._atexit_registered = False
+        self._stats = {
+            'expired': 0,
+            'evicted': 0,
+            'bytes_freed': 0,
+            'delete_errors': 0,
+            'gc_runs': 0,
+            'last_gc_seconds': 0.0,
+        }
+
+    def path_for(self, category: str, name: str = None, suffix: str = '.jpg') -> str:
+        """A fresh path inside the category directory"""
+        if category not in self.ttls:
+            raise ValueError(f"Unknown temp category: {category}")
+        directory = os.path.join(self.root, category)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name or f"{uuid.uuid4().hex}{suffix}")
+
+    def write(self, category: str, save: Callable[[str], Any], name: str = None,
+              suffix: str = '.jpg') -> str:
+        """Write a file with ``save(path)`` and start tracking it; returns the path"""
+        path = self.path_for(category, name, suffix)
+        save(path)
+        self.track(path, category)
+        return path
+
+    def track(self, path: str, category: str, created_at: float = None):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        expires_at = (created_at or time.time()) + self.ttls[category]
+        with self._lock:
+            previous = self._artifacts.pop(path, None)
+            if previous is not None:
+                self._total_bytes -= previous.size
+            self._artifacts[path] = TempArtifact(path, category, size, expires_at)
+            self._total_bytes += size
+            over_quota = self._total_bytes > self.quota_bytes
+        if over_quota:
+            self._wake.set()
+
+    def scan(self) -> int:
+        """Track files already on disk (e.g. from a previous process)"""
+        found: List[Tuple[float, str, str]] = []
+        for category in self.ttls:
+            directory = os.path.join(self.root, category)
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        found.append((entry.stat().st_mtime, entry.path, category))
+                except OSError:
+                    continue
+        for mtime, path, category in sorted(found):
+            self.track(path, category, created_at=mtime)
+        return len(found)
+
+    def collect(self) -> Dict[str, int]:
+        """Delete expired files, then evict the oldest files until under quota"""
+        started = time.perf_counter()
+        now = time.time()
+        with self._lock:
+            expired = [a for a in self._artifacts.values() if a.expires_at <= now]
+            for artifact in expired:
+                del self._artifacts[artifact.path]
+                self._total_bytes -= artifact.size
+            evicted = []
+            while self._total_bytes > self.quota_bytes and self._artifacts:
+                _, artifact = self._artifacts.popitem(last=False)
+                self._total_bytes -= artifact.size
+                evicted.append(artifact)
+
+        freed = self._delete(expired) + self._delete(evicted)
+        with self._lock:
+            self._stats['expired'] += len(expired)
+            self._stats['evicted'] += len(evicted)
+            self._stats['bytes_freed'] += freed
+            self._stats['gc_runs'] += 1
+            self._stats['last_gc_seconds'] = time.perf_counter() - started
+        return {'expired': len(expired), 'evicted': len(evicted), 'bytes_freed': freed}
+
+    def _delete(self, artifacts: List[TempArtifact]) -> int:
+        freed = 0
+        for i, artifact in enumerate(artifacts):
+            if i and i % self.batch_size == 0:
+                # Spread large collections out instead of saturating the disk
+                time.sleep(self.batch_pause)
+            try:
+                os.unlink(artifact.path)
+                freed += artifact.size
+            except FileNotFoundError:
+                pass
+            except OSError:
+                with self._lock:
+                    self._stats['delete_errors'] += 1
+        return freed
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="temp-storage-janitor", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def close(self):
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            self._wake.set()
+            thread.join(5.0)
+            self._thread = None
+
+    def _run(self):
+        self.scan()
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Temp storage collection failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            categories: Dict[str, Dict[str, int]] = {}
+            for artifact in self._artifacts.values():
+                entry = categories.setdefault(artifact.category, {'files': 0, 'bytes': 0})
+                entry['files'] += 1
+                entry['bytes'] += artifact.size
+            result = dict(self._stats, files=len(self._artifacts), bytes=self._total_bytes,
+                          quota_bytes=self.quota_bytes, categories=categories)
+        try:
+            result['disk_free_bytes'] = shutil.disk_usage(self.root).free
+        except OSError:
+            pass
+        return result
+
+
+def create_storage_janitor() -> StorageJanitor:
+    """Build a janitor configured from the TEMP_* environment variables"""
+    ttls = {}
+    for category in DEFAULT_TTLS:
+        value = os.getenv(f"TEMP_TTL_{category.upper()}")
+        if value:
+            ttls[category] = float(value)
+    return StorageJanitor(
+        root=os.getenv("TEMP_STORAGE_DIR", "/tmp/style-studio"),
+        ttls=ttls,
+        quota_bytes=int(float(os.getenv("TEMP_STORAGE_QUOTA_MB", "2048")) * 1024 * 1024),
+        interval=float(os.getenv("TEMP_GC_INTERVAL", "60")),
+        batch_size=int(os.getenv("TEMP_GC_BATCH_SIZE", "100")),
+    )
+
+
+# Global temp storage janitor
+temp_storage = create_storage_janitor()
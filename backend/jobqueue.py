@@ -0,0 +1,539 @@
+"""
+Job queue for running inference outside the API process
+
+The API enqueues jobs and worker processes consume them (``python
+worker.py``), on the same node or on others, so inference capacity scales
+independently of API nodes. Job inputs and outputs are not stored in the
+queue. They go through the blob store, which every node can reach: the
+payload names input blob keys, and a finished job's result names the
+result blob.
+
+Delivery is at least once:
+
+- ``claim`` leases a job for a visibility timeout. Workers ``extend`` the
+  lease while they run, and a job whose lease expires (its worker died)
+  becomes claimable again.
+- A failed attempt is retried with exponential backoff until
+  ``max_attempts``, then the job is marked ``failed``.
+- ``extend``/``complete``/``fail`` only apply while the caller's lease has
+  not expired, so a reclaimed job is finished once.
+
+Finished jobs are kept for a retention period, then ``purge`` deletes them.
+It also returns the job inputs (``payload['input_keys']``) that no remaining
+job refers to, so the caller can delete those blobs.
+
+Backends, selected by ``JOB_QUEUE_URL``:
+
+- ``sqlite:///data/jobs.db`` (default): single node; workers are local
+  processes sharing the file
+- ``memory://``: in-process, for a single process and for tests
+
+Another backend (e.g. a Redis or SQS stand-in) implements ``JobQueue``.
+
+Worker outcomes, including queue backend errors in the worker loop
+(``errors``), are counted in ``JobWorker.stats()`` and exported as
+``style_transfer_job_outcomes_total``, so a worker stuck in a failure loop
+shows up in ``/metrics``.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import registry
+from storage import SQLiteBackend
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class PermanentJobError(Exception):
+    """A job failure that retrying cannot fix (e.g. invalid input)"""
+
+
+class Job:
+    """A job and its current state"""
+
+    def __init__(self, id: str, kind: str, payload: Dict[str, Any], tenant: Optional[str] = None,
+                 priority: int = 0, status: str = QUEUED, attempts: int = 0, max_attempts: int = 3,
+                 available_at: float = 0.0, lease_token: Optional[str] = None,
+                 lease_expires: Optional[float] = None, worker: Optional[str] = None,
+                 result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                 created_at: float = 0.0, updated_at: float = 0.0):
+        self.id = id
+        self.kind = kind
+        self.payload = payload
+        self.tenant = tenant
+        self.priority = priority
+        self.status = status
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+        self.available_at = available_at
+        self.lease_token = lease_token
+        self.lease_expires = lease_expires
+        self.worker = worker
+        self.result = result
+        self.error = error
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Public view (no payload or lease details)"""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+        }
+
+
+def retry_delay(attempts: int, base: float = 2.0, cap: float = 300.0) -> float:
+    """Exponential backoff before the next attempt"""
+    return min(cap, base ** attempts)
+
+
+class JobQueue(ABC):
+    """Interface every queue backend implements"""
+
+    @abstractmethod
+    def enqueue(self, kind: str, payload: Dict[str, Any], tenant: str = None,
+                priority: int = 0, max_attempts: int = 3) -> Job:
+        """Add a job; lower ``priority`` values are claimed first"""
+
+    @abstractmethod
+    def claim(self, worker: str, visibility_timeout: float, kinds: List[str] = None) -> Optional[Job]:
+        """Lease the next available job, or return None"""
+
+    @abstractmethod
+    def extend(self, job: Job, visibility_timeout: float) -> bool:
+        """Push the lease expiry out; False if the lease was lost"""
+
+    @abstractmethod
+    def complete(self, job: Job, result: Dict[str, Any]) -> bool:
+        """Mark a leased job succeeded; False if the lease was lost"""
+
+    @abstractmethod
+    def fail(self, job: Job, error: str, retry: bool = True) -> bool:
+        """Record a failed attempt; requeued with backoff unless out of attempts"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """Current state of a job"""
+
+    @abstractmethod
+    def purge(self, finished_before: float, limit: int = 1000) -> List[str]:
+        """Delete up to ``limit`` jobs that finished before ``finished_before``
+
+        Returns the input keys of the deleted jobs that no remaining job lists.
+        """
+
+    def init(self):
+        """Create whatever storage the backend needs (called at startup)"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self):
+        pass
+
+
+class MemoryJobQueue(JobQueue):
+    """Jobs in a dict; visible to this process only"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], tenant: str = None,
+                priority: int = 0, max_attempts: int = 3) -> Job:
+        now = time.time()
+        job = Job(uuid.uuid4().hex, kind, payload, tenant, priority, max_attempts=max_attempts,
+                  available_at=now, created_at=now, updated_at=now)
+        with self._lock:
+            self._jobs[job.id] = job
+        return self._copy(job)
+
+    def claim(self, worker: str, visibility_timeout: float, kinds: List[str] = None) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            candidates = []
+            for job in self._jobs.values():
+                if kinds and job.kind not in kinds:
+                    continue
+                if job.status == RUNNING and job.lease_expires <= now:
+                    if job.attempts >= job.max_attempts:
+                        self._finish(job, FAILED, error="Lease expired on the last attempt", now=now)
+                        continue
+                elif not (job.status == QUEUED and job.available_at <= now):
+                    continue
+                candidates.append(job)
+            if not candidates:
+                return None
+            job = min(candidates, key=lambda j: (j.priority, j.available_at, j.created_at))
+            job.status = RUNNING
+            job.attempts += 1
+            job.worker = worker
+            job.lease_token = uuid.uuid4().hex
+            job.lease_expires = now + visibility_timeout
+            job.updated_at = now
+            return self._copy(job)
+
+    def _leased(self, job: Job) -> Optional[Job]:
+        current = self._jobs.get(job.id)
+        if (current is None or current.status != RUNNING or current.lease_token != job.lease_token
+                or current.lease_expires <= time.time()):
+            return None
+        return current
+
+    def _finish(self, job: Job, status: str, result: Dict[str, Any] = None, error: str = None, now: float = None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.lease_token = None
+        job.lease_expires = None
+        job.updated_at = now or time.time()
+
+    def extend(self, job: Job, visibility_timeout: float) -> bool:
+        with self._lock:
+            current = self._leased(job)
+            if current is None:
+                return False
+            current.lease_expires = time.time() + visibility_timeout
+            return True
+
+    def complete(self, job: Job, result: Dict[str, Any]) -> bool:
+        with self._lock:
+            current = self._leased(job)
+            if current is None:
+                return False
+            self._finish(current, SUCCEEDED, result=result)
+            return True
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> bool:
+        with self._lock:
+            current = self._leased(job)
+            if current is None:
+                return False
+            if retry and current.attempts < current.max_attempts:
+                current.status = QUEUED
+                current.error = error
+                current.lease_token = None
+                current.lease_expires = None
+                current.updated_at = time.time()
+                current.available_at = current.updated_at + retry_delay(current.attempts)
+            else:
+                self._finish(current, FAILED, error=error)
+            return True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._copy(job) if job is not None else None
+
+    def purge(self, finished_before: float, limit: int = 1000) -> List[str]:
+        with self._lock:
+            purged = [job for job in self._jobs.values()
+                      if job.status in (SUCCEEDED, FAILED) and job.updated_at < finished_before][:limit]
+            for job in purged:
+                del self._jobs[job.id]
+            in_use = {key for job in self._jobs.values() for key in job.payload.get('input_keys', ())}
+        return sorted({key for job in purged for key in job.payload.get('input_keys', ())} - in_use)
+
+    @staticmethod
+    def _copy(job: Job) -> Job:
+        return Job(**vars(job))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {'backend': 'memory', 'jobs': counts}
+
+
+JOB_COLUMNS = ('id', 'kind', 'payload', 'tenant', 'priority', 'status', 'attempts', 'max_attempts',
+               'available_at', 'lease_token', 'lease_expires', 'worker', 'result', 'error',
+               'created_at', 'updated_at')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    tenant TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    available_at REAL NOT NULL,
+    lease_token TEXT,
+    lease_expires REAL,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queued ON jobs (status, priority, available_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_leases ON jobs (status, lease_expires);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (status, updated_at);
+"""
+
+
+class SQLiteJobQueue(JobQueue):
+    """Jobs in a SQLite file shared by the API and local worker processes
+
+    Claims run in ``BEGIN IMMEDIATE`` transactions, so concurrent workers
+    never lease the same job.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self.backend = SQLiteBackend(path, pool_size=pool_size)
+
+    def init(self):
+        with self.backend.connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def _row_to_job(row) -> Job:
+        values = dict(zip(JOB_COLUMNS, row))
+        values['payload'] = json.loads(values['payload'])
+        values['result'] = json.loads(values['result']) if values['result'] else None
+        return Job(**values)
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], tenant: str = None,
+                priority: int = 0, max_attempts: int = 3) -> Job:
+        now = time.time()
+        job = Job(uuid.uuid4().hex, kind, payload, tenant, priority, max_attempts=max_attempts,
+                  available_at=now, created_at=now, updated_at=now)
+        with self.backend.connection() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, payload, tenant, priority, status, attempts, max_attempts, "
+                "available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (job.id, kind, json.dumps(payload), tenant, priority, QUEUED, max_attempts, now, now, now))
+        return job
+
+    def claim(self, worker: str, visibility_timeout: float, kinds: List[str] = None) -> Optional[Job]:
+        now = time.time()
+        kind_filter, kind_args = "", []
+        if kinds:
+            kind_filter = f" AND kind IN ({','.join('?' * len(kinds))})"
+            kind_args = list(kinds)
+        with self.backend.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Expired leases on their last attempt will not be retried
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = 'Lease expired on the last attempt', lease_token = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE status = ? AND lease_expires <= ? "
+                "AND attempts >= max_attempts",
+                (FAILED, now, RUNNING, now))
+            row = conn.execute(
+                f"SELECT id FROM jobs WHERE ((status = ? AND available_at <= ?) "
+                f"OR (status = ? AND lease_expires <= ?)){kind_filter} "
+                f"ORDER BY priority, available_at, created_at LIMIT 1",
+                [QUEUED, now, RUNNING, now] + kind_args).fetchone()
+            if row is None:
+                return None
+            token = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, worker = ?, lease_token = ?, "
+                "lease_expires = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, worker, token, now + visibility_timeout, now, row[0]))
+            claimed = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (row[0],)).fetchone()
+        return self._row_to_job(claimed)
+
+    def _update_leased(self, job: Job, assignments: str, args: tuple) -> bool:
+        now = time.time()
+        with self.backend.connection() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND status = ? AND lease_token = ? "
+                f"AND lease_expires > ?",
+                args + (now, job.id, RUNNING, job.lease_token, now))
+            return cursor.rowcount == 1
+
+    def extend(self, job: Job, visibility_timeout: float) -> bool:
+        return self._update_leased(job, "lease_expires = ?", (time.time() + visibility_timeout,))
+
+    def complete(self, job: Job, result: Dict[str, Any]) -> bool:
+        return self._update_leased(
+            job, "status = ?, result = ?, error = NULL, lease_token = NULL, lease_expires = NULL",
+            (SUCCEEDED, json.dumps(result)))
+
+    def fail(self, job: Job, error: str, retry: bool = True) -> bool:
+        if retry and job.attempts < job.max_attempts:
+            return self._update_leased(
+                job, "status = ?, error = ?, available_at = ?, lease_token = NULL, lease_expires = NULL",
+                (QUEUED, error, time.time() + retry_delay(job.attempts)))
+        return self._update_leased(
+            job, "status = ?, error = ?, lease_token = NULL, lease_expires = NULL", (FAILED, error))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.backend.connection() as conn:
+            row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row is not None else None
+
+    def purge(self, finished_before: float, limit: int = 1000) -> List[str]:
+        with self.backend.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, payload FROM jobs WHERE status IN (?, ?) AND updated_at < ? LIMIT ?",
+                (SUCCEEDED, FAILED, finished_before, limit)).fetchall()
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(row[0],) for row in rows])
+            keys = {key for _, payload in rows for key in json.loads(payload).get('input_keys', ())}
+            unused = [key for key in sorted(keys) if conn.execute(
+                "SELECT 1 FROM jobs, json_each(jobs.payload, '$.input_keys') WHERE json_each.value = ? LIMIT 1",
+                (key,)).fetchone() is None]
+        return unused
+
+    def stats(self) -> Dict[str, Any]:
+        with self.backend.connection() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {'backend': 'sqlite', 'path': self.backend.path, 'jobs': counts}
+
+    def close(self):
+        self.backend.close()
+
+
+def create_job_queue(url: str = None) -> JobQueue:
+    """Build a queue from a JOB_QUEUE_URL such as ``sqlite:///data/jobs.db``"""
+    url = url or os.getenv("JOB_QUEUE_URL", "sqlite:///data/jobs.db")
+    if url.startswith("memory://"):
+        return MemoryJobQueue()
+    if url.startswith("sqlite:///"):
+        return SQLiteJobQueue(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported JOB_QUEUE_URL: {url}")
+
+
+JOB_OUTCOMES = registry.counter(
+    'style_transfer_job_outcomes_total', 'Queued job attempts and worker loop errors by outcome',
+    ('outcome',))
+
+
+class JobWorker:
+    """Claims jobs and runs their handlers, keeping the lease alive while a handler runs
+
+    ``handlers`` maps job kinds to callables taking the payload and returning
+    the result dict. ``run_job`` wraps each call (e.g. to run it through the
+    inference scheduler). A handler raising ``PermanentJobError`` is not retried.
+
+    With a ``retention`` (seconds), the worker also purges jobs finished longer
+    ago than that, at most every ``purge_interval``, and passes the freed input
+    keys to ``cleanup``.
+    """
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]],
+                 worker_id: str = None, visibility_timeout: float = 120.0, poll_interval: float = 1.0,
+                 run_job: Callable[[Job, Callable[[], Dict[str, Any]]], Dict[str, Any]] = None,
+                 retention: float = None, cleanup: Callable[[List[str]], None] = None,
+                 purge_interval: float = 300.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.run_job = run_job or (lambda job, call: call())
+        self.retention = retention
+        self.cleanup = cleanup
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._counts = {SUCCEEDED: 0, FAILED: 0, 'retried': 0, 'lost': 0, 'errors': 0, 'purged_inputs': 0}
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self._counts[outcome] += 1
+        JOB_OUTCOMES.inc(outcome=outcome)
+
+    def run_once(self) -> bool:
+        """Process one job if one is available; returns whether a job was claimed"""
+        job = self.queue.claim(self.worker_id, self.visibility_timeout, list(self.handlers))
+        if job is None:
+            return False
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, heartbeat_stop),
+                                     name=f"job-heartbeat-{job.id[:8]}", daemon=True)
+        heartbeat.start()
+        try:
+            result = self.run_job(job, lambda: self.handlers[job.kind](job.payload))
+        except PermanentJobError as e:
+            outcome = FAILED if self.queue.fail(job, str(e), retry=False) else 'lost'
+        except Exception as e:
+            retry = job.attempts < job.max_attempts
+            recorded = self.queue.fail(job, f"{type(e).__name__}: {e}")
+            outcome = ('retried' if retry else FAILED) if recorded else 'lost'
+        else:
+            outcome = SUCCEEDED if self.queue.complete(job, result) else 'lost'
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+        self._count(outcome)
+        return True
+
+    def _heartbeat(self, job: Job, stop: threading.Event):
+        while not stop.wait(self.visibility_timeout / 3):
+            if not self.queue.extend(job, self.visibility_timeout):
+                return
+
+    def purge(self) -> List[str]:
+        """Drop jobs past the retention period and clean up their inputs (if due)"""
+        now = time.time()
+        with self._lock:
+            if self.retention is None or now < self._next_purge:
+                return []
+            self._next_purge = now + self.purge_interval
+        keys = self.queue.purge(now - self.retention)
+        if keys and self.cleanup is not None:
+            self.cleanup(keys)
+        with self._lock:
+            self._counts['purged_inputs'] += len(keys)
+        return keys
+
+    def run(self, once: bool = False):
+        """Process jobs until ``stop()`` (or, with ``once``, until the queue is empty)"""
+        while not self._stop.is_set():
+            try:
+                self.purge()
+                claimed = self.run_once()
+            except Exception as e:
+                # Queue backend errors: back off and keep the worker alive
+                self._count('errors')
+                with self._lock:
+                    self._last_error = f"{type(e).__name__}: {e}"
+                print(f"Job worker {self.worker_id}: {e}")
+                claimed = False
+            if not claimed:
+                if once:
+                    return
+                self._stop.wait(self.poll_interval)
+
+    def start(self, threads: int = 1):
+        for i in range(threads):
+            thread = threading.Thread(target=self.run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'worker_id': self.worker_id, 'threads': len(self._threads), **self._counts,
+                    'last_error': self._last_error}
@@ -0,0 +1,340 @@
+"""
+HTTP load test for the AI Style Transfer Studio API
+
+Drives a weighted mix of requests (style transfer, preset listing, login,
+batch and preview) at one or more concurrency levels and reports throughput,
+latency percentiles and error rates per endpoint, plus a per-second time
+series of completed requests, outstanding requests and the server's
+``style_transfer_in_flight`` gauge. Rate-limited (429) responses are reported
+as their own rate and left out of the latency percentiles.
+
+By default the app runs in-process (through httpx's ASGI transport) with the
+stub model, so no server, GPU or model download is needed:
+
+    python loadtest.py --concurrency 1,4,16 --duration 30 --output load.json
+
+Against a running deployment:
+
+    python loadtest.py --url http://localhost:8000 --concurrency 8
+
+Run the in-process mode against a scratch DATABASE_URL / BLOB_STORE_ROOT to
+keep test data out of the real database.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+
+DEFAULT_MIX = "style_transfer=6,presets=3,token=1,batch=0.5,preview=0.5"
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    return mix
+
+
+def make_image(size: int, seed: int) -> bytes:
+    """A noisy JPEG with a seeded tint, so different seeds give different bytes"""
+    rng = random.Random(seed)
+    noise = Image.effect_noise((size, size), 48).convert('RGB')
+    tint = Image.new('RGB', (size, size), tuple(rng.randrange(256) for _ in range(3)))
+    output = io.BytesIO()
+    Image.blend(noise, tint, 0.5).save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+class Workload:
+    """Pre-encoded request payloads"""
+
+    def __init__(self, sizes: List[int], preset_reuse: float, preset_pool: int = 4,
+                 content_pool: int = 8, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.sizes = sizes
+        self.preset_reuse = preset_reuse
+        self.content = {size: [make_image(size, seed + i) for i in range(content_pool)] for size in sizes}
+        # A few style images shared across requests, like presets picked from the catalog
+        self.presets = [make_image(512, 10_000 + seed + i) for i in range(preset_pool)]
+        self._fresh = 0
+
+    def content_image(self) -> Tuple[int, bytes]:
+        size = self.rng.choice(self.sizes)
+        return size, self.rng.choice(self.content[size])
+
+    def style_image(self) -> Tuple[Optional[int], bytes]:
+        """(preset_id, bytes); a fresh upload when the request does not reuse a preset"""
+        if self.rng.random() < self.preset_reuse:
+            index = self.rng.randrange(len(self.presets))
+            return index + 1, self.presets[index]
+        self._fresh += 1
+        return None, make_image(256, 20_000 + self._fresh)
+
+
+async def scenario_style_transfer(client: httpx.AsyncClient, ctx: "RunContext") -> httpx.Response:
+    _, content = ctx.workload.content_image()
+    preset_id, style = ctx.workload.style_image()
+    params = {'model_type': ctx.rng.choice(ctx.models)}
+    if preset_id is not None:
+        params['preset_id'] = preset_id
+    return await client.post('/api/v1/style-transfer', params=params, headers=ctx.auth,
+                             files={'content': ('content.jpg', content, 'image/jpeg'),
+                                    'style': ('style.jpg', style, 'image/jpeg')})
+
+
+async def scenario_presets(client: httpx.AsyncClient, ctx: "RunContext") -> httpx.Response:
+    headers = {}
+    if ctx.presets_etag and ctx.rng.random() < 0.5:
+        # Half the clients revalidate a cached listing
+        headers['If-None-Match'] = ctx.presets_etag
+    response = await client.get('/api/v1/presets', headers=headers)
+    ctx.presets_etag = response.headers.get('etag', ctx.presets_etag)
+    return response
+
+
+async def scenario_token(client: httpx.AsyncClient, ctx: "RunContext") -> httpx.Response:
+    return await client.post('/api/v1/token', data={'username': ctx.username, 'password': ctx.password})
+
+
+async def scenario_batch(client: httpx.AsyncClient, ctx: "RunContext") -> httpx.Response:
+    files = [('files', (f'content{i}.jpg', ctx.workload.content_image()[1], 'image/jpeg')) for i in range(3)]
+    files.append(('style', ('style.jpg', ctx.workload.style_image()[1], 'image/jpeg')))
+    return await client.post('/api/v1/style-transfer-batch', params={'model_type': ctx.models[0]},
+                             files=files)
+
+
+async def scenario_preview(client: httpx.AsyncClient, ctx: "RunContext") -> httpx.Response:
+    _, content = ctx.workload.content_image()
+    return await client.post('/api/v1/style-preview',
+                             files={'content': ('content.jpg', content, 'image/jpeg')})
+
+
+SCENARIOS = {
+    'style_transfer': scenario_style_transfer,
+    'presets': scenario_presets,
+    'token': scenario_token,
+    'batch': scenario_batch,
+    'preview': scenario_preview,
+}
+
+
+class RunContext:
+    """Shared state of one load stage"""
+
+    def __init__(self, workload: Workload, mix: Dict[str, float], models: List[str],
+                 username: str, password: str, seed: int):
+        self.workload = workload
+        self.mix = mix
+        self.models = models
+        self.username = username
+        self.password = password
+        self.rng = random.Random(seed)
+        self.auth: Dict[str, str] = {}
+        self.presets_etag: Optional[str] = None
+        self.outstanding = 0
+        # scenario -> list of (latency seconds, status code or 0 for transport errors)
+        self.samples: Dict[str, List[Tuple[float, int]]] = defaultdict(list)
+        self.completed_at: List[float] = []
+
+    def pick(self) -> str:
+        names = list(self.mix)
+        return self.rng.choices(names, weights=[self.mix[n] for n in names])[0]
+
+
+async def login(client: httpx.AsyncClient, ctx: RunContext):
+    response = await scenario_token(client, ctx)
+    response.raise_for_status()
+    ctx.auth = {'Authorization': f"Bearer {response.json()['access_token']}"}
+
+
+async def worker(client: httpx.AsyncClient, ctx: RunContext, deadline: float):
+    while time.monotonic() < deadline:
+        name = ctx.pick()
+        ctx.outstanding += 1
+        started = time.perf_counter()
+        try:
+            status = (await SCENARIOS[name](client, ctx)).status_code
+        except httpx.HTTPError:
+            status = 0
+        finally:
+            ctx.outstanding -= 1
+        ctx.samples[name].append((time.perf_counter() - started, status))
+        ctx.completed_at.append(time.monotonic())
+
+
+async def scrape_in_flight(client: httpx.AsyncClient) -> Optional[float]:
+    try:
+        response = await client.get('/metrics')
+    except httpx.HTTPError:
+        return None
+    for line in response.text.splitlines():
+        if line.startswith('style_transfer_in_flight'):
+            return float(line.split()[-1])
+    return None
+
+
+async def sampler(client: httpx.AsyncClient, ctx: RunContext, started: float, deadline: float,
+                  interval: float, timeline: List[Dict[str, Any]]):
+    last_completed = 0
+    while time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+        completed = len(ctx.completed_at)
+        timeline.append({
+            't': round(time.monotonic() - started, 2),
+            'completed': completed - last_completed,
+            'outstanding': ctx.outstanding,
+            'server_in_flight': await scrape_in_flight(client),
+        })
+        last_completed = completed
+
+
+def summarize(samples: List[Tuple[float, int]], duration: float) -> Dict[str, Any]:
+    statuses = Counter(status for _, status in samples)
+    errors = sum(count for status, count in statuses.items() if status == 0 or status >= 500)
+    rate_limited = statuses.get(429, 0)
+    # Rejections return in a few ms; they would hide the latency of the work actually done
+    latencies = sorted(latency for latency, status in samples if status != 429) or \
+        sorted(latency for latency, _ in samples)
+
+    def percentile(p: float) -> float:
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 2)
+
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / duration, 2),
+        'p50_ms': percentile(0.50),
+        'p90_ms': percentile(0.90),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1] * 1000, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'error_rate': round(errors / len(samples), 4),
+        'rate_limited_rate': round(rate_limited / len(samples), 4),
+        'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+async def run_stage(client: httpx.AsyncClient, args: argparse.Namespace, concurrency: int,
+                    workload: Workload) -> Dict[str, Any]:
+    ctx = RunContext(workload, args.mix, args.models, args.username, args.password, args.seed)
+    await login(client, ctx)
+    timeline: List[Dict[str, Any]] = []
+    started = time.monotonic()
+    deadline = started + args.duration
+    await asyncio.gather(
+        sampler(client, ctx, started, deadline, args.sample_interval, timeline),
+        *(worker(client, ctx, deadline) for _ in range(concurrency)),
+    )
+    duration = time.monotonic() - started
+    all_samples = [sample for samples in ctx.samples.values() for sample in samples]
+    result = {
+        'concurrency': concurrency,
+        'duration_s': round(duration, 2),
+        'overall': summarize(all_samples, duration) if all_samples else {},
+        'endpoints': {name: summarize(samples, duration) for name, samples in sorted(ctx.samples.items())},
+        'timeline': timeline,
+    }
+    overall = result['overall']
+    if overall:
+        print(f"concurrency {concurrency:4d}: {overall['throughput_rps']:8.2f} req/s  "
+              f"p50 {overall['p50_ms']:8.1f} ms  p99 {overall['p99_ms']:8.1f} ms  "
+              f"errors {overall['error_rate']:.2%}  rate limited {overall['rate_limited_rate']:.2%}", flush=True)
+    return result
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float):
+    """Poll the readiness endpoint so model warm-up is not part of the measurement"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/api/v1/ready")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Server not ready after {timeout:.0f}s")
+        await asyncio.sleep(0.2)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workload = Workload(args.sizes, args.preset_reuse, seed=args.seed)
+    stages = []
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            await wait_ready(client, args.ready_timeout)
+            for concurrency in args.concurrency:
+                stages.append(await run_stage(client, args, concurrency, workload))
+    else:
+        os.environ.setdefault("STYLE_MODEL_STUB", "1")
+        # One test user drives all the traffic; per-tenant limits would reject most of it
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+        from app import app  # Imported late so the stub setting applies
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest",
+                                         timeout=args.timeout) as client:
+                await wait_ready(client, args.ready_timeout)
+                for concurrency in args.concurrency:
+                    stages.append(await run_stage(client, args, concurrency, workload))
+    return {
+        'target': args.url or 'in-process',
+        'stub_model': None if args.url else os.environ.get("STYLE_MODEL_STUB"),
+        'rate_limit_enabled': None if args.url else os.environ.get("RATE_LIMIT_ENABLED"),
+        'config': {
+            'mix': args.mix, 'sizes': args.sizes, 'preset_reuse': args.preset_reuse,
+            'models': args.models, 'duration_s': args.duration, 'seed': args.seed,
+        },
+        'stages': stages,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load test the style transfer API")
+    parser.add_argument('--url', help="Base URL of a running server (default: in-process app with the stub model)")
+    parser.add_argument('--concurrency', type=lambda s: [int(c) for c in s.split(',')], default=[4],
+                        help="Comma separated concurrency levels, run one after another")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per concurrency level")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Scenario weights (default: {DEFAULT_MIX})")
+    parser.add_argument('--sizes', type=lambda s: [int(c) for c in s.split(',')], default=[256, 512, 1024],
+                        help="Content image sizes to draw from")
+    parser.add_argument('--preset-reuse', type=float, default=0.8,
+                        help="Fraction of style transfers that reuse a preset style image")
+    parser.add_argument('--models', type=lambda s: s.split(','), default=['adain'])
+    parser.add_argument('--username', default="test@example.com")
+    parser.add_argument('--password', default="testpassword")
+    parser.add_argument('--sample-interval', type=float, default=1.0)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--ready-timeout', type=float, default=300.0, help="Seconds to wait for /api/v1/ready")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the JSON report here")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    report = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote report to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
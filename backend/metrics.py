@@ -0,0 +1,307 @@
+"""
+Prometheus metrics for the AI Style Transfer Studio
+
+A small self-contained registry (counters, gauges and histograms) rendered
+in the Prometheus text exposition format, plus ``StageTimer`` for breaking a
+request down into named stages. Stage durations feed the
+``style_transfer_stage_seconds`` histogram and can be echoed back to the
+client as a ``Server-Timing`` header.
+"""
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Seconds; covers sub-millisecond stages up to slow CPU inference
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+RESOLUTION_BUCKETS = (256, 512, 768, 1024)
+
+
+def resolution_bucket(size: Tuple[int, int]) -> str:
+    """Label for an image size: the smallest bucket that holds its longest side"""
+    longest = max(size)
+    for bucket in RESOLUTION_BUCKETS:
+        if longest <= bucket:
+            return str(bucket)
+    return f"gt{RESOLUTION_BUCKETS[-1]}"
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metric(ABC):
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """Sample lines in the exposition format"""
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        if not self.labelnames:
+            self._values[()] = 0.0
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # label values -> [bucket counts..., sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class BoundedLabels:
+    """Caps the distinct values of a label; values past ``max_values`` share ``other``
+
+    Keeps open-ended label values (tenants, client addresses) from creating
+    unbounded series.
+    """
+
+    def __init__(self, max_values: int, other: str = 'other'):
+        self.max_values = max_values
+        self.other = other
+        self._values = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, value: str) -> str:
+        if value in self._values:
+            return value
+        with self._lock:
+            if len(self._values) < self.max_values:
+                self._values.add(value)
+                return value
+        return self.other
+
+
+class TopCounter:
+    """Per-key totals that keep only the largest ``max_keys`` keys"""
+
+    def __init__(self, max_keys: int = 1000):
+        self.max_keys = max_keys
+        self._totals: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, key: str, amount: float = 1.0):
+        with self._lock:
+            self._totals[key] = self._totals.get(key, 0.0) + amount
+            if len(self._totals) > self.max_keys:
+                # Drop the smaller half at once so pruning stays rare
+                keep = sorted(self._totals.items(), key=lambda item: item[1], reverse=True)
+                self._totals = dict(keep[:self.max_keys // 2])
+
+    def top(self, n: int = 10) -> List[Tuple[str, float]]:
+        with self._lock:
+            return sorted(self._totals.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them for scraping"""
+
+    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> bytes:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class StageTimer:
+    """Times the named stages of one request
+
+    Stages may repeat (their durations add up) and are reported in the order
+    they first ran.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        """Record time measured elsewhere (e.g. waiting in a queue) as a stage"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def observe(self, histogram: Histogram, **labels):
+        for name, seconds in self.stages.items():
+            histogram.observe(seconds, stage=name, **labels)
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """``Server-Timing`` header value (durations in milliseconds)"""
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={(self.elapsed if total is None else total) * 1000:.2f}")
+        return ', '.join(entries)
+
+
+# Global registry and style transfer metrics
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'style_transfer_stage_seconds', 'Time spent in each style transfer stage',
+    ('stage', 'model_type', 'resolution'))
+REQUEST_SECONDS = registry.histogram(
+    'style_transfer_request_seconds', 'End-to-end style transfer handler time',
+    ('model_type', 'resolution'))
+REQUESTS_TOTAL = registry.counter(
+    'style_transfer_requests_total', 'Style transfer requests by outcome',
+    ('model_type', 'status'))
+IN_FLIGHT = registry.gauge(
+    'style_transfer_in_flight', 'Style transfer requests currently being processed')
+
+# Users that get their own label on per-tenant metrics; the rest are counted as 'other'
+_user_tenant_labels = BoundedLabels(int(os.getenv("METRICS_MAX_TENANTS", "20")))
+
+
+def tenant_label(tenant: str) -> str:
+    """Metric label for a tenant; unauthenticated clients (``ip:...``) share ``anonymous``"""
+    if tenant.startswith('ip:'):
+        return 'anonymous'
+    return _user_tenant_labels(tenant)
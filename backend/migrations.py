@@ -0,0 +1,392 @@
+"""
+Versioned schema migrations for the AI Style Transfer Studio database
+
+The schema version is tracked with SQLite's ``PRAGMA user_version``. Each
+migration runs in its own transaction and bumps the version when it
+commits, so a database only ever moves forward one complete step at a time.
+Databases created before migrations existed report version 0; migration 1
+uses ``IF NOT EXISTS`` so it adopts their tables unchanged.
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+from typing import Callable, List, Sequence, Union
+
+import rollups
+
+
+Step = Union[str, Callable[[sqlite3.Cursor], None]]
+
+
+class Migration:
+    """A numbered schema change made of SQL statements and/or Python steps"""
+
+    def __init__(self, version: int, description: str, steps: Sequence[Step]):
+        self.version = version
+        self.description = description
+        self.steps = list(steps)
+
+    def apply(self, cursor: sqlite3.Cursor):
+        for step in self.steps:
+            if callable(step):
+                step(cursor)
+            else:
+                cursor.execute(step)
+
+
+def import_legacy_users(cursor: sqlite3.Cursor, legacy_path: str = None):
+    """Copy accounts from the old auth-only users.db into the main users table
+
+    Users that already exist (same email or username) are left untouched.
+    The legacy file is looked up next to the main database by default.
+    """
+    if legacy_path is None:
+        main_path = next((row[2] for row in cursor.execute("PRAGMA database_list")
+                          if row[1] == "main"), "")
+        if not main_path:
+            return
+        legacy_path = os.path.join(os.path.dirname(main_path), "users.db")
+    if not os.path.exists(legacy_path):
+        return
+
+    legacy = sqlite3.connect(legacy_path)
+    try:
+        rows = legacy.execute("""
+            SELECT email, username, full_name, hashed_password, is_active, created_at, last_login
+            FROM users ORDER BY id
+        """).fetchall()
+    except sqlite3.Error:
+        rows = []
+    finally:
+        legacy.close()
+
+    for row in rows:
+        cursor.execute("""
+            INSERT INTO users
+            (email, username, full_name, hashed_password, is_active, created_at, last_login)
+            SELECT ?, ?, ?, ?, ?, ?, ?
+            WHERE NOT EXISTS (SELECT 1 FROM users WHERE email = ? OR username = ?)
+        """, row + (row[0], row[1]))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            username TEXT UNIQUE NOT NULL,
+            full_name TEXT,
+            hashed_password TEXT NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_login TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS transfer_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            session_id TEXT,
+            content_image_path TEXT,
+            style_image_path TEXT,
+            result_image_path TEXT,
+            model_type TEXT DEFAULT 'adain',
+            style_strength REAL DEFAULT 1.0,
+            processing_time REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_preferences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER UNIQUE,
+            favorite_styles TEXT,  -- JSON array
+            default_style_strength REAL DEFAULT 0.7,
+            preferred_output_format TEXT DEFAULT 'auto',  -- format, or 'auto' for the Accept header
+            theme TEXT DEFAULT 'dark',
+            notifications_enabled BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS style_presets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT UNIQUE NOT NULL,
+            description TEXT,
+            style_image_path TEXT,
+            artist TEXT,
+            style_period TEXT,
+            color_palette TEXT,  -- JSON array
+            is_active BOOLEAN DEFAULT 1,
+            usage_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_galleries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            gallery_name TEXT,
+            description TEXT,
+            is_public BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS gallery_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            gallery_id INTEGER,
+            transfer_history_id INTEGER,
+            title TEXT,
+            description TEXT,
+            tags TEXT,  -- JSON array
+            likes_count INTEGER DEFAULT 0,
+            views_count INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (gallery_id) REFERENCES user_galleries (id),
+            FOREIGN KEY (transfer_history_id) REFERENCES transfer_history (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            transfer_id INTEGER,
+            rating INTEGER CHECK(rating >= 1 AND rating <= 5),
+            feedback_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (transfer_id) REFERENCES transfer_history (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS usage_analytics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            action TEXT,  -- 'style_transfer', 'login', 'register', etc.
+            details TEXT,  -- JSON with additional details
+            ip_address TEXT,
+            user_agent TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+    ]),
+    Migration(2, "secondary indexes for history, galleries and analytics", [
+        # get_user_history: WHERE user_id = ? ORDER BY created_at DESC
+        """
+        CREATE INDEX IF NOT EXISTS idx_transfer_history_user_created
+        ON transfer_history (user_id, created_at)
+        """,
+        # get_user_galleries: WHERE user_id = ? ORDER BY created_at DESC
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_galleries_user_created
+        ON user_galleries (user_id, created_at)
+        """,
+        # get_user_galleries: item counts; get_gallery_items_page: WHERE gallery_id = ?
+        """
+        CREATE INDEX IF NOT EXISTS idx_gallery_items_gallery_created
+        ON gallery_items (gallery_id, created_at)
+        """,
+        # get_analytics_summary: created_at range scan, covering user_id
+        """
+        CREATE INDEX IF NOT EXISTS idx_usage_analytics_created_user
+        ON usage_analytics (created_at, user_id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_user_feedback_transfer
+        ON user_feedback (transfer_id)
+        """,
+    ]),
+    Migration(3, "incrementally maintained analytics rollups",
+              rollups.SCHEMA + [rollups.backfill]),
+    Migration(4, "single user store: sessions table and legacy users.db import", [
+        """
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            session_token TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        """,
+        import_legacy_users,
+    ]),
+    Migration(5, "change version counters for cached tables", [
+        """
+        CREATE TABLE IF NOT EXISTS change_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        INSERT OR IGNORE INTO change_versions (name, version) VALUES ('style_presets', 1)
+        """,
+    ] + [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_style_presets_version_{event.lower()}
+        AFTER {event} ON style_presets
+        BEGIN
+            UPDATE change_versions SET version = version + 1 WHERE name = 'style_presets';
+        END
+        """
+        for event in ("INSERT", "UPDATE", "DELETE")
+    ]),
+    Migration(6, "blob store key for transfer results", [
+        "ALTER TABLE transfer_history ADD COLUMN result_key TEXT",
+    ]),
+    Migration(7, "dominant colors of transfer results", [
+        "ALTER TABLE transfer_history ADD COLUMN color_palette TEXT",  # JSON array of hex colors
+    ]),
+    Migration(8, "per-user token revocation shared by all workers", [
+        "ALTER TABLE users ADD COLUMN tokens_valid_after REAL NOT NULL DEFAULT 0",
+    ]),
+]
+
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Return the schema version recorded in the database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn: sqlite3.Connection, target: int = None) -> List[int]:
+    """Apply all pending migrations up to ``target`` (default: latest)
+
+    Returns the versions that were applied.
+    """
+    target = LATEST_VERSION if target is None else target
+    current = get_schema_version(conn)
+    applied = []
+
+    for migration in MIGRATIONS:
+        if migration.version <= current or migration.version > target:
+            continue
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN")
+            migration.apply(cursor)
+            # PRAGMA does not accept bound parameters; version is an int we own
+            cursor.execute(f"PRAGMA user_version = {int(migration.version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(migration.version)
+
+    return applied
+
+
+def indexed_queries() -> List[tuple]:
+    """The queries the app runs whose plans must be served by an index
+
+    Each entry is (sql, params, index names the plan must use). Listing SQL
+    is built exactly as ``DatabaseManager`` builds it, for the first page and
+    for a page after a cursor.
+    """
+    # Imported here: database imports this module
+    from database import GALLERY_ITEM_PAGE, GALLERY_PAGE, HISTORY_PAGE
+    from pagination import keyset_query
+
+    listings = [
+        (HISTORY_PAGE, ("idx_transfer_history_user_created",)),
+        (GALLERY_PAGE, ("idx_user_galleries_user_created", "idx_gallery_items_gallery_created")),
+        (GALLERY_ITEM_PAGE, ("idx_gallery_items_gallery_created",)),
+    ]
+    queries = []
+    for (table, column_map, where), index_names in listings:
+        columns = list(column_map)
+        queries.append((keyset_query(table, column_map, columns, where), (1, 21), index_names))
+        queries.append((keyset_query(table, column_map, columns, where, after_cursor=True),
+                        (1, "2100-01-01 00:00:00", 1 << 62, 21), index_names))
+    queries += [
+        (rollups.ACTIVE_USER_SKETCHES_SQL, ("2000-01-01",), ("sqlite_autoindex_daily_user_sketches_1",)),
+        (rollups.ACTION_COUNTS_SQL, ("2000-01-01",), ("sqlite_autoindex_daily_action_counts_1",)),
+    ]
+    return queries
+
+
+def explain_query_plan(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    """Return the detail column of EXPLAIN QUERY PLAN for a query"""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_query_plans(conn: sqlite3.Connection) -> List[str]:
+    """Return a description of every indexed query that misses its indexes or sorts"""
+    problems = []
+    for sql, params, index_names in indexed_queries():
+        plan = explain_query_plan(conn, sql, params)
+        missing = [name for name in index_names if not any(name in detail for detail in plan)]
+        # Keyset pages must come out of the index already in order
+        if missing or any("TEMP B-TREE FOR ORDER BY" in detail for detail in plan):
+            problems.append(f"expected {', '.join(index_names)} without a sort, got: {' | '.join(plan)}")
+    return problems
+
+
+def seed_plan_check_database(conn: sqlite3.Connection, users: int = 1000,
+                             transfers_per_user: int = 50, galleries_per_user: int = 3,
+                             items_per_gallery: int = 20, analytics_rows: int = 100000):
+    """Fill a migrated database with enough rows for the planner to prefer indexes"""
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO users (email, username, hashed_password) VALUES (?, ?, ?)",
+        ((f"user{i}@example.com", f"user{i}", "x") for i in range(users))
+    )
+    cursor.executemany("""
+        INSERT INTO transfer_history (user_id, session_id, model_type, processing_time, created_at)
+        VALUES (?, ?, 'adain', ?, datetime('now', ?))
+    """, ((u + 1, f"s{u}-{t}", 1.0 + t % 7, f"-{t} hours")
+          for u in range(users) for t in range(transfers_per_user)))
+    cursor.executemany(
+        "INSERT INTO user_galleries (user_id, gallery_name) VALUES (?, ?)",
+        ((u + 1, f"g{g}") for u in range(users) for g in range(galleries_per_user))
+    )
+    cursor.executemany(
+        "INSERT INTO gallery_items (gallery_id, transfer_history_id) VALUES (?, ?)",
+        ((g + 1, i + 1) for g in range(users * galleries_per_user) for i in range(items_per_gallery))
+    )
+    cursor.executemany("""
+        INSERT INTO usage_analytics (user_id, action, created_at)
+        VALUES (?, 'style_transfer', datetime('now', ?))
+    """, ((i % users + 1, f"-{i % 90} days") for i in range(analytics_rows)))
+    rollups.backfill(cursor)
+    conn.commit()
+    cursor.execute("ANALYZE")
+    conn.commit()
+
+
+def main(argv: List[str]) -> int:
+    if "--check-plans" in argv:
+        # Verify the planner picks the indexes on a large seeded database
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, "plan_check.db"))
+            apply_migrations(conn)
+            seed_plan_check_database(conn)
+            problems = check_query_plans(conn)
+            conn.close()
+        for problem in problems:
+            print(f"FAIL {problem}")
+        print("Query plans OK" if not problems else f"{len(problems)} query plan(s) not indexed")
+        return 1 if problems else 0
+
+    db_path = argv[0] if argv else "data/app.db"
+    conn = sqlite3.connect(db_path)
+    applied = apply_migrations(conn)
+    print(f"{db_path}: schema version {get_schema_version(conn)}"
+          + (f" (applied {applied})" if applied else " (up to date)"))
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
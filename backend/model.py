@@ -2,8 +2,16 @@ import torch
 import torch.nn as nn
 import torchvision.models as models
 from torchvision.models import VGG19_Weights
-import os
-import urllib.request
+import time
+from contextlib import nullcontext
+
+from checkpoints import find_checkpoint, load_into
+
+
+def _stage(timer, name):
+    """Context manager timing one model stage when a stage timer is given"""
+    return timer(name) if timer is not None else nullcontext()
+
 
 class AdaIN(nn.Module):
     def __init__(self):
@@ -26,16 +34,26 @@ class AdaIN(nn.Module):
         return feat_mean, feat_std
 
 class Encoder(nn.Module):
-    def __init__(self):
+    def __init__(self, pretrained: bool = True):
         super(Encoder, self).__init__()
-        vgg = models.vgg19(weights=VGG19_Weights.DEFAULT).features
-        self.layers = nn.Sequential(*list(vgg.children())[:21])  # Up to relu4_1
+        # pretrained=False skips the VGG download (random weights, e.g. for offline benchmarks)
+        checkpoint = find_checkpoint('encoder') if pretrained else None
+        if checkpoint is not None:
+            # Memory-mapped from STYLE_MODEL_DIR; building on the meta device skips
+            # initializing (and allocating) the whole VGG19 just to replace it
+            with torch.device('meta'):
+                vgg = models.vgg19(weights=None).features
+            self.layers = nn.Sequential(*list(vgg.children())[:21])  # Up to relu4_1
+            load_into(self.layers, checkpoint)
+        else:
+            vgg = models.vgg19(weights=VGG19_Weights.DEFAULT if pretrained else None).features
+            self.layers = nn.Sequential(*list(vgg.children())[:21])  # Up to relu4_1
 
     def forward(self, x):
         return self.layers(x)
 
 class Decoder(nn.Module):
-    def __init__(self):
+    def __init__(self, variant: str = None):
         super(Decoder, self).__init__()
         self.layers = nn.Sequential(
             nn.ReflectionPad2d((1, 1, 1, 1)),
@@ -68,64 +86,88 @@ class Decoder(nn.Module):
             nn.ReflectionPad2d((1, 1, 1, 1)),
             nn.Conv2d(64, 3, (3, 3)),
         )
-        self.load_weights()
-
-    def load_weights(self):
-        model_dir = '/models'
-        if not os.path.exists(model_dir):
-            os.makedirs(model_dir)
-        weight_path = os.path.join(model_dir, 'decoder.pth')
-        if not os.path.exists(weight_path):
-            print(f"Decoder weights not found at {weight_path}. Using random initialization.")
-            # In a real implementation, you would download or load actual weights
-            # url = 'https://github.com/naoto0804/pytorch-AdaIN/raw/master/models/decoder.pth'
-            # urllib.request.urlretrieve(url, weight_path)
-            # self.load_state_dict(torch.load(weight_path, map_location='cpu'))
-            pass  # Use random weights for demo
-            
+        self.load_weights(variant)
+
+    def load_weights(self, variant: str = None):
+        # decoder-<variant>.safetensors, decoder.safetensors or legacy decoder.pth in STYLE_MODEL_DIR
+        weight_path = find_checkpoint('decoder', variant)
+        if weight_path is None:
+            print(f"Decoder weights for '{variant or 'default'}' not found. Using random initialization.")
+            # The pytorch-AdaIN decoder.pth can be dropped in as is, or converted with
+            # `python checkpoints.py convert decoder.pth decoder-adain.safetensors`
+            return
+        load_into(self.layers, weight_path)
+        
     def forward(self, x):
         return self.layers(x)
 
 
 # Example: Add a second style transfer model (CartoonStyleTransferModel)
 class CartoonStyleTransferModel(nn.Module):
-    def __init__(self):
+    def __init__(self, pretrained: bool = True):
         super(CartoonStyleTransferModel, self).__init__()
         # For demo, reuse Encoder/Decoder, but in practice, use a different architecture/weights
-        self.encoder = Encoder()
+        self.encoder = Encoder(pretrained)
         self.adain = AdaIN()
-        self.decoder = Decoder()
+        self.decoder = Decoder('cartoon')
 
-    def forward(self, content, style):
+    def forward(self, content, style, timer=None):
         # For demo, same as StyleTransferModel
-        content_feat = self.encoder(content)
-        style_feat = self.encoder(style)
-        adain_feat = self.adain(content_feat, style_feat)
-        output = self.decoder(adain_feat)
+        with _stage(timer, 'encoder_content'):
+            content_feat = self.encoder(content)
+        with _stage(timer, 'encoder_style'):
+            style_feat = self.encoder(style)
+        with _stage(timer, 'adain'):
+            adain_feat = self.adain(content_feat, style_feat)
+        with _stage(timer, 'decoder'):
+            output = self.decoder(adain_feat)
         return output
 
 class StyleTransferModel(nn.Module):
-    def __init__(self, model_type: str = 'adain'):
+    def __init__(self, model_type: str = 'adain', pretrained: bool = True):
         super(StyleTransferModel, self).__init__()
         if model_type == 'cartoon':
-            self.model = CartoonStyleTransferModel()
+            self.model = CartoonStyleTransferModel(pretrained)
         else:
-            self.model = self._adain_model()
+            self.model = self._adain_model(pretrained)
 
-    def _adain_model(self):
+    def _adain_model(self, pretrained: bool = True):
         class AdaINModel(nn.Module):
             def __init__(self):
                 super().__init__()
-                self.encoder = Encoder()
+                self.encoder = Encoder(pretrained)
                 self.adain = AdaIN()
-                self.decoder = Decoder()
-            def forward(self, content, style):
-                content_feat = self.encoder(content)
-                style_feat = self.encoder(style)
-                adain_feat = self.adain(content_feat, style_feat)
-                output = self.decoder(adain_feat)
+                self.decoder = Decoder('adain')
+            def forward(self, content, style, timer=None):
+                with _stage(timer, 'encoder_content'):
+                    content_feat = self.encoder(content)
+                with _stage(timer, 'encoder_style'):
+                    style_feat = self.encoder(style)
+                with _stage(timer, 'adain'):
+                    adain_feat = self.adain(content_feat, style_feat)
+                with _stage(timer, 'decoder'):
+                    output = self.decoder(adain_feat)
                 return output
         return AdaINModel()
 
-    def forward(self, content, style):
-        return self.model(content, style)
\ No newline at end of file
+    def forward(self, content, style, timer=None):
+        """Stylize ``content``; ``timer(stage)`` is entered around each stage if given"""
+        return self.model(content, style, timer=timer)
+
+class StubStyleTransferModel(nn.Module):
+    """Stand-in model for load tests: blends content towards the style's mean color
+
+    Runs in microseconds with no weights, optionally sleeping ``delay``
+    seconds per image to simulate inference cost.
+    """
+
+    def __init__(self, delay: float = 0.0):
+        super(StubStyleTransferModel, self).__init__()
+        self.delay = delay
+
+    def forward(self, content, style, timer=None):
+        with _stage(timer, 'stub'):
+            if self.delay:
+                time.sleep(self.delay * content.size(0))
+            style_mean = style.mean(dim=(2, 3), keepdim=True)
+            return content * 0.7 + style_mean * 0.3
@@ -0,0 +1,75 @@
+"""
+Keyset (cursor) pagination helpers
+
+Listings are ordered by ``(created_at DESC, id DESC)``. A cursor encodes the
+sort key of the last row on a page, and the next page is fetched with
+``WHERE (created_at, id) < (?, ?)``, which the composite indexes serve
+directly no matter how deep the client pages.
+"""
+
+import base64
+import json
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+def encode_cursor(created_at: Any, row_id: int) -> str:
+    raw = json.dumps([created_at, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Decode a cursor; raises ValueError if it is malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
+
+
+def select_columns(requested: Optional[Iterable[str]], allowed: Sequence[str],
+                   required: Sequence[str] = ('id', 'created_at')) -> List[str]:
+    """Project a listing onto the requested columns
+
+    Unknown names raise ValueError; the sort-key columns are always included
+    so the next cursor can be built.
+    """
+    if not requested:
+        return list(allowed)
+    requested = [name.strip() for name in requested if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    columns = list(required)
+    columns += [name for name in requested if name not in columns]
+    return columns
+
+
+def keyset_query(table: str, column_map: Dict[str, str], columns: Sequence[str], where: str,
+                 after_cursor: bool = False) -> str:
+    """SELECT for one page of ``table``; parameters are the ``where`` ones,
+    then the cursor's (created_at, id) if ``after_cursor``, then ``limit + 1``
+    """
+    created_at, row_id = column_map['created_at'], column_map['id']
+    if after_cursor:
+        where += f" AND ({created_at}, {row_id}) < (?, ?)"
+    return f"""
+        SELECT {", ".join(column_map[name] for name in columns)}
+        FROM {table}
+        WHERE {where}
+        ORDER BY {created_at} DESC, {row_id} DESC
+        LIMIT ?
+    """
+
+
+def build_page(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """Trim a ``limit + 1`` fetch to a page and derive the next cursor"""
+    has_more = len(rows) > limit
+    items = rows[:limit]
+    next_cursor = None
+    if has_more and items:
+        last = items[-1]
+        next_cursor = encode_cursor(last['created_at'], last['id'])
+    return {'items': items, 'next_cursor': next_cursor}
@@ -0,0 +1,149 @@
+"""
+In-memory style preset catalog
+
+The preset listing is served from a pre-rendered snapshot (JSON body + ETag)
+that is rebuilt only when the ``style_presets`` table changes. Changes are
+detected through a version counter maintained by triggers, so edits made by
+other worker processes are picked up too; the counter is checked at most
+once per ``check_interval`` seconds. Preset usage is counted in memory and
+written back periodically in one batched UPDATE. Presets without a color
+palette get one from their own style image at startup; palettes of user
+uploads are never written to the shared presets.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database import db, DatabaseManager
+from http_cache import compute_etag, render_json
+
+
+class PresetCatalog:
+    """Cached preset snapshot with buffered usage counting"""
+
+    def __init__(self, database: DatabaseManager, check_interval: float = 1.0,
+                 flush_interval: float = 10.0):
+        self.db = database
+        self.check_interval = check_interval
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._presets: List[Dict[str, Any]] = []
+        self._body = b''
+        self._etag = ''
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._usage: Counter = Counter()
+        self._usage_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._atexit_registered = False
+        self.rebuilds = 0
+
+    def snapshot(self) -> Tuple[bytes, str]:
+        """Return the rendered preset listing and its ETag"""
+        self._refresh()
+        return self._body, self._etag
+
+    def presets(self) -> List[Dict[str, Any]]:
+        self._refresh()
+        return self._presets
+
+    def invalidate(self):
+        """Force the next read to check the database version"""
+        self._checked_at = 0.0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.check_interval:
+                return
+            version = self.db.get_change_version('style_presets')
+            if version != self._version:
+                presets = self.db.get_style_presets()
+                body = render_json({"presets": presets})
+                self._presets, self._body, self._etag = presets, body, compute_etag(body)
+                self._version = version
+                self.rebuilds += 1
+            self._checked_at = time.monotonic()
+
+    def record_usage(self, preset_id: int):
+        """Count one use of a preset; written to the database on the next flush"""
+        with self._usage_lock:
+            self._usage[preset_id] += 1
+        self.start()
+
+    def fill_palettes(self, extract: Callable[[str], Optional[List[str]]]) -> int:
+        """Give presets without a palette the one ``extract`` derives from their ``style_image_path``
+
+        Returns the number of presets updated.
+        """
+        filled = 0
+        for preset_id, path in self.db.get_presets_missing_palette():
+            palette = extract(path)
+            if palette and self.db.set_preset_palette(preset_id, palette):
+                filled += 1
+        if filled:
+            self.invalidate()
+        return filled
+
+    def flush_usage(self) -> int:
+        """Write accumulated usage counts; returns the number of uses written"""
+        with self._usage_lock:
+            pending, self._usage = self._usage, Counter()
+        if not pending:
+            return 0
+        try:
+            self.db.add_preset_usage(dict(pending))
+        except Exception as e:
+            # Keep the counts for the next attempt
+            with self._usage_lock:
+                self._usage.update(pending)
+            print(f"Failed to flush preset usage: {e}")
+            return 0
+        self.invalidate()
+        return sum(pending.values())
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="preset-usage-flusher", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.close)
+                self._atexit_registered = True
+
+    def close(self):
+        thread = self._thread
+        if thread is not None:
+            self._stop.set()
+            thread.join(5.0)
+            self._thread = None
+        self.flush_usage()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush_usage()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._usage_lock:
+            pending = sum(self._usage.values())
+        return {'version': self._version, 'rebuilds': self.rebuilds,
+                'presets': len(self._presets), 'pending_usage': pending}
+
+
+# Global preset catalog
+preset_catalog = PresetCatalog(
+    db,
+    check_interval=float(os.getenv("PRESET_CACHE_CHECK_INTERVAL", "1.0")),
+    flush_interval=float(os.getenv("PRESET_USAGE_FLUSH_INTERVAL", "10.0")),
+)
@@ -0,0 +1,221 @@
+"""
+On-demand profiling of style transfer requests
+
+An admin arms the profiler for the next N requests. Each of those requests
+runs under ``torch.profiler`` (operator CPU time, memory allocations) and/or
+a sampling profiler that periodically records the Python stack of the
+request's thread. Artifacts are written to ``PROFILE_DIR``:
+
+- ``<run>.trace.json``: Chrome trace (chrome://tracing or Perfetto)
+- ``<run>.ops.txt``: operator table sorted by self CPU time
+- ``<run>.folded``: folded stacks for flamegraph.pl or speedscope
+
+Only one request is profiled at a time; concurrent requests run normally.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+ARTIFACT_PATTERN = re.compile(r'^[A-Za-z0-9_.-]+\.(trace\.json|ops\.txt|folded)$')
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of a request's threads at a fixed interval
+
+    Async handlers share the event loop thread, so samples can include other
+    coroutines that ran while the profiled request was awaiting.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_ids = {thread_id}
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[';'.join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfileRun:
+    """Profiling of a single request
+
+    Model work runs on an inference thread (see ``scheduler.py``), and
+    ``torch.profiler`` only records operators of the thread that started it,
+    so the torch profile covers the ``on_thread()`` block of that thread.
+    """
+
+    def __init__(self, owner: "RequestProfiler", label: str, use_torch: bool, sampling_interval: Optional[float]):
+        self.owner = owner
+        self.name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{label}"
+        self.started = time.perf_counter()
+        self.use_torch = use_torch
+        self.torch_profile = None
+        self.sampler = None
+        if sampling_interval:
+            self.sampler = SamplingProfiler(threading.get_ident(), sampling_interval)
+            self.sampler.start()
+
+    @contextmanager
+    def on_thread(self):
+        """Profile the current (inference) thread for the duration of the block"""
+        thread_id = threading.get_ident()
+        if self.sampler is not None:
+            self.sampler.thread_ids.add(thread_id)
+        started_torch = False
+        if self.use_torch and self.torch_profile is None:
+            import torch.profiler
+            self.torch_profile = torch.profiler.profile(
+                activities=[torch.profiler.ProfilerActivity.CPU],
+                record_shapes=True,
+                profile_memory=True,
+            )
+            self.torch_profile.__enter__()
+            started_torch = True
+        try:
+            yield
+        finally:
+            if started_torch:
+                self.torch_profile.__exit__(None, None, None)
+            if self.sampler is not None:
+                self.sampler.thread_ids.discard(thread_id)
+
+    def finish(self) -> List[str]:
+        """Stop profiling and write the artifacts; returns their file names"""
+        written = []
+        try:
+            if self.sampler is not None:
+                self.sampler.stop()
+                written.append(self._write('folded', self.sampler.folded()))
+            if self.torch_profile is not None:
+                trace_name = f"{self.name}.trace.json"
+                self.torch_profile.export_chrome_trace(os.path.join(self.owner.output_dir, trace_name))
+                written.append(trace_name)
+                table = self.torch_profile.key_averages().table(sort_by="self_cpu_time_total", row_limit=50)
+                written.append(self._write('ops.txt', table))
+        finally:
+            self.owner._finished(self, written)
+        return written
+
+    def _write(self, extension: str, text: str) -> str:
+        name = f"{self.name}.{extension}"
+        with open(os.path.join(self.owner.output_dir, name), 'w') as f:
+            f.write(text)
+        return name
+
+
+class RequestProfiler:
+    """Profiles the next N requests once armed"""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._use_torch = True
+        self._sampling_interval: Optional[float] = 0.005
+        self._active: Optional[ProfileRun] = None
+        self._recent: List[Dict[str, Any]] = []
+
+    def arm(self, requests: int, use_torch: bool = True, sampling_interval: Optional[float] = 0.005) -> Dict[str, Any]:
+        if not use_torch and not sampling_interval:
+            raise ValueError("Enable torch profiling, sampling, or both")
+        os.makedirs(self.output_dir, exist_ok=True)
+        with self._lock:
+            self._remaining = requests
+            self._use_torch = use_torch
+            self._sampling_interval = sampling_interval
+        return self.status()
+
+    def disarm(self) -> Dict[str, Any]:
+        with self._lock:
+            self._remaining = 0
+        return self.status()
+
+    def begin(self, label: str) -> Optional[ProfileRun]:
+        """Start profiling this request if armed and idle; call ``finish()`` on the result"""
+        if not self._remaining:
+            return None
+        with self._lock:
+            if not self._remaining or self._active is not None:
+                return None
+            self._remaining -= 1
+            try:
+                self._active = ProfileRun(self, re.sub(r'[^A-Za-z0-9_-]', '_', label),
+                                          self._use_torch, self._sampling_interval)
+            except Exception as e:
+                # Never fail the request because the profiler could not start
+                print(f"Failed to start profiler: {e}")
+                return None
+            return self._active
+
+    def _finished(self, run: ProfileRun, artifacts: List[str]):
+        with self._lock:
+            self._active = None
+            self._recent.append({'run': run.name, 'seconds': round(time.perf_counter() - run.started, 4),
+                                 'artifacts': artifacts})
+            del self._recent[:-20]
+
+    def artifacts(self) -> List[str]:
+        try:
+            return sorted(name for name in os.listdir(self.output_dir) if ARTIFACT_PATTERN.match(name))
+        except FileNotFoundError:
+            return []
+
+    def artifact_path(self, name: str) -> Optional[str]:
+        if not ARTIFACT_PATTERN.match(name):
+            return None
+        path = os.path.join(self.output_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'remaining': self._remaining,
+                'torch_profiler': self._use_torch,
+                'sampling_interval': self._sampling_interval,
+                'active': self._active.name if self._active is not None else None,
+                'recent_runs': list(self._recent),
+                'output_dir': self.output_dir,
+            }
+
+
+@contextmanager
+def profile_thread(run: Optional[ProfileRun]):
+    """``run.on_thread()`` when the request is being profiled"""
+    if run is None:
+        yield
+        return
+    with run.on_thread():
+        yield
+
+
+# Global request profiler
+request_profiler = RequestProfiler(os.getenv("PROFILE_DIR", "data/profiles"))
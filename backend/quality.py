@@ -0,0 +1,130 @@
+"""
+Adaptive processing quality under load
+
+At a fixed full resolution, a traffic spike grows the queue and p99
+latency with it until requests time out. The controller instead picks a
+quality level for each request. A level is the
+model input size, the maximum working image size and the precision. The
+controller chooses the best level whose predicted latency meets
+``QUALITY_LATENCY_TARGET_MS``:
+
+    predicted = requests in flight (including this one) x service time of the level
+
+Service times are moving averages of the model time of finished requests
+per level. A level with no samples yet is scaled from one with samples,
+in proportion to its pixel count. When admission control asks to degrade, the full level is
+skipped. Premium users can opt out (``adaptive_quality=false``) and always
+get full quality.
+
+Levels come from ``QUALITY_SIZES`` (model input sizes, best first, default
+``512,384,256``). ``QUALITY_LOW_PRECISION=bf16`` runs the lowest level
+under bfloat16 autocast.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from metrics import registry
+
+
+LEVEL_NAMES = ('full', 'high', 'medium', 'low', 'minimal')
+
+QUALITY_LEVELS = registry.counter(
+    'style_transfer_quality_level_total', 'Quality level chosen for style transfer requests',
+    ('level',))
+
+
+class QualityLevel:
+    """Processing settings for one quality level"""
+
+    def __init__(self, name: str, size: int, max_size: int, precision: str = 'fp32'):
+        self.name = name
+        self.size = size            # shorter side of the model input
+        self.max_size = max_size    # longest side images are resized to before processing
+        self.precision = precision
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'size': self.size, 'max_size': self.max_size, 'precision': self.precision}
+
+
+def build_levels(sizes: List[int], low_precision: str = 'fp32') -> List[QualityLevel]:
+    """Levels for model input sizes (best first); working images are twice the input size"""
+    sizes = sorted(set(sizes), reverse=True)
+    levels = []
+    for i, size in enumerate(sizes):
+        name = LEVEL_NAMES[i] if i < len(LEVEL_NAMES) else f"level{i}"
+        precision = low_precision if i == len(sizes) - 1 and i > 0 else 'fp32'
+        levels.append(QualityLevel(name, size, size * 2, precision))
+    return levels
+
+
+class QualityController:
+    """Choose a quality level per request from queue depth and a latency target"""
+
+    def __init__(self, levels: List[QualityLevel], latency_target: float, smoothing: float = 0.2):
+        if not levels:
+            raise ValueError("At least one quality level is required")
+        self.levels = levels
+        self.latency_target = latency_target
+        self.smoothing = smoothing
+        self._service: Dict[str, float] = {}
+        self._chosen = {level.name: 0 for level in levels}
+        self._lock = threading.Lock()
+
+    @property
+    def full(self) -> QualityLevel:
+        return self.levels[0]
+
+    def service_time(self, level: QualityLevel) -> Optional[float]:
+        """Expected seconds for one request at ``level`` (None before any request finished)"""
+        if level.name in self._service:
+            return self._service[level.name]
+        for other in self.levels:
+            if other.name in self._service:
+                return self._service[other.name] * (level.size / other.size) ** 2
+        return None
+
+    def choose(self, in_flight: int, degrade: bool = False, opt_out: bool = False) -> QualityLevel:
+        """Best level whose predicted latency meets the target (the lowest level if none does)"""
+        with self._lock:
+            if opt_out:
+                chosen = self.full
+            else:
+                candidates = self.levels[1:] if degrade and len(self.levels) > 1 else self.levels
+                chosen = candidates[-1]
+                for level in candidates:
+                    service = self.service_time(level)
+                    if service is None or max(in_flight, 1) * service <= self.latency_target:
+                        chosen = level
+                        break
+            self._chosen[chosen.name] += 1
+        QUALITY_LEVELS.inc(level=chosen.name)
+        return chosen
+
+    def record(self, level: QualityLevel, seconds: float):
+        """Feed back the model time of a finished request"""
+        with self._lock:
+            previous = self._service.get(level.name)
+            self._service[level.name] = seconds if previous is None else \
+                previous + self.smoothing * (seconds - previous)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'latency_target_seconds': self.latency_target,
+                'levels': [dict(level.to_dict(), service_seconds=self._service.get(level.name))
+                           for level in self.levels],
+                'chosen': dict(self._chosen),
+            }
+
+
+def create_quality_controller() -> QualityController:
+    sizes = [int(s) for s in os.getenv("QUALITY_SIZES", "512,384,256").split(",") if s.strip()]
+    # Defaults to the admission SLO, so levels drop before requests start being degraded or shed
+    target = os.getenv("QUALITY_LATENCY_TARGET_MS") or os.getenv("ADMISSION_LATENCY_SLO_MS", "5000")
+    return QualityController(build_levels(sizes, os.getenv("QUALITY_LOW_PRECISION", "fp32")),
+                             latency_target=float(target) / 1000.0)
+
+
+quality_controller = create_quality_controller()
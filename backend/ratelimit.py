@@ -0,0 +1,189 @@
+"""
+Per-tenant rate limiting with token buckets
+
+Each tenant has a bucket of ``RATE_LIMIT_BURST`` tokens that refills at
+``RATE_LIMIT_PER_SECOND``. A tenant is a user, or the client IP on
+endpoints without authentication. Every processed image costs one token,
+so a batch of 20 images spends 20. A request the bucket cannot pay for is
+rejected with 429, and ``Retry-After`` says when enough tokens will be
+back. Batches larger than ``MAX_BATCH_FILES`` (at most the burst) are
+rejected with 413 before they reach the bucket.
+
+Buckets live in a ``RateLimitStore``, selected by ``RATE_LIMIT_URL``:
+
+- ``memory://`` (default): per process, so each worker enforces its own share
+- ``redis://host:6379/0``: shared by every worker and node; needs the
+  ``redis`` package. Any client with ``eval`` can stand in for the server,
+  for example fakeredis in local setups.
+
+``RATE_LIMIT_ENABLED=0`` turns limiting off. Decisions are exported with
+a bounded tenant label (``metrics.tenant_label``); ``stats()`` lists the
+most limited tenants.
+"""
+
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+from metrics import registry, tenant_label, TopCounter
+
+
+RATE_LIMIT_DECISIONS = registry.counter(
+    'rate_limit_requests_total', 'Rate limit checks per tenant', ('tenant', 'outcome'))
+
+
+class RateLimitStore(ABC):
+    """Interface for token bucket state"""
+
+    @abstractmethod
+    def take(self, key: str, cost: float, rate: float, burst: float, now: float) -> Tuple[bool, float]:
+        """Refill ``key``'s bucket to ``now`` and take ``cost`` tokens if available
+
+        Returns whether the tokens were taken and the tokens left afterwards.
+        """
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """Buckets in a dict; full buckets are dropped once ``max_keys`` is reached"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, rate: float, burst: float, now: float) -> Tuple[bool, float]:
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            if key not in self._buckets and len(self._buckets) >= self.max_keys:
+                self._prune(rate, burst, now)
+            self._buckets[key] = (tokens, now)
+            return allowed, tokens
+
+    def _prune(self, rate: float, burst: float, now: float):
+        # A bucket that has refilled is indistinguishable from a missing one
+        for key, (tokens, updated) in list(self._buckets.items()):
+            if tokens + (now - updated) * rate >= burst:
+                del self._buckets[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'memory', 'buckets': len(self._buckets)}
+
+
+# Refill and take atomically on the server; buckets expire once they would be full again
+_TAKE_SCRIPT = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local cost, rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitStore(RateLimitStore):
+    """Buckets in Redis hashes, shared across processes and nodes"""
+
+    def __init__(self, client: Any, prefix: str = "ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key: str, cost: float, rate: float, burst: float, now: float) -> Tuple[bool, float]:
+        allowed, tokens = self.client.eval(_TAKE_SCRIPT, 1, self.prefix + key, cost, rate, burst, now)
+        return bool(int(allowed)), float(tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'redis', 'prefix': self.prefix}
+
+
+class RateLimitResult:
+    """Outcome of a rate limit check"""
+
+    def __init__(self, allowed: bool, limit: float, remaining: float, retry_after: Optional[float]):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after  # None when the cost can never fit in the bucket
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            'X-RateLimit-Limit': str(int(self.limit)),
+            'X-RateLimit-Remaining': str(int(self.remaining)),
+        }
+        if not self.allowed and self.retry_after is not None:
+            headers['Retry-After'] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class RateLimiter:
+    """Token bucket per tenant"""
+
+    def __init__(self, store: RateLimitStore, rate: float, burst: float, enabled: bool = True):
+        self.store = store
+        self.rate = rate
+        self.burst = burst
+        self.enabled = enabled
+        self._counts = {'allowed': 0, 'limited': 0}
+        self._limited_tenants = TopCounter()
+
+    def check(self, tenant: str, cost: float = 1.0) -> RateLimitResult:
+        if not self.enabled:
+            return RateLimitResult(True, self.burst, self.burst, None)
+        if cost > self.burst:
+            allowed, remaining, retry_after = False, 0.0, None
+        else:
+            allowed, remaining = self.store.take(tenant, cost, self.rate, self.burst, time.time())
+            retry_after = None if allowed else (cost - remaining) / self.rate
+        outcome = 'allowed' if allowed else 'limited'
+        self._counts[outcome] += 1
+        RATE_LIMIT_DECISIONS.inc(tenant=tenant_label(tenant), outcome=outcome)
+        if not allowed:
+            self._limited_tenants.add(tenant)
+        return RateLimitResult(allowed, self.burst, remaining, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.store.stats(), enabled=self.enabled, rate_per_second=self.rate,
+                    burst=self.burst, **self._counts,
+                    top_limited=[{'tenant': tenant, 'requests': int(count)}
+                                 for tenant, count in self._limited_tenants.top()])
+
+
+def create_rate_limit_store(url: str = None) -> RateLimitStore:
+    url = url or os.getenv("RATE_LIMIT_URL", "memory://")
+    if url.startswith("memory://"):
+        return MemoryRateLimitStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError:
+            raise ValueError("RATE_LIMIT_URL points at Redis but the redis package is not installed")
+        return RedisRateLimitStore(redis.Redis.from_url(url))
+    raise ValueError(f"Unsupported RATE_LIMIT_URL: {url}")
+
+
+def create_rate_limiter() -> RateLimiter:
+    return RateLimiter(
+        create_rate_limit_store(),
+        rate=float(os.getenv("RATE_LIMIT_PER_SECOND", "0.5")),
+        burst=float(os.getenv("RATE_LIMIT_BURST", "20")),
+        enabled=os.getenv("RATE_LIMIT_ENABLED", "1").lower() not in ("0", "false", "no"),
+    )
+
+
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,299 @@
+"""
+Incrementally maintained analytics rollups
+
+Every write that affects the analytics summary also updates a small rollup
+row in the same transaction, so the summary can be answered from a bounded
+number of rows no matter how large ``transfer_history`` and
+``usage_analytics`` grow:
+
+- ``analytics_counters``: all-time totals (users are counted by trigger)
+- ``daily_action_counts``: events per UTC day and action
+- ``daily_user_sketches``: a HyperLogLog sketch of distinct users per day
+- ``model_latency_stats`` / ``latency_histogram``: processing time count,
+  sum and a log-bucketed histogram per model type for percentiles
+"""
+
+import hashlib
+import math
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+
+# HyperLogLog with 2**11 one-byte registers (~2.3% standard error)
+HLL_PRECISION = 11
+HLL_REGISTERS = 1 << HLL_PRECISION
+
+# Latency buckets: bucket i covers (LATENCY_BASE * GROWTH**(i-1), LATENCY_BASE * GROWTH**i]
+LATENCY_BASE = 0.01
+LATENCY_GROWTH = 1.1
+LATENCY_BUCKETS = 121  # up to ~15 minutes; slower requests land in the last bucket
+
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS analytics_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_action_counts (
+        day TEXT NOT NULL,
+        action TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, action)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS daily_user_sketches (
+        day TEXT PRIMARY KEY,
+        registers BLOB NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS model_latency_stats (
+        model_type TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0,
+        total_time REAL NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS latency_histogram (
+        model_type TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (model_type, bucket)
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_count_insert AFTER INSERT ON users
+    BEGIN
+        INSERT INTO analytics_counters (name, value) VALUES ('total_users', 1)
+        ON CONFLICT(name) DO UPDATE SET value = value + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_users_count_delete AFTER DELETE ON users
+    BEGIN
+        UPDATE analytics_counters SET value = value - 1 WHERE name = 'total_users';
+    END
+    """,
+]
+
+
+def utc_day(timestamp: Optional[str] = None) -> str:
+    """Return the UTC day (YYYY-MM-DD) for a SQLite timestamp, or today"""
+    if timestamp:
+        return timestamp[:10]
+    return datetime.utcnow().strftime('%Y-%m-%d')
+
+
+# HyperLogLog helpers
+
+def _hash64(value: Any) -> int:
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+
+
+def hll_add(registers: bytearray, value: Any):
+    """Add a value to a HyperLogLog register array in place"""
+    h = _hash64(value)
+    index = h >> (64 - HLL_PRECISION)
+    remaining = (h << HLL_PRECISION) & ((1 << 64) - 1)
+    rank = (64 - HLL_PRECISION + 1) if remaining == 0 else (65 - remaining.bit_length())
+    if rank > registers[index]:
+        registers[index] = rank
+
+
+def hll_merge(sketches: Iterable[bytes]) -> bytearray:
+    """Merge sketches by taking the register-wise maximum"""
+    merged = bytearray(HLL_REGISTERS)
+    for sketch in sketches:
+        merged = bytearray(map(max, merged, sketch))
+    return merged
+
+
+def hll_count(registers: bytes) -> int:
+    """Estimate the number of distinct values in a sketch"""
+    m = HLL_REGISTERS
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / sum(2.0 ** -r for r in registers)
+    zeros = registers.count(0)
+    if estimate <= 2.5 * m and zeros:
+        # Small-range correction (linear counting)
+        estimate = m * math.log(m / zeros)
+    return int(round(estimate))
+
+
+# Latency histogram helpers
+
+def latency_bucket(seconds: float) -> int:
+    if seconds <= LATENCY_BASE:
+        return 0
+    bucket = math.ceil(math.log(seconds / LATENCY_BASE) / math.log(LATENCY_GROWTH))
+    return min(bucket, LATENCY_BUCKETS - 1)
+
+
+def bucket_upper_bound(bucket: int) -> float:
+    return LATENCY_BASE * LATENCY_GROWTH ** bucket
+
+
+def histogram_percentiles(buckets: Dict[int, int], percentiles=(50, 95, 99)) -> Dict[str, float]:
+    """Approximate percentiles (bucket upper bounds) from bucket counts"""
+    total = sum(buckets.values())
+    result = {}
+    for p in percentiles:
+        if total == 0:
+            result[f'p{p}'] = 0.0
+            continue
+        threshold = total * p / 100.0
+        cumulative = 0
+        for bucket in sorted(buckets):
+            cumulative += buckets[bucket]
+            if cumulative >= threshold:
+                result[f'p{p}'] = round(bucket_upper_bound(bucket), 3)
+                break
+    return result
+
+
+# Incremental updates (call inside the writing transaction)
+
+def _bump_counter(cursor: sqlite3.Cursor, name: str, amount: int = 1):
+    cursor.execute("""
+        INSERT INTO analytics_counters (name, value) VALUES (?, ?)
+        ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+    """, (name, amount))
+
+
+def _record_latency(cursor: sqlite3.Cursor, model_type: str, processing_time: float):
+    cursor.execute("""
+        INSERT INTO model_latency_stats (model_type, count, total_time) VALUES (?, 1, ?)
+        ON CONFLICT(model_type) DO UPDATE SET
+            count = count + 1, total_time = total_time + excluded.total_time
+    """, (model_type, processing_time))
+    cursor.execute("""
+        INSERT INTO latency_histogram (model_type, bucket, count) VALUES (?, ?, 1)
+        ON CONFLICT(model_type, bucket) DO UPDATE SET count = count + 1
+    """, (model_type, latency_bucket(processing_time)))
+
+
+def record_transfer(cursor: sqlite3.Cursor, model_type: str, processing_time: float):
+    """Update rollups for one saved style transfer"""
+    _bump_counter(cursor, 'total_transfers')
+    if processing_time and processing_time > 0:
+        _record_latency(cursor, model_type, processing_time)
+
+
+def record_events(cursor: sqlite3.Cursor, events: Iterable[tuple]):
+    """Update rollups for analytics events
+
+    ``events`` yields (user_id, action, created_at) tuples; created_at may be
+    None for "now".
+    """
+    action_counts: Dict[tuple, int] = {}
+    users_by_day: Dict[str, set] = {}
+    for user_id, action, created_at in events:
+        if action is None:
+            continue
+        day = utc_day(created_at)
+        action_counts[(day, action)] = action_counts.get((day, action), 0) + 1
+        if user_id is not None:
+            users_by_day.setdefault(day, set()).add(user_id)
+
+    cursor.executemany("""
+        INSERT INTO daily_action_counts (day, action, count) VALUES (?, ?, ?)
+        ON CONFLICT(day, action) DO UPDATE SET count = count + excluded.count
+    """, [(day, action, count) for (day, action), count in action_counts.items()])
+
+    for day, user_ids in users_by_day.items():
+        row = cursor.execute(
+            "SELECT registers FROM daily_user_sketches WHERE day = ?", (day,)
+        ).fetchone()
+        registers = bytearray(row[0]) if row else bytearray(HLL_REGISTERS)
+        for user_id in user_ids:
+            hll_add(registers, user_id)
+        cursor.execute("""
+            INSERT INTO daily_user_sketches (day, registers) VALUES (?, ?)
+            ON CONFLICT(day) DO UPDATE SET registers = excluded.registers
+        """, (day, bytes(registers)))
+
+
+# Reads
+
+# The windowed reads of read_summary; both are range scans of the day primary key
+ACTIVE_USER_SKETCHES_SQL = "SELECT registers FROM daily_user_sketches WHERE day >= ?"
+ACTION_COUNTS_SQL = "SELECT action, SUM(count) FROM daily_action_counts WHERE day >= ? GROUP BY action"
+
+
+def read_summary(cursor: sqlite3.Cursor, days: int = 30) -> Dict[str, Any]:
+    """Build the analytics summary from rollup tables only"""
+    counters = dict(cursor.execute("SELECT name, value FROM analytics_counters").fetchall())
+    since = (datetime.utcnow() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+    sketches = [row[0] for row in cursor.execute(ACTIVE_USER_SKETCHES_SQL, (since,))]
+    active_users = hll_count(hll_merge(sketches)) if sketches else 0
+
+    actions = dict(cursor.execute(ACTION_COUNTS_SQL, (since,)).fetchall())
+
+    latency: Dict[str, Dict[str, Any]] = {}
+    total_count, total_time = 0, 0.0
+    for model_type, count, model_time in cursor.execute(
+            "SELECT model_type, count, total_time FROM model_latency_stats"):
+        total_count += count
+        total_time += model_time
+        latency[model_type] = {'count': count, 'avg': round(model_time / count, 3) if count else 0.0}
+
+    buckets: Dict[str, Dict[int, int]] = {}
+    for model_type, bucket, count in cursor.execute(
+            "SELECT model_type, bucket, count FROM latency_histogram"):
+        buckets.setdefault(model_type, {})[bucket] = count
+    for model_type, model_buckets in buckets.items():
+        latency.setdefault(model_type, {'count': 0, 'avg': 0.0}).update(
+            histogram_percentiles(model_buckets))
+
+    return {
+        'total_users': counters.get('total_users', 0),
+        'total_transfers': counters.get('total_transfers', 0),
+        'active_users_30d': active_users,
+        'avg_processing_time': round(total_time / total_count, 2) if total_count else 0,
+        f'actions_{days}d': actions,
+        'latency_by_model': latency,
+    }
+
+
+def backfill(cursor: sqlite3.Cursor):
+    """Rebuild every rollup from the base tables (used by the migration)"""
+    for table in ('analytics_counters', 'daily_action_counts', 'daily_user_sketches',
+                  'model_latency_stats', 'latency_histogram'):
+        cursor.execute(f"DELETE FROM {table}")
+
+    cursor.execute("""
+        INSERT INTO analytics_counters (name, value)
+        SELECT 'total_users', COUNT(*) FROM users
+    """)
+    cursor.execute("""
+        INSERT INTO analytics_counters (name, value)
+        SELECT 'total_transfers', COUNT(*) FROM transfer_history
+    """)
+
+    cursor.execute("""
+        INSERT INTO daily_action_counts (day, action, count)
+        SELECT date(created_at), action, COUNT(*) FROM usage_analytics
+        WHERE action IS NOT NULL
+        GROUP BY date(created_at), action
+    """)
+
+    sketches: Dict[str, bytearray] = {}
+    for day, user_id in cursor.execute("""
+            SELECT DISTINCT date(created_at), user_id FROM usage_analytics
+            WHERE user_id IS NOT NULL""").fetchall():
+        hll_add(sketches.setdefault(day, bytearray(HLL_REGISTERS)), user_id)
+    cursor.executemany(
+        "INSERT INTO daily_user_sketches (day, registers) VALUES (?, ?)",
+        [(day, bytes(registers)) for day, registers in sketches.items()]
+    )
+
+    for model_type, processing_time in cursor.execute("""
+            SELECT model_type, processing_time FROM transfer_history
+            WHERE processing_time > 0""").fetchall():
+        _record_latency(cursor, model_type or 'adain', processing_time)
@@ -0,0 +1,159 @@
+"""
+CPU runtime configuration for inference workers
+
+With several uvicorn workers on one machine, every PyTorch process defaults
+to one intra-op thread per core, so N workers run N x cores threads and the
+convolutions thrash. ``configure_runtime`` gives each worker its share of
+the CPUs instead:
+
+- ``WEB_CONCURRENCY``: number of workers sharing the machine (default 1)
+- ``TORCH_NUM_THREADS``: intra-op threads per worker (default: CPUs / workers)
+- ``TORCH_INTEROP_THREADS``: inter-op threads per worker (default 1)
+- ``CPU_AFFINITY``: ``auto`` pins each worker to its own block of cores,
+  an explicit list (``0-3,8-11``) pins to those cores, empty disables pinning
+
+Workers claim a slot number with a lock file in ``RUNTIME_DIR``, which is
+how ``auto`` affinity gives each worker a different block.
+
+torch is imported by ``configure_runtime`` rather than at module import, so
+the API can start serving health checks before PyTorch has loaded.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Worker slots need POSIX file locks
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(text: str) -> List[int]:
+    """Parse ``0-3,8,10-11`` into a sorted list of CPU ids"""
+    cpus = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        cpus.update(range(int(start), int(end or start) + 1))
+    return sorted(cpus)
+
+
+def partition_cpus(cpus: List[int], workers: int, slot: int) -> List[int]:
+    """The block of ``cpus`` that belongs to worker ``slot`` out of ``workers``"""
+    if workers <= 1 or len(cpus) < workers:
+        return list(cpus)
+    size = len(cpus) // workers
+    start = (slot % workers) * size
+    return cpus[start:start + size]
+
+
+_slot_files = []
+
+
+def claim_worker_slot(directory: str, workers: int) -> Optional[int]:
+    """Claim the lowest free worker slot; the lock is held for the process lifetime"""
+    if fcntl is None:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    for slot in range(max(workers, 1)):
+        f = open(os.path.join(directory, f"worker-{slot}.lock"), 'w')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        _slot_files.append(f)
+        return slot
+    return None
+
+
+class RuntimeSettings:
+    """Effective threading/affinity settings of this process"""
+
+    def __init__(self):
+        self.configured = False
+        self.workers = 1
+        self.slot: Optional[int] = None
+        self.affinity: Optional[List[int]] = None
+        self.warnings: List[str] = []
+
+    def report(self) -> Dict[str, Any]:
+        report = {
+            'pid': os.getpid(),
+            'configured': self.configured,
+            'workers': self.workers,
+            'worker_slot': self.slot,
+            'cpu_count': os.cpu_count(),
+            'available_cpus': len(available_cpus()),
+            'cpu_affinity': self.affinity,
+            'warnings': list(self.warnings),
+        }
+        # torch is loaded by configure_runtime (possibly still importing on the warm-up thread before that)
+        if self.configured:
+            import torch
+            report.update({
+                'intra_op_threads': torch.get_num_threads(),
+                'inter_op_threads': torch.get_num_interop_threads(),
+                'mkldnn': torch.backends.mkldnn.is_available(),
+            })
+        return report
+
+
+runtime_settings = RuntimeSettings()
+_configure_lock = threading.Lock()
+
+
+def configure_runtime(workers: int = None, threads: int = None, interop_threads: int = None,
+                      affinity: str = None, slot: int = None) -> Dict[str, Any]:
+    """Apply thread counts and CPU affinity; arguments override the environment"""
+    import torch
+
+    with _configure_lock:
+        settings = runtime_settings
+        settings.workers = workers or int(os.getenv("WEB_CONCURRENCY", "1"))
+        affinity = os.getenv("CPU_AFFINITY", "") if affinity is None else affinity
+
+        if slot is None and (settings.workers > 1 or affinity == 'auto'):
+            slot = claim_worker_slot(os.getenv("RUNTIME_DIR", "/tmp/style-studio/runtime"), settings.workers)
+        settings.slot = slot
+
+        cpus = available_cpus()
+        if affinity == 'auto':
+            target = partition_cpus(cpus, settings.workers, slot or 0)
+        elif affinity:
+            target = parse_cpu_list(affinity)
+        else:
+            target = None
+        if target and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, target)
+                settings.affinity = target
+                cpus = target
+            except OSError as e:
+                settings.warnings.append(f"CPU affinity not applied: {e}")
+
+        if threads is None:
+            threads = int(os.getenv("TORCH_NUM_THREADS", "0"))
+        if not threads:
+            # Pinned workers already own their cores; unpinned ones split the machine
+            threads = len(cpus) if settings.affinity is not None else max(1, len(cpus) // settings.workers)
+        torch.set_num_threads(threads)
+
+        interop_threads = interop_threads or int(os.getenv("TORCH_INTEROP_THREADS", "1"))
+        if torch.get_num_interop_threads() != interop_threads:
+            try:
+                torch.set_num_interop_threads(interop_threads)
+            except RuntimeError as e:
+                # Only allowed before the first inter-op parallel work in the process
+                settings.warnings.append(f"Inter-op threads not changed: {e}")
+        settings.configured = True
+        return settings.report()
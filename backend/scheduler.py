@@ -0,0 +1,146 @@
+"""
+Fair-share scheduling of inference
+
+Model work runs on a small pool of inference threads
+(``INFERENCE_CONCURRENCY``, default 1; each forward pass already uses all
+of the worker's intra-op threads). Running it there also keeps the event
+loop free for health checks and uploads. Jobs wait in one queue per
+priority:
+
+- ``interactive``: single style transfers a user is waiting on
+- ``batch``: images of ``style-transfer-batch`` requests
+
+Interactive jobs go first. One dispatch in every ``SCHEDULER_BATCH_SHARE``
+(default 4) goes to a waiting batch job, so batches are never starved.
+Within a priority, tenants take turns. One tenant's 50-image batch is
+therefore interleaved with other tenants' work instead of running back to
+back. Queue wait and inference time are exported per priority and per
+tenant (see ``metrics.tenant_label``: unauthenticated clients share one
+label and users past ``METRICS_MAX_TENANTS`` share ``other``); ``stats()``
+lists the heaviest tenants.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict
+
+from metrics import registry, tenant_label, TopCounter
+
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITIES = (INTERACTIVE, BATCH)
+
+QUEUE_WAIT_SECONDS = registry.histogram(
+    'inference_queue_wait_seconds', 'Time inference jobs wait for a slot', ('priority',))
+QUEUED_JOBS = registry.gauge(
+    'inference_queued_jobs', 'Inference jobs waiting for a slot', ('priority',))
+TENANT_JOBS = registry.counter(
+    'inference_jobs_total', 'Inference jobs run per tenant', ('tenant', 'priority'))
+TENANT_SECONDS = registry.counter(
+    'inference_seconds_total', 'Inference thread time used per tenant', ('tenant', 'priority'))
+
+
+class _Job:
+    def __init__(self, tenant: str, priority: str, fn: Callable[[], Any]):
+        self.tenant = tenant
+        self.priority = priority
+        self.fn = fn
+        self.future: Future = Future()
+        self.queued = time.perf_counter()
+
+
+class FairScheduler:
+    """Run callables on inference threads, round-robin over tenants within each priority"""
+
+    def __init__(self, workers: int = 1, batch_share: int = 4):
+        self.workers = max(1, workers)
+        self.batch_share = max(1, batch_share)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="inference")
+        # priority -> tenant -> that tenant's waiting jobs; dict order is the turn order
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Job]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self._lock = threading.Lock()
+        self._running = 0
+        self._interactive_streak = 0
+        self._completed = {p: 0 for p in PRIORITIES}
+        self._tenant_seconds = TopCounter()
+
+    def submit(self, tenant: str, priority: str, fn: Callable[[], Any]) -> Future:
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority: {priority}")
+        job = _Job(tenant, priority, fn)
+        with self._lock:
+            self._queues[priority].setdefault(tenant, deque()).append(job)
+            QUEUED_JOBS.inc(priority=priority)
+            self._dispatch()
+        return job.future
+
+    async def run(self, tenant: str, priority: str, fn: Callable[[], Any]) -> Any:
+        """Queue ``fn`` and wait for its result without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(tenant, priority, fn))
+
+    def _next(self) -> _Job:
+        interactive, batch = self._queues[INTERACTIVE], self._queues[BATCH]
+        if batch and (not interactive or self._interactive_streak >= self.batch_share - 1):
+            queue = batch
+            self._interactive_streak = 0
+        else:
+            queue = interactive
+            self._interactive_streak += 1
+        tenant, jobs = queue.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            # Back of the line until every other waiting tenant has had a turn
+            queue[tenant] = jobs
+        QUEUED_JOBS.dec(priority=job.priority)
+        return job
+
+    def _dispatch(self):
+        # Called with the lock held
+        while self._running < self.workers and any(self._queues.values()):
+            job = self._next()
+            if not job.future.set_running_or_notify_cancel():
+                continue  # The caller went away while the job was queued
+            self._running += 1
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: _Job):
+        started = time.perf_counter()
+        QUEUE_WAIT_SECONDS.observe(started - job.queued, priority=job.priority)
+        try:
+            job.future.set_result(job.fn())
+        except BaseException as e:
+            job.future.set_exception(e)
+        finally:
+            seconds = time.perf_counter() - started
+            tenant = tenant_label(job.tenant)
+            TENANT_JOBS.inc(tenant=tenant, priority=job.priority)
+            TENANT_SECONDS.inc(seconds, tenant=tenant, priority=job.priority)
+            self._tenant_seconds.add(job.tenant, seconds)
+            with self._lock:
+                self._running -= 1
+                self._completed[job.priority] += 1
+                self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'running': self._running,
+                'batch_share': self.batch_share,
+                'queued': {p: sum(len(jobs) for jobs in q.values()) for p, q in self._queues.items()},
+                'waiting_tenants': {p: len(q) for p, q in self._queues.items()},
+                'completed': dict(self._completed),
+                'top_tenants': [{'tenant': tenant, 'seconds': round(seconds, 3)}
+                                for tenant, seconds in self._tenant_seconds.top()],
+            }
+
+
+inference_scheduler = FairScheduler(
+    workers=int(os.getenv("INFERENCE_CONCURRENCY", "1")),
+    batch_share=int(os.getenv("SCHEDULER_BATCH_SHARE", "4")),
+)
@@ -0,0 +1,195 @@
+"""
+Pre-fork serving with model weights in shared memory
+
+Plain ``uvicorn --workers N`` imports the app, and loads every model, once
+per worker, so N workers hold N copies of the VGG19 encoder and decoder.
+``python serving.py`` instead loads the models once in a parent process,
+moves their parameters into shared memory (``Module.share_memory()``) and
+forks the workers, which map the same read-only pages; per-worker memory
+then grows with activations only. Compare ``Pss`` with ``Rss`` in the
+health endpoint's ``model_memory`` to see the sharing.
+
+Usage:
+    python serving.py --workers 4 --port 8000
+
+Each worker gets a slot number for ``runtime.configure_runtime`` (thread
+counts and ``CPU_AFFINITY``), and the parent restarts workers that exit.
+
+Thread pools do not survive ``fork()``: a worker that inherits an OpenMP
+(libgomp) or MKL pool the parent already started can hang in its first
+parallel region. The parent therefore pins PyTorch to one thread before it
+loads the models (``pin_parent_threads``), so no pool exists when it forks,
+and each worker sizes its own pools with ``configure_runtime`` after the
+fork. Nothing in the parent may raise the thread count before forking.
+"""
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List
+
+if TYPE_CHECKING:
+    import torch  # imported by the model modules; the API reports memory without loading it
+
+
+def share_model(model: 'torch.nn.Module') -> 'torch.nn.Module':
+    """Freeze a model for inference and move its tensors into shared memory"""
+    model.eval()
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    return model.share_memory()
+
+
+def pin_parent_threads():
+    """Run PyTorch on one thread in the pre-fork parent, so it starts no pool the workers would inherit"""
+    import torch
+    torch.set_num_threads(1)
+    if torch.get_num_interop_threads() != 1:
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already started; PyTorch rebuilds its inter-op pool in forked children
+
+
+def _tensors(models: Dict[str, 'torch.nn.Module']) -> Iterable['torch.Tensor']:
+    for model in models.values():
+        yield from model.parameters()
+        yield from model.buffers()
+
+
+def read_smaps_rollup() -> Dict[str, int]:
+    """Memory of this process from /proc (Linux only), in bytes"""
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'):
+                    usage[key.lower()] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+def memory_report(models: Dict[str, 'torch.nn.Module']) -> Dict[str, Any]:
+    """Weight bytes, whether they live in shared memory, and process memory"""
+    tensors = list(_tensors(models))
+    storages = {t.untyped_storage().data_ptr(): t.untyped_storage().nbytes() for t in tensors}
+    return {
+        'models': sorted(models),
+        'weight_bytes': sum(storages.values()),
+        'weights_shared': bool(tensors) and all(t.is_shared() for t in tensors),
+        'process': read_smaps_rollup(),
+    }
+
+
+def _run_worker(slot: int, workers: int, sock: socket.socket, args: argparse.Namespace):
+    import uvicorn
+    from runtime import configure_runtime
+    from app import app
+
+    print(f"Worker {slot} (pid {os.getpid()}): {configure_runtime(workers=workers, slot=slot)}")
+    config = uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(args: argparse.Namespace) -> int:
+    # Before anything loads torch work; workers configure their own pools after the fork
+    pin_parent_threads()
+    import app as app_module
+    from auth import init_db
+    from database import db
+
+    # Migrate once here so the workers' lifespan hooks find the schema current
+    db.init_database()
+    init_db()
+    for model_type in args.models:
+        app_module.models[model_type] = share_model(app_module.get_model(model_type))
+    print(f"Loaded models into shared memory: {memory_report(app_module.models)}")
+
+    # Connections must not cross fork(); each worker opens its own pool
+    db.backend.close()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(args.backlog)
+    sock.set_inheritable(True)
+
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def spawn(slot: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                _run_worker(slot, args.workers, sock, args)
+            except BaseException as e:
+                print(f"Worker {slot} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = slot
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for slot in range(args.workers):
+        spawn(slot)
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        slot = children.pop(pid, None)
+        if slot is not None and not stopping:
+            print(f"Worker {slot} (pid {pid}) exited with status {status}; restarting")
+            time.sleep(args.restart_delay)
+            spawn(slot)
+    sock.close()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing model weights")
+    parser.add_argument('--host', default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument('--port', type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument('--workers', type=int, default=int(os.getenv("WEB_CONCURRENCY", "2")))
+    parser.add_argument('--models', type=lambda s: s.split(','),
+                        default=os.getenv("PRELOAD_MODELS", "adain,cartoon").split(','),
+                        help="Model types to load into shared memory before forking")
+    parser.add_argument('--backlog', type=int, default=2048)
+    parser.add_argument('--keep-alive', type=int, default=5)
+    parser.add_argument('--restart-delay', type=float, default=1.0)
+    parser.add_argument('--log-level', default='info')
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    # Workers size their thread pools for this many processes
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    return serve(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
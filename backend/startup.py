@@ -0,0 +1,120 @@
+"""
+Startup timing and background warm-up
+
+Importing the API no longer pulls in PyTorch, torchvision or OpenCV, and the
+databases are initialized in the lifespan hook, so a fresh process answers
+``/api/v1/health`` (liveness) within a second or two. The heavy work runs
+afterwards on a warm-up thread: importing torch, applying the runtime
+settings and loading the models listed in ``PRELOAD_MODELS``.
+``/api/v1/ready`` returns 503 until that thread has finished, so a load
+balancer or autoscaler only routes traffic to warm workers.
+
+``STARTUP_WARMUP=0`` skips the warm-up; the process is then ready as soon
+as it serves requests and models load on first use.
+
+The report (``/api/v1/ready`` and the health endpoint) lists how long each
+phase took and when the milestones were reached, in seconds since the
+process started.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def process_age() -> Optional[float]:
+    """Seconds since this process was started, from /proc (Linux only)"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime) in clock ticks since boot; the command name may contain spaces
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupReport:
+    """Phase durations, milestones and readiness of this process"""
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        # Time the interpreter spent before this module was imported
+        self._offset = process_age() or 0.0
+        self.phases: Dict[str, float] = {}
+        self.milestones: Dict[str, float] = {}
+        self.state = 'starting'
+        self.error: Optional[str] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def elapsed(self) -> float:
+        """Seconds since the process started"""
+        return self._offset + time.perf_counter() - self._started
+
+    def mark(self, milestone: str):
+        self.milestones[milestone] = round(self.elapsed(), 3)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(time.perf_counter() - start, 3)
+
+    def start_warmup(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        """Run ``steps`` in order on a background thread; the process is ready when they finish"""
+        if self._thread is not None:
+            return
+        if not steps:
+            self._finish()
+            return
+        self.state = 'warming_up'
+        self._thread = threading.Thread(target=self._warmup, args=(steps,), name="warmup", daemon=True)
+        self._thread.start()
+
+    def _warmup(self, steps: List[Tuple[str, Callable[[], Any]]]):
+        try:
+            for name, step in steps:
+                with self.phase(name):
+                    step()
+        except Exception as e:
+            self.state = 'failed'
+            self.error = f"{name}: {e}"
+            print(f"Warm-up failed: {self.error}")
+            return
+        self._finish()
+        print(f"Startup report: {self.report()}")
+
+    def _finish(self):
+        self.state = 'ready'
+        self.mark('ready')
+        self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'ready': self.ready,
+            'error': self.error,
+            'uptime_seconds': round(self.elapsed(), 3),
+            'milestones': dict(self.milestones),
+            'phases': dict(self.phases),
+        }
+
+
+def warmup_enabled() -> bool:
+    return os.getenv("STARTUP_WARMUP", "1").lower() not in ("0", "false", "no")
+
+
+startup = StartupReport()
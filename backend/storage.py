@@ -0,0 +1,127 @@
+"""
+Storage backends for the AI Style Transfer Studio database
+
+``DatabaseManager`` talks to the database only through a ``StorageBackend``,
+which hands out pooled DB-API connections. Queries are written with qmark
+(``?``) placeholders and SQLite-compatible SQL; another backend (for example
+a local Postgres stand-in) satisfies the interface by returning connections
+whose cursors accept that dialect.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+
+class StorageBackend(ABC):
+    """Interface every database backend implements"""
+
+    dialect = "sql"
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Borrow a connection; commit on success, roll back on error"""
+        conn = self.acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    @abstractmethod
+    def acquire(self) -> Any:
+        """Take a connection from the pool"""
+
+    @abstractmethod
+    def release(self, conn: Any):
+        """Return a connection to the pool"""
+
+    @abstractmethod
+    def close(self):
+        """Close every pooled connection"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {'dialect': self.dialect}
+
+
+class SQLiteBackend(StorageBackend):
+    """Pooled SQLite connections in WAL mode
+
+    WAL lets readers proceed while a writer commits, and ``synchronous=NORMAL``
+    avoids an fsync per transaction (durability is kept across application
+    crashes; only an OS crash can lose the last transactions).
+    """
+
+    dialect = "sqlite"
+
+    def __init__(self, path: str, pool_size: int = 8, timeout: float = 30.0):
+        self.path = path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._pool.get(timeout=self.timeout)
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._pool.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {'dialect': self.dialect, 'path': self.path, 'pool_size': self.pool_size,
+                'connections': self._created, 'idle': self._pool.qsize()}
+
+
+def create_backend(url: str = None) -> StorageBackend:
+    """Build a backend from a DATABASE_URL such as ``sqlite:///data/app.db``"""
+    url = url or os.getenv("DATABASE_URL", "sqlite:///data/app.db")
+    pool_size = int(os.getenv("DATABASE_POOL_SIZE", "8"))
+    if url.startswith("sqlite:///"):
+        return SQLiteBackend(url[len("sqlite:///"):], pool_size=pool_size)
+    raise ValueError(f"Unsupported DATABASE_URL: {url}")
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Backend modules are imported top-level (``import jobqueue``), as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Module-level singletons (db, blob_store, temp_storage, ...) are built at
+# import time; keep whatever they touch out of the working tree
+_scratch = tempfile.mkdtemp(prefix="style-studio-tests-")
+os.environ.update({
+    'DATABASE_URL': f"sqlite:///{_scratch}/app.db",
+    'JOB_QUEUE_URL': "memory://",
+    'BLOB_STORE_ROOT': os.path.join(_scratch, "blobs"),
+    'TEMP_STORAGE_DIR': os.path.join(_scratch, "tmp"),
+    'PROFILE_DIR': os.path.join(_scratch, "profiles"),
+    'RUNTIME_DIR': os.path.join(_scratch, "runtime"),
+})
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A migrated DatabaseManager on its own SQLite file"""
+    from database import DatabaseManager
+    from storage import SQLiteBackend
+
+    backend = SQLiteBackend(str(tmp_path / 'app.db'), pool_size=2)
+    yield DatabaseManager(backend)
+    backend.close()
@@ -0,0 +1,63 @@
+import pytest
+
+import admission as admission_module
+from admission import ACCEPT, DEGRADE, SHED, AdmissionController
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(admission_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def controller(**kwargs):
+    settings = dict(latency_slo=1.0, shed_factor=2.0, degrade_queue=2, max_queue=4, window=30.0, min_samples=3)
+    settings.update(kwargs)
+    return AdmissionController(**settings)
+
+
+def test_queue_depth_thresholds():
+    control = controller()
+    assert [control.admit() for _ in range(5)] == [ACCEPT, ACCEPT, DEGRADE, DEGRADE, SHED]
+    assert control.in_flight == 4
+    assert control.readiness()[0] is False
+    assert control.retry_after() >= 1
+    control.release()
+    assert control.readiness() == (True, ['queue depth 3 >= 2'])
+    assert control.stats()['decisions'] == {ACCEPT: 2, DEGRADE: 2, SHED: 1}
+
+
+def test_latency_degrades_and_sheds(clock):
+    control = controller()
+    for seconds in (1.5, 1.5):
+        control.admit()
+        control.release(seconds)
+    assert control.admit() == ACCEPT  # too few samples to count
+    control.release(1.5)
+    assert control.admit() == DEGRADE
+    for _ in range(3):
+        control.release(3.0)
+    assert control.stats()['latency_p95_seconds'] == 3.0
+    # Far beyond the SLO: one request still runs when nothing is in flight, the next is shed
+    assert control.admit() == DEGRADE
+    assert control.admit() == SHED
+
+
+def test_latency_spike_expires_from_the_window(clock):
+    control = controller()
+    for _ in range(3):
+        control.admit()
+        control.release(5.0)
+    control.admit()
+    assert control.admit() == SHED
+    clock[0] += 31
+    assert control.admit() == ACCEPT
+    assert control.stats()['latency_samples'] == 0
+
+
+def test_settings_from_the_environment(monkeypatch):
+    monkeypatch.setenv('ADMISSION_LATENCY_SLO_MS', '250')
+    monkeypatch.setenv('ADMISSION_MAX_QUEUE', '16')
+    control = admission_module.create_admission_controller()
+    assert (control.latency_slo, control.max_queue, control.degrade_queue) == (0.25, 16, 4)
@@ -0,0 +1,64 @@
+import json
+import time
+
+from analytics import AnalyticsBuffer
+
+
+def test_flush_writes_batches_of_rows():
+    batches = []
+    buffer = AnalyticsBuffer(batches.append, batch_size=2)
+    # Queued directly so the background flusher does not race the explicit flush
+    for i in range(5):
+        buffer._queue.put_nowait((i, 'style_transfer', {'n': i}, '127.0.0.1', 'ua', 'ts'))
+    assert buffer.flush() == 5
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    user_id, action, details, ip_address, user_agent, created_at = batches[0][0]
+    assert (user_id, action, json.loads(details), ip_address) == (0, 'style_transfer', {'n': 0}, '127.0.0.1')
+    assert buffer.stats()['written'] == 5
+    assert buffer.stats()['batches'] == 3
+
+
+def test_full_queue_drops_and_counts():
+    buffer = AnalyticsBuffer(lambda rows: None, max_queue_size=2, flush_interval=60)
+    try:
+        results = [buffer.record(1, 'login') for _ in range(4)]
+        assert results == [True, True, False, False]
+        stats = buffer.stats()
+        assert (stats['enqueued'], stats['dropped'], stats['pending']) == (2, 2, 2)
+    finally:
+        buffer.close()
+
+
+def test_failed_write_is_counted_not_raised():
+    def fail(rows):
+        raise RuntimeError("database is locked")
+
+    buffer = AnalyticsBuffer(fail)
+    buffer._queue.put_nowait((1, 'login', None, None, None, 'ts'))
+    assert buffer.flush() == 0
+    assert buffer.stats()['failed'] == 1
+
+
+def test_background_thread_flushes_on_interval_and_close():
+    written = []
+    buffer = AnalyticsBuffer(written.extend, batch_size=100, flush_interval=0.05)
+    buffer.record(1, 'login')
+    deadline = time.monotonic() + 5
+    while not written and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(written) == 1
+
+    buffer.record(2, 'logout')
+    buffer.close()
+    assert [row[1] for row in written] == ['login', 'logout']
+    assert not buffer.stats()['running']
+
+
+def test_batches_reach_the_database(db):
+    buffer = AnalyticsBuffer(db.log_user_actions)
+    buffer.record(1, 'style_transfer', {'model': 'adain'})
+    buffer.record(2, 'style_transfer')
+    buffer.close()
+    summary = db.get_analytics_summary()
+    assert summary['actions_30d'] == {'style_transfer': 2}
+    assert summary['active_users_30d'] == 2
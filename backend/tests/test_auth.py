@@ -0,0 +1,101 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+import auth
+from cache import TTLCache
+from database import db
+
+
+@pytest.fixture(scope='module', autouse=True)
+def schema():
+    db.init_database()
+
+
+@pytest.fixture
+def user():
+    name = f"user-{uuid.uuid4().hex[:8]}"
+    db.create_user(f"{name}@example.com", name, "Test", "not-a-real-hash")
+    auth._token_cache.clear()
+    return auth.User(**auth.get_user(name).model_dump(exclude={"hashed_password"}))
+
+
+def current_user(token):
+    return asyncio.run(auth.get_current_user(token))
+
+
+def legacy_token(username):
+    # Tokens issued before revocation support carry only sub and exp
+    expire = datetime.utcnow() + timedelta(minutes=30)
+    return jwt.encode({"sub": username, "exp": expire}, auth.SECRET_KEY, algorithm=auth.ALGORITHM)
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=60)
+    assert cache.get('a') == 1
+    time.sleep(0.06)
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.remove_where(lambda key, value: value > 2) == 1
+    assert len(cache) == 1
+
+
+def test_token_claims_resolve_and_cache_the_user(user):
+    token = auth.create_access_token(auth.user_claims(user))
+    resolved = current_user(token)
+    assert (resolved.id, resolved.username, resolved.is_active) == (user.id, user.username, True)
+    assert auth._token_cache.get(token) is resolved
+
+
+def test_revocation_rejects_earlier_tokens_on_every_worker(user):
+    token = auth.create_access_token(auth.user_claims(user))
+    current_user(token)
+    auth.invalidate_user(user.username)
+    assert db.get_tokens_valid_after(user.username) > 0
+    with pytest.raises(HTTPException) as excinfo:
+        current_user(token)
+    assert excinfo.value.status_code == 401
+
+    # Another worker's cache entry expires; the shared revocation time still applies
+    auth._token_cache.clear()
+    with pytest.raises(HTTPException):
+        current_user(token)
+
+    time.sleep(0.01)
+    assert current_user(auth.create_access_token(auth.user_claims(user))).username == user.username
+
+
+def test_tokens_without_iat_stay_valid_until_revocation(user):
+    token = legacy_token(user.username)
+    assert current_user(token).username == user.username
+
+    auth.invalidate_user(user.username)
+    with pytest.raises(HTTPException) as excinfo:
+        current_user(token)
+    assert excinfo.value.status_code == 401
+
+
+def test_deactivation_reaches_token_claims(user):
+    token = auth.create_access_token(auth.user_claims(user))
+    current_user(token)
+    auth.deactivate_user(user.username)
+    with pytest.raises(HTTPException):
+        current_user(token)
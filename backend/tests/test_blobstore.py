@@ -0,0 +1,146 @@
+import hashlib
+import io
+import re
+
+import pytest
+
+from blobstore import (BlobNotFound, LocalBlobStore, S3BlobStore, content_key, derived_key,
+                       parse_range)
+
+
+class ClientError(Exception):
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3Client:
+    """The subset of the boto3 S3 client the store uses, kept in a dict"""
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.calls.append(('put_object', Bucket, Key))
+        self.objects[(Bucket, Key)] = (bytes(Body), ContentType)
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError('404')
+        body, content_type = self.objects[(Bucket, Key)]
+        return {'ContentLength': len(body), 'ContentType': content_type}
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.calls.append(('get_object', Key, Range))
+        if (Bucket, Key) not in self.objects:
+            raise ClientError('NoSuchKey')
+        body = self.objects[(Bucket, Key)][0]
+        if Range:
+            start, end = re.match(r'bytes=(\d+)-(\d*)$', Range).groups()
+            body = body[int(start):int(end) + 1 if end else None]
+        return {'Body': io.BytesIO(body)}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+
+@pytest.fixture(params=['local', 's3'])
+def store(request, tmp_path):
+    if request.param == 'local':
+        return LocalBlobStore(str(tmp_path / 'blobs'))
+    return S3BlobStore('bucket', prefix='/results/', client=FakeS3Client())
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('', None),
+    ('items=0-1', None),
+    ('bytes=0-0', (0, 0)),
+    ('bytes=0-99', (0, 99)),
+    ('bytes=10-', (10, 99)),
+    ('bytes=90-500', (90, 99)),
+    ('bytes=-10', (90, 99)),
+    ('bytes=-500', (0, 99)),
+    ('bytes=0-1,5-6', None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize('header', ['bytes=100-', 'bytes=50-10', 'bytes=-0', 'bytes=a-b', 'bytes=-', 'bytes=5'])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
+
+
+def test_keys():
+    key = content_key(b'data', 'image/png')
+    assert key == f"{hashlib.sha256(b'data').hexdigest()}.png"
+    assert derived_key(key, 'w320', 'webp') == key.replace('.png', '_w320.webp')
+    assert derived_key(derived_key(key, 'input'), 'w64') == key.replace('.png', '_w64.png')
+    with pytest.raises(ValueError):
+        content_key(b'data', 'application/octet-stream')
+
+
+def test_put_is_idempotent_and_ranged(store):
+    data = bytes(range(256)) * 4
+    info = store.put(data, 'image/jpeg')
+    assert info.key.endswith('.jpg') and info.size == len(data)
+    assert info.etag == f'"{info.key}"'
+    assert store.put(data, 'image/jpeg').key == info.key
+    assert store.get(info.key) == data
+    assert store.get_range(info.key, 10, 19) == data[10:20]
+    assert store.get_range(info.key, 1000) == data[1000:]
+    stat = store.stat(info.key)
+    assert (stat.size, stat.content_type) == (len(data), 'image/jpeg')
+
+
+def test_missing_and_invalid_keys(store):
+    key = content_key(b'x', 'image/png')
+    assert not store.exists(key)
+    with pytest.raises(BlobNotFound):
+        store.stat(key)
+    with pytest.raises(BlobNotFound):
+        store.get(key)
+    with pytest.raises(BlobNotFound):
+        store.get('../../etc/passwd')
+    store.delete(key)
+
+
+def test_get_or_create_builds_once(store):
+    key = derived_key(content_key(b'x', 'image/png'), 'w64', 'webp')
+    built = []
+
+    def build():
+        built.append(1)
+        return b'thumb'
+
+    assert store.get_or_create(key, build).size == 5
+    assert store.get_or_create(key, build).content_type == 'image/webp'
+    assert built == [1]
+    store.delete(key)
+    assert not store.exists(key)
+
+
+def test_s3_store_uses_prefix_and_range_requests():
+    client = FakeS3Client()
+    store = S3BlobStore('bucket', prefix='results', client=client)
+    info = store.put(b'0123456789', 'image/png')
+    assert ('bucket', f"results/{info.key}") in client.objects
+    assert store.get_range(info.key, 2, 4) == b'234'
+    assert store.get_range(info.key, 7) == b'789'
+    assert store.get(info.key) == b'0123456789'
+    ranges = [call[2] for call in client.calls if call[0] == 'get_object']
+    assert ranges == ['bytes=2-4', 'bytes=7-', None]
+    assert store.local_path(info.key) is None
+
+
+def test_s3_store_propagates_other_errors():
+    class BrokenClient(FakeS3Client):
+        def head_object(self, Bucket, Key):
+            raise ClientError('AccessDenied')
+
+    store = S3BlobStore('bucket', client=BrokenClient())
+    with pytest.raises(ClientError):
+        store.stat(content_key(b'x', 'image/png'))
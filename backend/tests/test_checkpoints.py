@@ -0,0 +1,80 @@
+import struct
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from checkpoints import (CheckpointError, CheckpointFile, find_checkpoint, load_into, load_state,
+                         save_checkpoint)
+
+
+@pytest.fixture
+def tensors():
+    return {
+        'conv.weight': torch.arange(24, dtype=torch.float32).reshape(2, 3, 2, 2),
+        'conv.bias': torch.tensor([0.5, -1.5], dtype=torch.float32),
+        'steps': torch.tensor([7], dtype=torch.int64),
+        'half': torch.ones(3, dtype=torch.float16),
+    }
+
+
+def test_round_trip_is_memory_mapped(tmp_path, tensors):
+    path = str(tmp_path / 'decoder.safetensors')
+    save_checkpoint(path, tensors, {'variant': 'adain'})
+    checkpoint = CheckpointFile(path)
+    assert sorted(checkpoint.keys()) == sorted(tensors)
+    assert checkpoint.metadata['variant'] == 'adain'
+    assert checkpoint.data_start % 8 == 0
+    assert checkpoint.verify()
+    loaded = load_state(path)
+    for name, tensor in tensors.items():
+        assert torch.equal(loaded[name], tensor)
+        assert loaded[name].dtype == tensor.dtype
+
+
+def test_checksum_mismatch_is_rejected(tmp_path, tensors, monkeypatch):
+    path = str(tmp_path / 'decoder.safetensors')
+    save_checkpoint(path, tensors)
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xFF]))
+    assert not CheckpointFile(path).verify()
+    with pytest.raises(CheckpointError, match='checksum mismatch'):
+        load_state(path)
+
+    monkeypatch.setenv('CHECKPOINT_VERIFY', '0')
+    assert set(load_state(path)) == set(tensors)
+
+
+@pytest.mark.parametrize('content, message', [
+    (b'\x01\x02', 'truncated header'),
+    (struct.pack('<Q', 1000) + b'{}', 'exceeds file size'),
+    (struct.pack('<Q', 4) + b'nope', 'invalid header'),
+    (struct.pack('<Q', 55) + b'{"w":{"dtype":"F32","shape":[4],"data_offsets":[0,16]}}', 'past the end'),
+])
+def test_malformed_files_are_rejected(tmp_path, content, message):
+    path = tmp_path / 'bad.safetensors'
+    path.write_bytes(content)
+    with pytest.raises(CheckpointError, match=message):
+        CheckpointFile(str(path))
+
+
+def test_load_into_assigns_mapped_parameters(tmp_path):
+    source = torch.nn.Linear(3, 2)
+    path = str(tmp_path / 'linear.safetensors')
+    save_checkpoint(path, source.state_dict())
+    target = load_into(torch.nn.Linear(3, 2), path)
+    assert torch.equal(target.weight, source.weight)
+    assert target.checkpoint_path == path
+    x = torch.randn(4, 3)
+    assert torch.allclose(target(x), source(x))
+
+
+def test_find_checkpoint_prefers_the_variant(tmp_path):
+    for name in ('decoder.pth', 'decoder.safetensors', 'decoder-cartoon.safetensors'):
+        (tmp_path / name).write_bytes(b'')
+    assert find_checkpoint('decoder', 'cartoon', str(tmp_path)).endswith('decoder-cartoon.safetensors')
+    assert find_checkpoint('decoder', 'adain', str(tmp_path)).endswith('decoder.safetensors')
+    assert find_checkpoint('encoder', None, str(tmp_path)) is None
@@ -0,0 +1,63 @@
+import io
+import time
+
+import pytest
+from PIL import Image
+
+from blobstore import BlobNotFound, LocalBlobStore, content_key
+from derivatives import DerivativeGenerator
+from image_processor import AdvancedImageProcessor
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path / 'blobs'))
+
+
+@pytest.fixture
+def generator(store):
+    generator = DerivativeGenerator(store, AdvancedImageProcessor(), widths=(160, 320), formats=('webp', 'jpeg'))
+    yield generator
+    generator._executor.shutdown(wait=True)
+
+
+@pytest.fixture
+def original(store):
+    buffer = io.BytesIO()
+    Image.new('RGB', (800, 400), (30, 120, 200)).save(buffer, 'PNG')
+    return store.put(buffer.getvalue(), 'image/png').key
+
+
+def open_blob(store, key):
+    return Image.open(io.BytesIO(store.get(key)))
+
+
+def test_best_fit_picks_the_smallest_covering_width(generator, store, original):
+    info, fmt = generator.best_fit(original, 200, 'image/webp')
+    assert fmt == 'webp'
+    assert info.key == generator.key_for(original, 320, 'webp')
+    image = open_blob(store, info.key)
+    assert (image.format, image.size) == ('WEBP', (320, 160))
+
+
+def test_best_fit_caps_at_the_largest_width_and_falls_back_to_jpeg(generator, store, original):
+    info, fmt = generator.best_fit(original, 5000, '*/*')
+    assert (fmt, info.key) == ('jpeg', generator.key_for(original, 320, 'jpeg'))
+    assert open_blob(store, info.key).format == 'JPEG'
+
+
+def test_best_fit_reuses_generated_derivatives(generator, store, original):
+    generator.schedule(original)
+    deadline = time.monotonic() + 10
+    while generator.stats()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert generator.stats()['generated'] == 4
+    key = generator.key_for(original, 160, 'webp')
+    written = store.stat(key)
+    assert generator.best_fit(original, 100, 'image/webp')[0].size == written.size
+    assert open_blob(store, key).size == (160, 80)
+
+
+def test_best_fit_of_a_missing_original(generator):
+    with pytest.raises(BlobNotFound):
+        generator.best_fit(content_key(b'missing', 'image/png'), 160, None)
@@ -0,0 +1,52 @@
+import pytest
+
+from encoding import accepted_format, negotiate_format, parse_accept, supported_formats
+
+CHROME_ACCEPT = 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8'
+
+
+def test_parse_accept_q_values():
+    assert parse_accept('image/webp;q=0.5, image/avif ; q=0, */*;q=0.1') == {
+        'image/webp': 0.5, 'image/avif': 0.0, '*/*': 0.1}
+    assert parse_accept('image/png;q=2') == {'image/png': 1.0}
+    assert parse_accept('image/png;q=bad') == {'image/png': 0.0}
+    assert parse_accept('image/webp;q=0.2, IMAGE/WEBP') == {'image/webp': 1.0}
+    assert parse_accept(None) == {}
+
+
+def test_accepted_format_prefers_higher_q_then_avif():
+    formats = ('jpeg', 'webp', 'avif', 'png')
+    assert accepted_format(CHROME_ACCEPT, formats) == 'avif'
+    assert accepted_format('image/avif;q=0.5, image/webp', formats) == 'webp'
+    assert accepted_format('image/avif', ('jpeg', 'webp')) == 'jpeg'
+
+
+def test_accepted_format_ignores_wildcards_and_refusals():
+    formats = ('jpeg', 'webp', 'avif')
+    assert accepted_format('*/*', formats) == 'jpeg'
+    assert accepted_format('image/*', formats) == 'jpeg'
+    assert accepted_format('image/webp;q=0', formats) == 'jpeg'
+    # Substrings of other media types do not count
+    assert accepted_format('image/webpx, application/avif', formats) == 'jpeg'
+
+
+def test_negotiate_format_explicit_request_wins():
+    assert negotiate_format('JPG', 'webp', CHROME_ACCEPT) == 'jpeg'
+    with pytest.raises(ValueError):
+        negotiate_format('gif', None, None)
+
+
+def test_negotiate_format_stored_preference_over_accept():
+    assert negotiate_format(None, 'png', 'image/webp') == 'png'
+    assert negotiate_format(None, 'auto', 'image/webp') == 'webp'
+    assert negotiate_format(None, 'bmp', 'image/webp') == 'jpeg'
+
+
+@pytest.mark.skipif('webp' not in supported_formats(), reason="Pillow built without WebP")
+def test_user_without_preferences_gets_accept_negotiation(db):
+    preferred = db.get_user_preferences(12345)['preferred_output_format']
+    assert negotiate_format(None, preferred, 'image/webp') == 'webp'
+
+    db.save_user_preferences(12345, {'theme': 'light'})
+    preferred = db.get_user_preferences(12345)['preferred_output_format']
+    assert negotiate_format(None, preferred, 'image/webp') == 'webp'
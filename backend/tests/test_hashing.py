@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import uuid
+
+import pytest
+
+import auth
+from database import db
+from hashing import HashingOverloaded, PasswordHasher, create_crypt_context
+
+
+class BlockingContext:
+    """Stands in for a CryptContext whose hash calls wait for a signal"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def hash(self, password):
+        self.release.wait(5)
+        return f"hashed:{password}"
+
+
+def test_overloaded_hasher_rejects_instead_of_queueing():
+    context = BlockingContext()
+    hasher = PasswordHasher(context, max_workers=1, max_waiting=1)
+
+    async def scenario():
+        running = asyncio.ensure_future(hasher.hash('a'))
+        while hasher.stats()['running'] == 0:
+            await asyncio.sleep(0.001)
+        waiting = asyncio.ensure_future(hasher.hash('b'))
+        await asyncio.sleep(0.01)
+        with pytest.raises(HashingOverloaded):
+            await hasher.hash('c')
+        context.release.set()
+        return await asyncio.gather(running, waiting)
+
+    try:
+        assert asyncio.run(scenario()) == ['hashed:a', 'hashed:b']
+    finally:
+        context.release.set()
+        hasher.shutdown()
+    stats = hasher.stats()
+    assert (stats['completed'], stats['rejected'], stats['waiting'], stats['running']) == (2, 1, 0, 0)
+
+
+def test_verify_reports_hashes_with_another_cost():
+    hasher = PasswordHasher(create_crypt_context(5))
+    try:
+        old_hash = create_crypt_context(4).hash('secret')
+        assert asyncio.run(hasher.verify('wrong', old_hash)) == (False, None)
+        valid, new_hash = asyncio.run(hasher.verify('secret', old_hash))
+        assert valid and new_hash.startswith('$2b$05$')
+        assert asyncio.run(hasher.verify('secret', new_hash)) == (True, None)
+        assert hasher.stats()['rehashed'] == 1
+    finally:
+        hasher.shutdown()
+
+
+def test_login_rehashes_a_stale_hash(monkeypatch):
+    db.init_database()
+    hasher = PasswordHasher(create_crypt_context(5))
+    monkeypatch.setattr(auth, 'password_hasher', hasher)
+    name = f"user-{uuid.uuid4().hex[:8]}"
+    db.create_user(f"{name}@example.com", name, None, create_crypt_context(4).hash('secret'))
+    try:
+        assert not asyncio.run(auth.authenticate_user_async(name, 'wrong'))
+        assert auth.get_user(name).hashed_password.startswith('$2b$04$')
+        assert asyncio.run(auth.authenticate_user_async(name, 'secret')).username == name
+        assert auth.get_user(name).hashed_password.startswith('$2b$05$')
+    finally:
+        hasher.shutdown()
@@ -0,0 +1,77 @@
+import os
+import time
+
+import pytest
+
+from janitor import StorageJanitor
+
+
+def write(janitor, category, size, name=None):
+    def save(path):
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+
+    return janitor.write(category, save, name=name)
+
+
+def test_expired_files_are_deleted(tmp_path):
+    janitor = StorageJanitor(str(tmp_path), ttls={'previews': 0.0, 'uploads': 3600})
+    preview = write(janitor, 'previews', 10)
+    upload = write(janitor, 'uploads', 20)
+    assert janitor.collect() == {'expired': 1, 'evicted': 0, 'bytes_freed': 10}
+    assert not os.path.exists(preview)
+    assert os.path.exists(upload)
+    stats = janitor.stats()
+    assert (stats['files'], stats['bytes'], stats['categories']) == (1, 20, {'uploads': {'files': 1, 'bytes': 20}})
+
+
+def test_oldest_files_are_evicted_over_quota(tmp_path):
+    janitor = StorageJanitor(str(tmp_path), quota_bytes=250)
+    paths = [write(janitor, 'generated', 100) for _ in range(4)]
+    assert janitor.collect() == {'expired': 0, 'evicted': 2, 'bytes_freed': 200}
+    assert [os.path.exists(path) for path in paths] == [False, False, True, True]
+    assert janitor.stats()['bytes'] == 200
+
+
+def test_rewriting_a_path_replaces_its_entry(tmp_path):
+    janitor = StorageJanitor(str(tmp_path), quota_bytes=150)
+    write(janitor, 'batch', 100, name='same.jpg')
+    write(janitor, 'batch', 120, name='same.jpg')
+    assert janitor.stats()['bytes'] == 120
+    assert janitor.collect()['evicted'] == 0
+
+
+def test_unknown_category_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        StorageJanitor(str(tmp_path)).path_for('cache')
+
+
+def test_scan_adopts_leftover_files_by_mtime(tmp_path):
+    old = tmp_path / 'previews' / 'old.jpg'
+    new = tmp_path / 'previews' / 'new.jpg'
+    old.parent.mkdir()
+    for path, age in ((old, 7200), (new, 0)):
+        path.write_bytes(b'x' * 10)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+    (tmp_path / 'unrelated').mkdir()
+    (tmp_path / 'unrelated' / 'keep.txt').write_bytes(b'x')
+
+    janitor = StorageJanitor(str(tmp_path), ttls={'previews': 3600})
+    assert janitor.scan() == 2
+    assert janitor.collect()['expired'] == 1
+    assert not old.exists() and new.exists()
+    assert (tmp_path / 'unrelated' / 'keep.txt').exists()
+
+
+def test_background_thread_wakes_up_over_quota(tmp_path):
+    janitor = StorageJanitor(str(tmp_path), quota_bytes=50, interval=3600)
+    janitor.start()
+    try:
+        path = write(janitor, 'generated', 100)
+        deadline = time.monotonic() + 5
+        while os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not os.path.exists(path)
+    finally:
+        janitor.close()
@@ -0,0 +1,164 @@
+import time
+
+import pytest
+
+from jobqueue import (FAILED, QUEUED, RUNNING, SUCCEEDED, JobWorker, MemoryJobQueue,
+                      PermanentJobError, SQLiteJobQueue, retry_delay)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def queue(request, tmp_path):
+    queue = MemoryJobQueue() if request.param == 'memory' else SQLiteJobQueue(str(tmp_path / 'jobs.db'))
+    queue.init()
+    yield queue
+    queue.close()
+
+
+def expire(job):
+    time.sleep(max(0.0, job.lease_expires - time.time()) + 0.01)
+
+
+def test_claim_leases_one_job(queue):
+    job = queue.enqueue('transfer', {'n': 1})
+    claimed = queue.claim('w1', 60)
+    assert claimed.id == job.id
+    assert claimed.status == RUNNING
+    assert claimed.attempts == 1
+    assert queue.claim('w2', 60) is None
+
+
+def test_claim_filters_kinds(queue):
+    queue.enqueue('transfer', {})
+    assert queue.claim('w1', 60, ['other']) is None
+    assert queue.claim('w1', 60, ['transfer']) is not None
+
+
+def test_expired_lease_rejects_extend_and_complete(queue):
+    queue.enqueue('transfer', {})
+    job = queue.claim('w1', 0.05)
+    expire(job)
+    assert not queue.extend(job, 60)
+    assert not queue.complete(job, {'ok': True})
+    assert not queue.fail(job, 'late')
+    assert queue.get(job.id).status == RUNNING
+
+
+def test_expired_lease_is_reclaimed_and_finished_once(queue):
+    queue.enqueue('transfer', {})
+    first = queue.claim('w1', 0.05)
+    expire(first)
+    second = queue.claim('w2', 60)
+    assert second.id == first.id
+    assert second.attempts == 2
+    assert second.lease_token != first.lease_token
+    assert not queue.complete(first, {'by': 'w1'})
+    assert queue.extend(second, 60)
+    assert queue.complete(second, {'by': 'w2'})
+    done = queue.get(first.id)
+    assert done.status == SUCCEEDED
+    assert done.result == {'by': 'w2'}
+    assert queue.claim('w3', 60) is None
+
+
+def test_expired_lease_on_last_attempt_fails_the_job(queue):
+    queue.enqueue('transfer', {}, max_attempts=1)
+    job = queue.claim('w1', 0.05)
+    expire(job)
+    assert queue.claim('w2', 60) is None
+    failed = queue.get(job.id)
+    assert failed.status == FAILED
+    assert 'Lease expired' in failed.error
+
+
+def test_fail_retries_with_backoff(queue):
+    queue.enqueue('transfer', {}, max_attempts=2)
+    job = queue.claim('w1', 60)
+    before = time.time()
+    assert queue.fail(job, 'boom')
+    retried = queue.get(job.id)
+    assert retried.status == QUEUED
+    assert retried.available_at >= before + retry_delay(1)
+    assert queue.claim('w1', 60) is None
+
+
+def test_fail_without_retry_or_attempts_left_is_final(queue):
+    queue.enqueue('transfer', {}, max_attempts=3)
+    job = queue.claim('w1', 60)
+    assert queue.fail(job, 'bad input', retry=False)
+    assert queue.get(job.id).status == FAILED
+
+    queue.enqueue('transfer', {}, max_attempts=1)
+    job = queue.claim('w1', 60)
+    assert queue.fail(job, 'boom')
+    assert queue.get(job.id).status == FAILED
+
+
+def test_retry_delay_is_exponential_and_capped():
+    assert [retry_delay(n) for n in (1, 2, 3)] == [2.0, 4.0, 8.0]
+    assert retry_delay(20) == 300.0
+
+
+def test_purge_returns_unreferenced_inputs(queue):
+    queue.enqueue('transfer', {'input_keys': ['a', 'shared']})
+    queue.enqueue('transfer', {'input_keys': ['b', 'shared']})
+    job = queue.claim('w1', 60)
+    queue.complete(job, {})
+    time.sleep(0.01)
+    assert queue.purge(time.time()) == ['a']
+    assert queue.get(job.id) is None
+    assert queue.stats()['jobs'] == {QUEUED: 1}
+
+
+def test_purge_keeps_recent_and_unfinished_jobs(queue):
+    queue.enqueue('transfer', {'input_keys': ['a']})
+    job = queue.enqueue('transfer', {'input_keys': ['b']})
+    claimed = queue.claim('w1', 60)
+    queue.complete(claimed, {})
+    assert queue.purge(time.time() - 60) == []
+    assert queue.get(claimed.id) is not None
+    assert queue.get(job.id) is not None
+
+
+def test_worker_runs_and_retries_handlers(queue):
+    calls = []
+
+    def handler(payload):
+        calls.append(payload['n'])
+        if payload['n'] == 2:
+            raise PermanentJobError("invalid input")
+        return {'n': payload['n']}
+
+    ok = queue.enqueue('transfer', {'n': 1})
+    bad = queue.enqueue('transfer', {'n': 2})
+    JobWorker(queue, {'transfer': handler}).run(once=True)
+    assert sorted(calls) == [1, 2]
+    assert queue.get(ok.id).result == {'n': 1}
+    assert queue.get(bad.id).status == FAILED
+
+
+def test_worker_purge_cleans_up_inputs(queue):
+    queue.enqueue('transfer', {'input_keys': ['a']})
+    deleted = []
+    worker = JobWorker(queue, {'transfer': lambda payload: {}}, retention=0.0, cleanup=deleted.extend)
+    worker.run(once=True)
+    time.sleep(0.01)
+    worker._next_purge = 0.0
+    assert worker.purge() == ['a']
+    assert deleted == ['a']
+    assert worker.stats()['purged_inputs'] == 1
+
+
+def test_worker_counts_queue_errors():
+    from metrics import registry
+
+    class BrokenQueue(MemoryJobQueue):
+        def claim(self, worker, visibility_timeout, kinds=None):
+            raise OSError("database is locked")
+
+    worker = JobWorker(BrokenQueue(), {'transfer': lambda payload: {}})
+    worker.run(once=True)
+    worker.run(once=True)
+    stats = worker.stats()
+    assert (stats['errors'], stats['last_error']) == (2, "OSError: database is locked")
+    assert any(line.startswith('style_transfer_job_outcomes_total{outcome="errors"}')
+               for line in registry.render().decode().splitlines())
@@ -0,0 +1,52 @@
+import io
+
+import pytest
+from PIL import Image
+
+pytest.importorskip('torch')
+
+import app as app_module
+from model import StubStyleTransferModel
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def events(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(app_module.analytics, 'record', lambda **event: recorded.append(event))
+    return recorded
+
+
+@pytest.fixture
+def api(db, events, monkeypatch):
+    db.init_database()
+    monkeypatch.setattr(app_module, 'db', db)
+    monkeypatch.setitem(app_module.models, 'adain', StubStyleTransferModel())
+    monkeypatch.setattr(app_module.derivatives, 'schedule', lambda key: None)
+    return app_module
+
+
+def test_transfer_job_records_analytics_and_no_input_paths(api, db, events):
+    content_key = api.store_job_input(png((200, 30, 30)))
+    style_key = api.store_job_input(png((30, 30, 200)))
+    result = api.run_transfer_job({
+        'user_id': 7, 'session_id': 's', 'content_key': content_key, 'style_key': style_key,
+        'input_keys': [content_key, style_key], 'model_type': 'adain', 'style_strength': 1.0,
+        'preserve_content': 0.0, 'artistic_filter': 'none', 'preset_id': None,
+        'output_format': 'webp', 'encode_preset': 'fast', 'progressive': False,
+    })
+    assert result['media_type'] == 'image/webp'
+
+    [row] = db.get_user_history(7)
+    assert row['content_image_path'] is None and row['style_image_path'] is None
+    assert row['result_image_path'] == result['result_url']
+    [event] = events
+    assert (event['user_id'], event['action']) == (7, 'style_transfer')
+    assert event['details']['output_format'] == 'webp'
+    summary = db.get_analytics_summary()
+    assert summary['latency_by_model']['adain']['count'] == 1
@@ -0,0 +1,92 @@
+import pytest
+
+from metrics import (BoundedLabels, Counter, Histogram, MetricsRegistry, StageTimer, TopCounter,
+                     resolution_bucket, tenant_label)
+
+
+def test_bounded_labels_share_other_past_the_cap():
+    labels = BoundedLabels(2)
+    assert [labels(v) for v in ('a', 'b', 'c', 'a', 'd')] == ['a', 'b', 'other', 'a', 'other']
+
+
+def test_anonymous_tenants_share_one_label():
+    assert tenant_label('ip:10.0.0.1') == tenant_label('ip:10.0.0.2') == 'anonymous'
+
+
+def test_top_counter_keeps_the_largest_keys():
+    counter = TopCounter(max_keys=4)
+    for key, amount in [('a', 10), ('b', 1), ('c', 5), ('d', 2), ('e', 3)]:
+        counter.add(key, amount)
+    assert counter.top(2) == [('a', 10.0), ('c', 5.0)]
+    assert len(counter.top()) <= 4
+
+
+def test_counter_and_gauge_rendering():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Requests', ('model_type', 'status'))
+    requests.inc(model_type='adain', status='ok')
+    requests.inc(2, model_type='adain', status='ok')
+    requests.inc(model_type='cartoon', status='error')
+    registry.gauge('in_flight', 'In flight').set(3)
+    assert registry.render().decode() == (
+        '# HELP requests_total Requests\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{model_type="adain",status="ok"} 3.0\n'
+        'requests_total{model_type="cartoon",status="error"} 1.0\n'
+        '# HELP in_flight In flight\n'
+        '# TYPE in_flight gauge\n'
+        'in_flight 3\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, stage='model')
+    assert histogram.render()[2:] == [
+        'latency_seconds_bucket{stage="model",le="0.1"} 1',
+        'latency_seconds_bucket{stage="model",le="1.0"} 3',
+        'latency_seconds_bucket{stage="model",le="+Inf"} 4',
+        'latency_seconds_sum{stage="model"} 6.05',
+        'latency_seconds_count{stage="model"} 4',
+    ]
+
+
+def test_label_values_are_escaped_and_checked():
+    counter = Counter('errors_total', 'Errors', ('detail',))
+    counter.inc(detail='bad "quote"\\\n')
+    assert counter.render()[-1] == 'errors_total{detail="bad \\"quote\\"\\\\\\n"} 1.0'
+    with pytest.raises(ValueError):
+        counter.inc(reason='x')
+
+
+def test_duplicate_registration_is_rejected():
+    registry = MetricsRegistry()
+    registry.counter('x_total', 'X')
+    with pytest.raises(ValueError):
+        registry.gauge('x_total', 'X')
+
+
+def test_stage_timer_and_resolution_buckets():
+    timer = StageTimer()
+    timer.add('queue', 0.25)
+    timer.add('model', 0.5)
+    timer.add('queue', 0.25)
+    assert list(timer.stages) == ['queue', 'model']
+    assert timer.server_timing(total=1.5) == 'queue;dur=500.00, model;dur=500.00, total;dur=1500.00'
+    histogram = Histogram('stage_seconds', 'Stages', ('stage',))
+    timer.observe(histogram)
+    assert 'stage_seconds_count{stage="queue"} 1' in histogram.render()
+    assert [resolution_bucket(size) for size in ((200, 100), (512, 300), (1000, 1024), (2000, 10))] == [
+        '256', '512', '1024', 'gt1024']
+
+
+def test_unknown_model_types_never_become_labels():
+    from fastapi import HTTPException
+    from app import MODEL_TYPES, check_model_type
+
+    for model_type in MODEL_TYPES:
+        check_model_type(model_type)
+    with pytest.raises(HTTPException) as excinfo:
+        check_model_type('x' * 40)
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,36 @@
+import sqlite3
+
+import pytest
+
+from migrations import (LATEST_VERSION, apply_migrations, check_query_plans, get_schema_version,
+                        seed_plan_check_database)
+
+
+@pytest.fixture(scope='module')
+def seeded():
+    conn = sqlite3.connect(':memory:')
+    apply_migrations(conn)
+    seed_plan_check_database(conn)
+    yield conn
+    conn.close()
+
+
+def test_migrations_apply_once():
+    conn = sqlite3.connect(':memory:')
+    assert apply_migrations(conn) == list(range(1, LATEST_VERSION + 1))
+    assert get_schema_version(conn) == LATEST_VERSION
+    assert apply_migrations(conn) == []
+
+
+def test_live_queries_use_their_indexes(seeded):
+    assert check_query_plans(seeded) == []
+
+
+def test_plan_check_notices_a_missing_index():
+    conn = sqlite3.connect(':memory:')
+    apply_migrations(conn)
+    seed_plan_check_database(conn, users=50, analytics_rows=1000)
+    conn.execute("DROP INDEX idx_transfer_history_user_created")
+    problems = check_query_plans(conn)
+    assert len(problems) == 2
+    assert all('idx_transfer_history_user_created' in problem for problem in problems)
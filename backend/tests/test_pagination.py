@@ -0,0 +1,70 @@
+import pytest
+
+from database import HISTORY_COLUMNS
+from pagination import build_page, decode_cursor, encode_cursor, select_columns
+
+
+def add_history(db, user_id, count):
+    # Rows inserted within the same second share created_at; id breaks the tie
+    return [db.save_transfer_history(user_id, f"s{i}", f"c{i}", f"s{i}", f"r{i}") for i in range(count)]
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor('2026-10-19 12:00:00', 42)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == ('2026-10-19 12:00:00', 42)
+
+
+@pytest.mark.parametrize('cursor', ['zzz', '', encode_cursor(1, 2)[:-2], 'WzEsMl0', 'eyJhIjoxfQ'])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_select_columns():
+    allowed = ['id', 'created_at', 'title', 'tags']
+    assert select_columns(None, allowed) == allowed
+    assert select_columns(['tags', ' title', ''], allowed) == ['id', 'created_at', 'tags', 'title']
+    with pytest.raises(ValueError, match='secret'):
+        select_columns(['title', 'secret'], allowed)
+
+
+def test_build_page_trims_the_extra_row():
+    rows = [{'id': i, 'created_at': 't'} for i in (3, 2, 1)]
+    assert build_page(rows, 3) == {'items': rows, 'next_cursor': None}
+    page = build_page(rows, 2)
+    assert page['items'] == rows[:2]
+    assert decode_cursor(page['next_cursor']) == ('t', 2)
+
+
+def test_history_pages_cover_every_row_once(db):
+    ids = add_history(db, 1, 7)
+    add_history(db, 2, 3)
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = db.get_user_history_page(1, 3, decode_cursor(cursor) if cursor else None)
+        seen += [row['id'] for row in page['items']]
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == sorted(ids, reverse=True)
+    assert pages == 3
+
+
+def test_history_projection(db):
+    add_history(db, 1, 2)
+    page = db.get_user_history_page(1, 10, columns=select_columns(['model_type'], list(HISTORY_COLUMNS)))
+    assert [set(row) for row in page['items']] == [{'id', 'created_at', 'model_type'}] * 2
+
+
+def test_bad_cursor_is_a_400():
+    from fastapi import HTTPException
+    from app import parse_listing_args
+
+    with pytest.raises(HTTPException) as excinfo:
+        parse_listing_args('not-a-cursor', None, HISTORY_COLUMNS)
+    assert excinfo.value.status_code == 400
+    with pytest.raises(HTTPException) as excinfo:
+        parse_listing_args(None, 'password', HISTORY_COLUMNS)
+    assert excinfo.value.status_code == 400
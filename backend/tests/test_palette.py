@@ -0,0 +1,67 @@
+import numpy as np
+from PIL import Image
+
+from image_processor import AdvancedImageProcessor, median_cut, palette_to_hex, refine_palette
+
+RED, GREEN, BLUE = (200, 30, 30), (20, 180, 60), (40, 50, 220)
+
+
+def stripes(widths, colors, height=64):
+    image = np.zeros((height, sum(widths), 3), dtype=np.uint8)
+    x = 0
+    for width, color in zip(widths, colors):
+        image[:, x:x + width] = color
+        x += width
+    return Image.fromarray(image)
+
+
+def test_median_cut_splits_clusters_most_pixels_first():
+    colors = np.array([[0, 0, 0], [10, 0, 0], [250, 250, 250], [240, 250, 250]], dtype=np.float64)
+    weights = np.array([1, 1, 3, 1], dtype=np.float64)
+    palette = median_cut(colors, weights, 2)
+    np.testing.assert_allclose(palette, [[247.5, 250, 250], [5, 0, 0]])
+
+
+def test_median_cut_stops_at_distinct_colors():
+    colors = np.array([[1, 2, 3], [4, 5, 6]], dtype=np.float64)
+    assert len(median_cut(colors, np.ones(2), 5)) == 2
+
+
+def test_refine_palette_moves_centers_to_their_clusters():
+    colors = np.array([[0, 0, 0], [2, 0, 0], [100, 0, 0], [102, 0, 0]], dtype=np.float64)
+    weights = np.array([1, 1, 2, 2], dtype=np.float64)
+    centers = refine_palette(colors, weights, np.array([[40.0, 0, 0], [60.0, 0, 0]]))
+    np.testing.assert_allclose(centers, [[101, 0, 0], [1, 0, 0]])
+
+
+def test_dominant_colors_are_exact_and_ordered_by_area():
+    image = stripes((32, 20, 12), (RED, GREEN, BLUE))
+    assert AdvancedImageProcessor().extract_dominant_colors(image, 3) == [RED, GREEN, BLUE]
+
+
+def test_dominant_colors_of_a_flat_image():
+    image = Image.new('RGB', (100, 80), GREEN)
+    assert AdvancedImageProcessor().extract_dominant_colors(image, 5) == [GREEN]
+
+
+def test_dominant_colors_accept_other_modes():
+    image = stripes((40, 24), (RED, BLUE)).convert('RGBA')
+    assert AdvancedImageProcessor().extract_dominant_colors(image, 2) == [RED, BLUE]
+
+
+def test_cached_dominant_colors_reuse_the_key():
+    processor = AdvancedImageProcessor()
+    first = processor.cached_dominant_colors(Image.new('RGB', (8, 8), RED), 'k', 3)
+    second = processor.cached_dominant_colors(Image.new('RGB', (8, 8), BLUE), 'k', 3)
+    assert first == second == [RED]
+
+
+def test_color_palette_swatches():
+    image = stripes((32, 20, 12), (RED, GREEN, BLUE))
+    palette = np.asarray(AdvancedImageProcessor().create_color_palette(image, (300, 50)))
+    assert palette.shape == (50, 300, 3)
+    assert [tuple(palette[25, x]) for x in (0, 99, 150, 299)] == [RED, RED, GREEN, BLUE]
+
+
+def test_palette_to_hex():
+    assert palette_to_hex([RED, (0, 0, 0)]) == ['#c81e1e', '#000000']
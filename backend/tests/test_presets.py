@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from presets import PresetCatalog
+
+
+@pytest.fixture
+def catalog(db):
+    catalog = PresetCatalog(db, check_interval=0.0, flush_interval=60.0)
+    yield catalog
+    catalog.close()
+
+
+def test_snapshot_is_rebuilt_only_after_a_change(catalog, db):
+    body, etag = catalog.snapshot()
+    assert json.loads(body)['presets']
+    assert catalog.snapshot() == (body, etag)
+    assert catalog.rebuilds == 1
+
+    # A write from another process bumps the version through the triggers
+    with db.backend.connection() as conn:
+        conn.execute("UPDATE style_presets SET description = 'changed' WHERE id = 1")
+    new_body, new_etag = catalog.snapshot()
+    assert new_etag != etag
+    assert b'changed' in new_body
+    assert catalog.rebuilds == 2
+
+
+def test_version_check_is_rate_limited(db):
+    catalog = PresetCatalog(db, check_interval=3600.0)
+    _, etag = catalog.snapshot()
+    with db.backend.connection() as conn:
+        conn.execute("UPDATE style_presets SET description = 'changed' WHERE id = 1")
+    assert catalog.snapshot()[1] == etag
+    catalog.invalidate()
+    assert catalog.snapshot()[1] != etag
+
+
+def test_usage_flush_changes_the_etag(catalog):
+    _, etag = catalog.snapshot()
+    for _ in range(3):
+        catalog.record_usage(1)
+    assert catalog.stats()['pending_usage'] == 3
+    assert catalog.flush_usage() == 3
+    body, new_etag = catalog.snapshot()
+    assert new_etag != etag
+    usage = {preset['id']: preset['usage_count'] for preset in json.loads(body)['presets']}
+    assert usage[1] == 3
+    assert catalog.flush_usage() == 0
+
+
+def test_fill_palettes_uses_the_preset_image_only(catalog, db):
+    with db.backend.connection() as conn:
+        conn.execute("UPDATE style_presets SET color_palette = NULL, style_image_path = 'p1.png' WHERE id = 1")
+        conn.execute("UPDATE style_presets SET color_palette = NULL, style_image_path = NULL WHERE id = 2")
+    paths = []
+
+    def extract(path):
+        paths.append(path)
+        return ['#112233']
+
+    _, etag = catalog.snapshot()
+    assert catalog.fill_palettes(extract) == 1
+    assert paths == ['p1.png']
+    presets = {preset['id']: preset for preset in catalog.presets()}
+    assert presets[1]['color_palette'] == ['#112233']
+    assert catalog.snapshot()[1] != etag
+    assert catalog.fill_palettes(extract) == 0
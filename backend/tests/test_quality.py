@@ -0,0 +1,53 @@
+import pytest
+
+from quality import QualityController, build_levels, create_quality_controller
+
+
+@pytest.fixture
+def controller():
+    return QualityController(build_levels([256, 512, 384], 'bf16'), latency_target=2.0, smoothing=0.5)
+
+
+def test_levels_are_ordered_best_first():
+    levels = build_levels([256, 512, 384, 512], 'bf16')
+    assert [(level.name, level.size, level.max_size, level.precision) for level in levels] == [
+        ('full', 512, 1024, 'fp32'), ('high', 384, 768, 'fp32'), ('medium', 256, 512, 'bf16')]
+    assert build_levels([512], 'bf16')[0].precision == 'fp32'
+    with pytest.raises(ValueError):
+        QualityController([], latency_target=1.0)
+
+
+def test_full_quality_before_any_samples(controller):
+    assert controller.choose(in_flight=100).name == 'full'
+    assert controller.choose(in_flight=1, degrade=True).name == 'high'
+
+
+def test_queue_depth_lowers_the_level(controller):
+    controller.record(controller.full, 1.0)
+    # Unmeasured levels scale with pixel count: high ~0.56s, medium 0.25s
+    assert controller.service_time(controller.levels[2]) == pytest.approx(0.25)
+    assert [controller.choose(in_flight=n).name for n in (1, 2, 3, 8, 20)] == [
+        'full', 'full', 'high', 'medium', 'medium']
+    assert controller.stats()['chosen'] == {'full': 2, 'high': 1, 'medium': 2}
+
+
+def test_premium_opt_out_keeps_full_quality(controller):
+    controller.record(controller.full, 10.0)
+    assert controller.choose(in_flight=10, degrade=True, opt_out=True).name == 'full'
+
+
+def test_service_times_are_smoothed(controller):
+    high = controller.levels[1]
+    controller.record(high, 1.0)
+    controller.record(high, 3.0)
+    assert controller.service_time(high) == 2.0
+    assert controller.service_time(controller.full) == pytest.approx(2.0 * (512 / 384) ** 2)
+
+
+def test_target_defaults_to_the_admission_slo(monkeypatch):
+    monkeypatch.delenv('QUALITY_LATENCY_TARGET_MS', raising=False)
+    monkeypatch.setenv('ADMISSION_LATENCY_SLO_MS', '1500')
+    monkeypatch.setenv('QUALITY_SIZES', '320,160')
+    controller = create_quality_controller()
+    assert controller.latency_target == 1.5
+    assert [level.size for level in controller.levels] == [320, 160]
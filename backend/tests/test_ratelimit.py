@@ -0,0 +1,39 @@
+import pytest
+
+from ratelimit import MemoryRateLimitStore, RateLimiter
+
+
+def test_bucket_refills_and_reports_retry_after(monkeypatch):
+    import ratelimit
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+    limiter = RateLimiter(MemoryRateLimitStore(), rate=1.0, burst=5)
+    assert limiter.check('user:1', 5).allowed
+    denied = limiter.check('user:1', 2)
+    assert not denied.allowed and denied.retry_after == pytest.approx(2.0, abs=1)
+    now[0] += 2
+    assert limiter.check('user:1', 2).allowed
+    assert limiter.check('user:2', 5).allowed
+
+
+def test_cost_above_the_burst_is_never_allowed():
+    limiter = RateLimiter(MemoryRateLimitStore(), rate=1.0, burst=5)
+    result = limiter.check('user:1', 6)
+    assert not result.allowed and result.retry_after is None
+
+
+def test_batches_are_capped_at_the_burst():
+    from fastapi import HTTPException
+    from fastapi.testclient import TestClient
+    import app as app_module
+
+    assert app_module.MAX_BATCH_FILES <= app_module.rate_limiter.burst
+    app_module.check_batch_size(app_module.MAX_BATCH_FILES)
+    with pytest.raises(HTTPException) as excinfo:
+        app_module.check_batch_size(app_module.MAX_BATCH_FILES + 1)
+    assert excinfo.value.status_code == 413
+
+    files = [('files', (f'{i}.png', b'x', 'image/png')) for i in range(app_module.MAX_BATCH_FILES + 1)]
+    files.append(('style', ('style.png', b'x', 'image/png')))
+    response = TestClient(app_module.app).post('/api/v1/style-transfer-batch', files=files)
+    assert response.status_code == 413
@@ -0,0 +1,74 @@
+import sqlite3
+
+import pytest
+
+import rollups
+from migrations import apply_migrations
+from rollups import (HLL_REGISTERS, bucket_upper_bound, histogram_percentiles, hll_add, hll_count,
+                     hll_merge, latency_bucket)
+
+
+def sketch(values):
+    registers = bytearray(HLL_REGISTERS)
+    for value in values:
+        hll_add(registers, value)
+    return registers
+
+
+def test_hll_counts_small_sets_exactly():
+    assert hll_count(bytearray(HLL_REGISTERS)) == 0
+    assert hll_count(sketch([1, 2, 3, 3, 3])) == 3
+
+
+@pytest.mark.parametrize('n', [1000, 50000])
+def test_hll_estimate_within_error(n):
+    # ~2.3% standard error; 4 sigma keeps the test deterministic in practice
+    assert abs(hll_count(sketch(range(n))) - n) <= n * 0.1
+
+
+def test_hll_merge_is_a_union():
+    merged = hll_merge([sketch(range(0, 600)), sketch(range(400, 1000))])
+    assert merged == sketch(range(1000))
+    assert hll_merge([]) == bytearray(HLL_REGISTERS)
+
+
+def test_latency_buckets_are_upper_bounds():
+    assert latency_bucket(0.001) == 0
+    for seconds in (0.02, 0.5, 3.0, 60.0):
+        bucket = latency_bucket(seconds)
+        assert bucket_upper_bound(bucket - 1) < seconds <= bucket_upper_bound(bucket) * (1 + 1e-9)
+    assert latency_bucket(10 ** 6) == rollups.LATENCY_BUCKETS - 1
+
+
+def test_histogram_percentiles():
+    buckets = {latency_bucket(1.0): 90, latency_bucket(5.0): 9, latency_bucket(20.0): 1}
+    result = histogram_percentiles(buckets)
+    assert result['p50'] == pytest.approx(1.0, rel=0.1)
+    assert result['p95'] == pytest.approx(5.0, rel=0.1)
+    assert result['p99'] == pytest.approx(5.0, rel=0.1)
+    assert histogram_percentiles({}) == {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+
+
+def test_incremental_rollups_match_backfill():
+    conn = sqlite3.connect(':memory:')
+    apply_migrations(conn)
+    cursor = conn.cursor()
+    today = rollups.utc_day()
+    events = [(user_id % 7, 'style_transfer', f"{today} 12:00:00") for user_id in range(50)]
+    events += [(3, 'login', None), (None, 'preset_view', None)]
+    cursor.executemany(
+        "INSERT INTO usage_analytics (user_id, action, created_at) VALUES (?, ?, COALESCE(?, CURRENT_TIMESTAMP))",
+        events)
+    rollups.record_events(cursor, events)
+    for i in range(20):
+        cursor.execute("INSERT INTO transfer_history (user_id, model_type, processing_time) VALUES (1, 'adain', ?)",
+                       (0.5 + i / 10,))
+        rollups.record_transfer(cursor, 'adain', 0.5 + i / 10)
+
+    incremental = rollups.read_summary(cursor)
+    rollups.backfill(cursor)
+    assert rollups.read_summary(cursor) == incremental
+    assert incremental['active_users_30d'] == 7
+    assert incremental['actions_30d'] == {'style_transfer': 50, 'login': 1, 'preset_view': 1}
+    assert incremental['total_transfers'] == 20
+    assert incremental['latency_by_model']['adain']['count'] == 20
@@ -0,0 +1,75 @@
+import threading
+from collections import deque
+
+import pytest
+
+from scheduler import BATCH, INTERACTIVE, QUEUED_JOBS, FairScheduler, _Job
+
+
+def enqueue(scheduler, tenant, priority, count=1):
+    # What submit() does, without dispatching, so _next() can be stepped by hand
+    for _ in range(count):
+        scheduler._queues[priority].setdefault(tenant, deque()).append(_Job(tenant, priority, lambda: None))
+        QUEUED_JOBS.inc(priority=priority)
+
+
+def drain(scheduler):
+    order = []
+    while any(scheduler._queues.values()):
+        job = scheduler._next()
+        order.append((job.tenant, job.priority))
+    return order
+
+
+def test_tenants_take_turns_within_a_priority():
+    scheduler = FairScheduler()
+    enqueue(scheduler, 'a', INTERACTIVE, 3)
+    enqueue(scheduler, 'b', INTERACTIVE, 1)
+    enqueue(scheduler, 'c', INTERACTIVE, 2)
+    assert [tenant for tenant, _ in drain(scheduler)] == ['a', 'b', 'c', 'a', 'c', 'a']
+
+
+def test_one_dispatch_in_batch_share_goes_to_batch():
+    scheduler = FairScheduler(batch_share=4)
+    enqueue(scheduler, 'a', INTERACTIVE, 6)
+    enqueue(scheduler, 'b', BATCH, 3)
+    priorities = [priority for _, priority in drain(scheduler)]
+    assert priorities == [INTERACTIVE] * 3 + [BATCH] + [INTERACTIVE] * 3 + [BATCH] * 2
+
+
+def test_batch_runs_when_no_interactive_work_waits():
+    scheduler = FairScheduler(batch_share=4)
+    enqueue(scheduler, 'a', BATCH, 2)
+    enqueue(scheduler, 'b', BATCH, 2)
+    assert drain(scheduler) == [('a', BATCH), ('b', BATCH), ('a', BATCH), ('b', BATCH)]
+
+
+def test_large_batch_is_interleaved_with_other_tenants():
+    scheduler = FairScheduler(batch_share=1)
+    enqueue(scheduler, 'big', BATCH, 5)
+    enqueue(scheduler, 'small', BATCH, 1)
+    assert [tenant for tenant, _ in drain(scheduler)][:3] == ['big', 'small', 'big']
+
+
+def test_submitted_jobs_run_in_fair_order():
+    scheduler = FairScheduler(workers=1, batch_share=2)
+    release = threading.Event()
+    order = []
+    blocker = scheduler.submit('a', INTERACTIVE, release.wait)
+    futures = [scheduler.submit(tenant, priority, lambda t=tenant, p=priority: order.append((t, p)))
+               for tenant, priority in [('a', INTERACTIVE), ('a', INTERACTIVE), ('b', BATCH),
+                                        ('c', INTERACTIVE)]]
+    release.set()
+    blocker.result(timeout=5)
+    for future in futures:
+        future.result(timeout=5)
+    # The blocker was the first interactive dispatch, so the batch job goes next
+    assert order == [('b', BATCH), ('a', INTERACTIVE), ('c', INTERACTIVE), ('a', INTERACTIVE)]
+    stats = scheduler.stats()
+    assert stats['completed'] == {INTERACTIVE: 4, BATCH: 1}
+    assert {entry['tenant'] for entry in stats['top_tenants']} == {'a', 'b', 'c'}
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        FairScheduler().submit('a', 'urgent', lambda: None)
@@ -0,0 +1,77 @@
+import os
+import pickle
+import signal
+import time
+
+import pytest
+
+torch = pytest.importorskip('torch')
+
+from serving import memory_report, pin_parent_threads, share_model
+
+
+class SharedStubModel(torch.nn.Module):
+    """A convolution with weights, so the forward pass runs parallel kernels"""
+
+    def __init__(self):
+        super().__init__()
+        self.conv = torch.nn.Conv2d(3, 8, 3, padding=1)
+
+    def forward(self, content, style, timer=None):
+        return self.conv(content).mean(dim=1, keepdim=True) + style.mean()
+
+
+@pytest.fixture
+def parent_threads():
+    threads = torch.get_num_threads()
+    yield
+    torch.set_num_threads(threads)
+
+
+def wait_for(pid, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            return status
+        time.sleep(0.05)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    pytest.fail("forked worker hung in its forward pass")
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="pre-fork serving needs fork()")
+def test_forked_worker_runs_the_shared_model(parent_threads):
+    from runtime import configure_runtime
+
+    pin_parent_threads()
+    torch.manual_seed(0)
+    model = share_model(SharedStubModel())
+    assert torch.get_num_threads() == 1
+    assert memory_report({'stub': model})['weights_shared']
+    content, style = torch.rand(1, 3, 64, 64), torch.rand(1, 3, 64, 64)
+    expected = model(content, style)
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            os.close(read_fd)
+            configure_runtime(workers=1, threads=2, affinity='', slot=0)
+            with torch.no_grad():
+                output = model(content, style)
+            with os.fdopen(write_fd, 'wb') as f:
+                pickle.dump((torch.get_num_threads(), output), f)
+            code = 0
+        finally:
+            os._exit(code)
+
+    os.close(write_fd)
+    # The result fits in the pipe buffer, so the child exits without waiting for this read
+    assert wait_for(pid, timeout=60) == 0
+    with os.fdopen(read_fd, 'rb') as f:
+        data = f.read()
+    threads, output = pickle.loads(data)
+    assert threads == 2
+    assert torch.allclose(output, expected)
@@ -0,0 +1,89 @@
+import queue
+import sqlite3
+import threading
+
+import pytest
+
+from migrations import apply_migrations, import_legacy_users
+from storage import SQLiteBackend, create_backend
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'nested' / 'app.db'), pool_size=2, timeout=0.2)
+    yield backend
+    backend.close()
+
+
+def test_connections_are_reused(backend):
+    with backend.connection() as first:
+        pass
+    with backend.connection() as second:
+        assert second is first
+    assert backend.stats()['connections'] == 1
+    assert first.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+def test_pool_is_capped(backend):
+    a, b = backend.acquire(), backend.acquire()
+    assert a is not b
+    with pytest.raises(queue.Empty):
+        backend.acquire()
+
+    # A released connection goes to whoever is waiting
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(backend.acquire()))
+    waiter.start()
+    backend.release(a)
+    waiter.join(1)
+    assert got == [a]
+    backend.release(a)
+    backend.release(b)
+    assert backend.stats()['connections'] == 2
+
+
+def test_connection_commits_or_rolls_back(backend):
+    with backend.connection() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pytest.raises(RuntimeError):
+        with backend.connection() as conn:
+            conn.execute("INSERT INTO t VALUES (2)")
+            raise RuntimeError("handler failed")
+    with backend.connection() as conn:
+        assert conn.execute("SELECT x FROM t").fetchall() == [(1,)]
+
+
+def test_close_empties_the_pool(backend):
+    with backend.connection():
+        pass
+    backend.close()
+    assert backend.stats()['connections'] == 0
+
+
+def test_create_backend_urls(tmp_path):
+    backend = create_backend(f"sqlite:///{tmp_path}/x.db")
+    assert isinstance(backend, SQLiteBackend) and backend.path == f"{tmp_path}/x.db"
+    with pytest.raises(ValueError):
+        create_backend("postgres://localhost/app")
+
+
+def test_legacy_users_are_imported_once(tmp_path):
+    legacy = sqlite3.connect(tmp_path / 'users.db')
+    legacy.execute("""CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT, username TEXT, full_name TEXT,
+                      hashed_password TEXT, is_active BOOLEAN, created_at TIMESTAMP, last_login TIMESTAMP)""")
+    legacy.executemany("INSERT INTO users VALUES (NULL, ?, ?, ?, 'h', 1, '2024-01-01 00:00:00', NULL)",
+                       [('a@example.com', 'a', 'A'), ('b@example.com', 'b', 'B')])
+    legacy.commit()
+    legacy.close()
+
+    conn = sqlite3.connect(tmp_path / 'app.db')
+    apply_migrations(conn, target=3)
+    conn.execute("INSERT INTO users (email, username, hashed_password) VALUES ('b@example.com', 'b', 'new')")
+    conn.commit()
+    apply_migrations(conn)
+    rows = conn.execute("SELECT username, hashed_password FROM users ORDER BY username").fetchall()
+    assert rows == [('a', 'h'), ('b', 'new')]
+
+    import_legacy_users(conn.cursor(), str(tmp_path / 'users.db'))
+    assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
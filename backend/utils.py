@@ -1,14 +1,15 @@
-import torch
-from torchvision import transforms
 from PIL import Image, ImageFilter, ImageEnhance
 import numpy as np
-try:
-    import cv2
-except ImportError:
-    cv2 = None  # Graceful fallback if OpenCV is not available
 
-def load_image(image, size=512):
+# torch/torchvision are imported inside the tensor helpers so that importing
+# this module (and the API) stays fast; see startup.py
+
+# Shorter side of the tensors fed to the model
+MODEL_INPUT_SIZE = 512
+
+def load_image(image, size=MODEL_INPUT_SIZE):
     """Load and preprocess image for neural style transfer"""
+    from torchvision import transforms
     # Ensure image is in RGB mode
     if image.mode != 'RGB':
         image = image.convert('RGB')
@@ -22,6 +23,8 @@ def load_image(image, size=512):
 
 def tensor_to_image(tensor):
     """Convert tensor back to PIL Image"""
+    import torch
+    from torchvision import transforms
     image = tensor.cpu().clone()
     image = image.squeeze(0)
     image = transforms.Normalize(mean=[-0.485/0.229, -0.456/0.224, -0.406/0.225], std=[1/0.229, 1/0.224, 1/0.225])(image)
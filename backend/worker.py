@@ -0,0 +1,76 @@
+"""
+Job worker process
+
+Consumes style transfer jobs queued by the API (``/api/v1/jobs/...``) from
+the queue at ``JOB_QUEUE_URL``. Inputs and results travel through the blob
+store, so workers can run on any node that shares the queue, the blob
+store and the database with the API. Run API nodes with ``JOB_WORKERS=0``
+to leave all queued jobs to dedicated workers.
+
+Usage:
+    python worker.py --threads 1 --visibility-timeout 120
+
+SIGTERM lets running jobs finish; a worker that dies mid-job loses its
+lease and the job is retried elsewhere once the visibility timeout passes.
+"""
+
+import argparse
+import os
+import signal
+import sys
+from typing import List
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run queued style transfer jobs")
+    parser.add_argument('--threads', type=int, default=int(os.getenv("WORKER_THREADS", "1")),
+                        help="Jobs run concurrently by this process")
+    parser.add_argument('--visibility-timeout', type=float,
+                        default=float(os.getenv("JOB_VISIBILITY_TIMEOUT", "120")),
+                        help="Seconds a claimed job stays leased without a heartbeat")
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--once', action='store_true', help="Exit once the queue is empty")
+    return parser
+
+
+def main(argv: List[str] = None) -> int:
+    args = build_parser().parse_args(argv)
+    import app as api
+    from auth import init_db
+    from jobqueue import JobWorker
+
+    api.db.init_database()
+    init_db()
+    api.job_queue.init()
+    api.configure_worker_runtime()
+    for model_type in api.PRELOAD_MODELS:
+        api.warm_model(model_type)
+
+    worker = JobWorker(api.job_queue, api.JOB_HANDLERS, visibility_timeout=args.visibility_timeout,
+                       poll_interval=args.poll_interval, retention=api.JOB_RETENTION,
+                       cleanup=api.delete_job_inputs)
+
+    def stop(signum, frame):
+        worker.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Worker {worker.worker_id} consuming {', '.join(api.JOB_HANDLERS)} jobs")
+    try:
+        if args.once or args.threads <= 1:
+            worker.run(once=args.once)
+        else:
+            worker.start(args.threads)
+            signal.pause()
+            worker.stop()
+    finally:
+        api.preset_catalog.close()
+        api.analytics.close()
+        api.job_queue.close()
+        print(f"Worker stopped: {worker.stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,8 +13,8 @@ interface StylePreset {
 
 interface HistoryItem {
   id: number;
-  content_image_path: string;
-  style_image_path: string;
+  content_image_path: string | null;
+  style_image_path: string | null;
   result_image_path: string;
   model_type: string;
   style_strength: number;
@@ -65,10 +65,8 @@ export default function EnhancedControls({
     try {
       const token = localStorage.getItem('token');
       const response = await fetch('/api/v1/history?limit=10', {
-        method: 'POST',
         headers: {
           'Authorization': `Bearer ${token}`,
-          'Content-Type': 'application/json',
         },
       });
       if (response.ok) {